@@ -0,0 +1,2 @@
+"""Benchmarks for the graph engine. Run a benchmark module from the
+repository root, e.g. `python -m bench.drag`."""
@@ -0,0 +1,45 @@
+"""Runs the benchmark suite: python -m bench [--size small] [--baseline FILE]"""
+import argparse
+import sys
+from bench import suite
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark the model and lang engines.")
+    parser.add_argument("--size", choices=sorted(suite.SIZES), default="small", help="preset number of objects")
+    parser.add_argument("-n", type=int, help="number of objects, overriding --size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", action="append", choices=sorted(suite.BENCHMARKS), help="run only the given benchmark")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    n = args.n if args.n else suite.SIZES[args.size]
+    results = suite.run(n, seed=args.seed, repeat=args.repeat, names=args.only)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = suite.read(fp)
+
+    for name, result in results["results"].items():
+        line = "{0:20} {1:10.2f} ms".format(name, result["best"] * 1e3)
+        if baseline and name in baseline["results"]:
+            old = baseline["results"][name]["best"]
+            line += "  ({0:+.0%} vs baseline)".format(result["best"] / old - 1 if old else 0)
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            suite.write(results, fp)
+
+    if baseline:
+        regressions = suite.compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print("REGRESSION: {0} took {1:.2f} ms, baseline {2:.2f} ms".format(name, new * 1e3, old * 1e3), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Measures the cost of the event path taken while dragging a node.
+
+QNode.mouseMoveEvent emits "graphical_object_changed" once per mouse
+move, and every incident QEdge listens for it. This benchmark emits the same
+event to a hub with many listeners, with the listeners doing no work, so the
+time measured is the emitter's own overhead. It is compared against the
+previous behaviour, which formatted a debug string for every listener call
+even when debug logging was disabled."""
+import argparse
+import timeit
+import event
+import log
+
+class Node(event.Emitter):
+    def __repr__(self):
+        return "Node({0})".format(id(self))
+
+class Edge(object):
+    def __repr__(self):
+        return "Edge({0})".format(id(self))
+
+    def on_node_update(self, node):
+        pass
+
+def eager_emit(emitter, event_name, *args):
+    "The emit loop as it was before log formatting became lazy."
+    for fn in emitter._listeners.get(event_name, set()):
+        log.debug("{0} {1} {2} {3}".format(emitter, event_name, fn, args))
+        fn(*args)
+
+def make_hub(degree):
+    hub = Node()
+    edges = [Edge() for i in range(degree)]
+    for edge in edges:
+        hub.add_listener("graphical_object_changed", edge.on_node_update)
+    return hub, edges
+
+def run(degree, moves):
+    log.set_log_level(log.Level.INFO)
+    hub, edges = make_hub(degree)
+    lazy = timeit.timeit(lambda: hub.emit("graphical_object_changed", hub), number=moves)
+    eager = timeit.timeit(lambda: eager_emit(hub, "graphical_object_changed", hub), number=moves)
+    return {
+        "degree": degree,
+        "moves": moves,
+        "emit_us_per_move": 1e6 * lazy / moves,
+        "eager_emit_us_per_move": 1e6 * eager / moves,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--degree", type=int, default=500, help="number of edges on the dragged node")
+    parser.add_argument("--moves", type=int, default=1000, help="number of mouse move events")
+    args = parser.parse_args(argv)
+    result = run(args.degree, args.moves)
+    print("{0} edges, {1} moves".format(result["degree"], result["moves"]))
+    print("  emit:       {0:10.1f} us/move".format(result["emit_us_per_move"]))
+    print("  eager emit: {0:10.1f} us/move".format(result["eager_emit_us_per_move"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Seeded generators of synthetic documents.
+
+Each generator builds its graph in the current model (which should be empty)
+and returns a Graph describing the IDs it created. The same seed always
+produces the same structure."""
+import random
+import model
+
+class Graph(object):
+    def __init__(self, class_ids, object_ids, relation_ids, edge_ids):
+        self.class_ids = class_ids
+        self.object_ids = object_ids
+        self.relation_ids = relation_ids
+        self.edge_ids = edge_ids
+
+def _make_objects(class_id, n):
+    return [model.object_new(class_id) for i in range(n)]
+
+def _connect(relation_id, pairs):
+    return [model.edge_new(relation_id, src_id, dst_id) for src_id, dst_id in pairs]
+
+def random_dag(n, edges_per_object=2, seed=0):
+    "Builds n objects connected by an acyclic relation with about n * edges_per_object edges."
+    rng = random.Random(seed)
+    class_id = model.class_new("Node")
+    relation_id = model.relation_new("precedes")
+    object_ids = _make_objects(class_id, n)
+    pairs = set()
+    for i in range(1, n):
+        for j in range(min(i, edges_per_object)):
+            # Edges only point from earlier to later objects, so no cycles
+            pairs.add((object_ids[rng.randrange(i)], object_ids[i]))
+    edge_ids = _connect(relation_id, sorted(pairs))
+    return Graph([class_id], object_ids, [relation_id], edge_ids)
+
+def tree(n, branching=3, seed=0):
+    'Builds n objects arranged in a random tree by an "is a child of" relation.'
+    rng = random.Random(seed)
+    class_id = model.class_new("Node")
+    relation_id = model.relation_new("is a child of")
+    model.relation_set_max_outnodes(relation_id, 1)
+    object_ids = _make_objects(class_id, n)
+    children = {object_ids[0]: 0}
+    pairs = []
+    for object_id in object_ids[1:]:
+        candidates = [parent_id for parent_id, count in children.items() if count < branching]
+        parent_id = candidates[rng.randrange(min(len(candidates), branching * 4))]
+        children[parent_id] += 1
+        children[object_id] = 0
+        if children[parent_id] == branching:
+            del children[parent_id]
+        pairs.append((object_id, parent_id))
+    edge_ids = _connect(relation_id, pairs)
+    return Graph([class_id], object_ids, [relation_id], edge_ids)
+
+def dense_undirected(n, p=0.2, seed=0):
+    "Builds n objects where each pair is connected by an undirected edge with probability p."
+    rng = random.Random(seed)
+    class_id = model.class_new("Node")
+    relation_id = model.relation_new("knows")
+    model.relation_set_directed(relation_id, False)
+    model.relation_set_acyclic(relation_id, False)
+    object_ids = _make_objects(class_id, n)
+    pairs = [
+        (object_ids[i], object_ids[j])
+        for i in range(n) for j in range(i + 1, n)
+        if rng.random() < p
+    ]
+    edge_ids = _connect(relation_id, pairs)
+    return Graph([class_id], object_ids, [relation_id], edge_ids)
+
+def wide_class(n, fields=50, seed=0):
+    "Builds a class with many fields of random types and n instances of it."
+    rng = random.Random(seed)
+    types = [model.Integer, model.Float, model.Bool, model.String]
+    class_id = model.class_new("Record")
+    for i in range(fields):
+        model.class_add_field(class_id, "field {0}".format(i), rng.choice(types))
+    object_ids = _make_objects(class_id, n)
+    return Graph([class_id], object_ids, [], [])
+
+def relations(n, relation_count=20, edges_per_relation=None, seed=0):
+    "Builds n objects and many relations, each holding a few random edges."
+    rng = random.Random(seed)
+    edges_per_relation = edges_per_relation if edges_per_relation else n // relation_count + 1
+    class_id = model.class_new("Node")
+    object_ids = _make_objects(class_id, n)
+    relation_ids = []
+    edge_ids = []
+    for r in range(relation_count):
+        relation_id = model.relation_new("relation {0}".format(r))
+        model.relation_set_acyclic(relation_id, False)
+        relation_ids.append(relation_id)
+        pairs = set()
+        while len(pairs) < edges_per_relation:
+            src_id, dst_id = rng.sample(object_ids, 2)
+            pairs.add((src_id, dst_id))
+        edge_ids.extend(_connect(relation_id, sorted(pairs)))
+    return Graph([class_id], object_ids, relation_ids, edge_ids)
@@ -0,0 +1,44 @@
+"""Measures the iterations per second of the force-directed layout.
+
+The graph is a random DAG of n objects with about two edges each, with
+every object starting at the origin as on a freshly loaded canvas. Only the
+steps are timed, not building the graph or the layout."""
+import argparse
+import time
+import layout
+import model
+from bench import graphs
+
+def make_layout(n, seed):
+    model.reset()
+    graph = graphs.random_dag(n, seed=seed)
+    edges = [(model.edge_get_source_object(edge_id), model.edge_get_destination_object(edge_id))
+             for edge_id in graph.edge_ids]
+    return layout.ForceLayout({object_id: (0.0, 0.0) for object_id in graph.object_ids}, edges, seed=seed)
+
+def run(n, iterations, seed=0):
+    force_layout = make_layout(n, seed)
+    start = time.perf_counter()
+    for i in range(iterations):
+        force_layout.step()
+    elapsed = time.perf_counter() - start
+    model.reset()
+    return {
+        "objects": n,
+        "edges": len(force_layout.edges),
+        "iterations": iterations,
+        "iterations_per_second": iterations / elapsed,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=10000, help="number of objects")
+    parser.add_argument("--iterations", type=int, default=10, help="number of layout steps")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    result = run(args.n, args.iterations, args.seed)
+    print("{0} objects, {1} edges, {2} iterations".format(result["objects"], result["edges"], result["iterations"]))
+    print("  {0:.2f} iterations/s".format(result["iterations_per_second"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Times the core model and lang operations on synthetic documents.
+
+Each benchmark builds its input in an empty model, times one operation on
+it and resets the model. Results map benchmark names to the best and median
+of several repeats, and can be compared against a stored baseline."""
+import io
+import json
+import platform
+import statistics
+import time
+import model
+from bench import drag
+from bench import graphs
+from bench import layout
+
+SIZES = {
+    "small": 200,
+    "medium": 2000,
+    "large": 20000,
+}
+
+class Timer(object):
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+
+def bench_object_new(n, seed):
+    class_id = model.class_new("Node")
+    with Timer() as timer:
+        for i in range(n):
+            model.object_new(class_id)
+    return timer.elapsed
+
+def bench_edge_new(n, seed):
+    with Timer() as timer:
+        graphs.random_dag(n, seed=seed)
+    return timer.elapsed
+
+def bench_has_path(n, seed):
+    graph = graphs.random_dag(n, seed=seed)
+    relation_id = graph.relation_ids[0]
+    first, last = graph.object_ids[0], graph.object_ids[-1]
+    with Timer() as timer:
+        for i in range(10):
+            model.has_path(first, last, relation_id)
+            model.has_path(last, first, relation_id)
+    return timer.elapsed
+
+def bench_object_delete(n, seed):
+    graph = graphs.relations(n, seed=seed)
+    with Timer() as timer:
+        for object_id in graph.object_ids:
+            model.object_delete(object_id)
+    return timer.elapsed
+
+def bench_undo_object_delete(n, seed):
+    graph = graphs.relations(n, seed=seed)
+    with model.undo_group():
+        for object_id in graph.object_ids:
+            model.object_delete(object_id)
+    with Timer() as timer:
+        model.undo()
+    return timer.elapsed
+
+def bench_class_delete(n, seed):
+    graph = graphs.random_dag(n, seed=seed)
+    with Timer() as timer:
+        model.class_delete(graph.class_ids[0])
+    return timer.elapsed
+
+def bench_field_set_type(n, seed):
+    graph = graphs.wide_class(n, fields=10, seed=seed)
+    field_ids = model.class_get_fields(graph.class_ids[0])
+    with Timer() as timer:
+        for field_id in field_ids:
+            model.field_set_type(field_id, model.String)
+    return timer.elapsed
+
+def bench_class_visibility(n, seed):
+    graph = graphs.random_dag(n, seed=seed)
+    class_id = graph.class_ids[0]
+    with Timer() as timer:
+        model.class_set_visible(class_id, False)
+        model.class_set_visible(class_id, True)
+    return timer.elapsed
+
+def bench_relation_visibility(n, seed):
+    graph = graphs.dense_undirected(max(2, int(n ** 0.5) * 4), seed=seed)
+    relation_id = graph.relation_ids[0]
+    with Timer() as timer:
+        model.relation_set_visible(relation_id, False)
+        model.relation_set_visible(relation_id, True)
+    return timer.elapsed
+
+def bench_write(n, seed):
+    graphs.random_dag(n, seed=seed)
+    with Timer() as timer:
+        model.write(io.StringIO())
+    return timer.elapsed
+
+def bench_read(n, seed):
+    graphs.random_dag(n, seed=seed)
+    fp = io.StringIO()
+    model.write(fp)
+    model.reset()
+    fp.seek(0)
+    with Timer() as timer:
+        model.read(fp)
+    return timer.elapsed
+
+FILTER_CODE = """
+(let ((relation-id
+        (find-first (lambda (relation-id)
+          (= (relation-name relation-id) "precedes")) (all-relations))))
+  (lambda (object-id)
+    (zero? (length (innodes object-id relation-id)))))
+"""
+
+def bench_filter(n, seed):
+    graph = graphs.random_dag(n, seed=seed)
+    filter_id = model.object_filter_new("Roots", FILTER_CODE)
+    predicate = model.object_filter_get_predicate(filter_id)
+    with Timer() as timer:
+        for object_id in graph.object_ids:
+            predicate(object_id)
+    return timer.elapsed
+
+def bench_drag_emit(n, seed):
+    hub, edges = drag.make_hub(min(n, 500))
+    with Timer() as timer:
+        for i in range(100):
+            hub.emit("graphical_object_changed", hub)
+    return timer.elapsed
+
+def bench_force_layout(n, seed):
+    force_layout = layout.make_layout(n, seed)
+    with Timer() as timer:
+        for i in range(5):
+            force_layout.step()
+    return timer.elapsed
+
+BENCHMARKS = {
+    "object_new": bench_object_new,
+    "edge_new": bench_edge_new,
+    "has_path": bench_has_path,
+    "object_delete": bench_object_delete,
+    "undo_object_delete": bench_undo_object_delete,
+    "class_delete": bench_class_delete,
+    "field_set_type": bench_field_set_type,
+    "class_visibility": bench_class_visibility,
+    "relation_visibility": bench_relation_visibility,
+    "write": bench_write,
+    "read": bench_read,
+    "filter": bench_filter,
+    "drag_emit": bench_drag_emit,
+    "force_layout": bench_force_layout,
+}
+
+def run(n, seed=0, repeat=3, names=None):
+    "Runs the named benchmarks (all by default) and returns their results."
+    results = {}
+    for name in (names if names else BENCHMARKS):
+        fn = BENCHMARKS[name]
+        times = []
+        for i in range(repeat):
+            model.reset()
+            try:
+                times.append(fn(n, seed))
+            finally:
+                model.reset()
+        results[name] = {
+            "best": min(times),
+            "median": statistics.median(times),
+            "repeat": repeat,
+        }
+    return {
+        "meta": {
+            "n": n,
+            "seed": seed,
+            "python": platform.python_version(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+def compare(current, baseline, threshold=0.2):
+    """Returns a list of (name, baseline seconds, current seconds) for each
+    benchmark whose best time is more than `threshold` slower than baseline."""
+    regressions = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old = baseline["results"][name]["best"]
+        new = result["best"]
+        if new > old * (1 + threshold):
+            regressions.append((name, old, new))
+    return regressions
+
+def write(results, fp):
+    json.dump(results, fp, indent=2, sort_keys=True)
+
+def read(fp):
+    return json.load(fp)
@@ -0,0 +1,108 @@
+"""Batch processing of graph documents without the GUI.
+
+Loads a document, applies scripts, filters and reports in the order they
+appear on the command line, then exports and saves the result. This module
+must not import PyQt5, so it runs on servers without a display."""
+import argparse
+import os
+import sys
+import export
+import lang
+import log
+import model
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+
+def run_script(fp):
+    "Evaluates each expression in a lang script and returns the last value."
+    value = None
+    for expr in lang.read_all(fp):
+        value = lang.eval(expr)
+    return value
+
+def run_filter(code, out):
+    "Prints the ID, class and name of each object matching a filter predicate."
+    predicate = lang.eval(lang.read(code))
+    for object_id in sorted(model.get_objects()):
+        if predicate(object_id):
+            class_name = model.class_get_name(model.object_get_class(object_id))
+            out.write("{0}\t{1}\t{2}\n".format(object_id, class_name, model.object_get_name(object_id)))
+
+def print_summary(out):
+    out.write("classes\t{0}\n".format(len(model.get_classes())))
+    out.write("objects\t{0}\n".format(len(model.get_objects())))
+    out.write("edges\t{0}\n".format(len(model.get_edges())))
+    for relation_id in model.get_relations():
+        out.write("relation\t{0}\t{1}\n".format(
+            model.relation_get_name(relation_id), model.relation_count_edges(relation_id)))
+
+def export_file(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in export.formats:
+        raise ValueError("Can't export to {0}: expected one of {1}".format(
+            repr(filename), ", ".join(sorted(export.formats))))
+    with open(filename, "w") as fp:
+        export.formats[extension](fp)
+
+def _action(name):
+    return lambda value: (name, value)
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description=__doc__.splitlines()[0])
+    parser.add_argument("file", nargs="?", help="document to load")
+    parser.add_argument("-s", "--script", dest="actions", action="append", type=_action("script"),
+                        metavar="FILE", help="evaluate the expressions in a lang script")
+    parser.add_argument("-e", "--eval", dest="actions", action="append", type=_action("eval"),
+                        metavar="CODE", help="evaluate a lang expression and print its value")
+    parser.add_argument("-f", "--filter", dest="actions", action="append", type=_action("filter"),
+                        metavar="CODE", help="print the objects matching a predicate")
+    parser.add_argument("--summary", dest="actions", action="append_const", const=("summary", None),
+                        help="print entity counts")
+    parser.add_argument("-x", "--export", action="append", default=[], metavar="FILE",
+                        help="export the document; the format follows the extension (.json, .dot)")
+    parser.add_argument("-o", "--output", metavar="FILE", help="save the document")
+    parser.add_argument("--compact", action="store_true", help="renumber IDs consecutively when saving")
+    parser.add_argument("--log-file", metavar="FILE", help="also write log messages to a file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log debug messages")
+    return parser
+
+def main(argv, out=sys.stdout):
+    args = make_parser().parse_args(argv[1:])
+    if args.verbose:
+        log.set_log_level(log.Level.DEBUG)
+    file_logger = None
+    if args.log_file:
+        file_logger = log.FileLogger(args.log_file)
+        log.set_logger(log.MultiLogger(log.TerminalLogger(sys.stderr), file_logger))
+    try:
+        if args.file:
+            with open(args.file) as fp:
+                model.read(fp)
+        for action, value in args.actions or []:
+            if action == "script":
+                with open(value) as fp:
+                    run_script(fp)
+            elif action == "eval":
+                result = run_script(value)
+                if result is not None:
+                    out.write("{0}\n".format(result))
+            elif action == "filter":
+                run_filter(value, out)
+            elif action == "summary":
+                print_summary(out)
+        for filename in args.export:
+            export_file(filename)
+        if args.output:
+            with open(args.output, "w") as fp:
+                model.write(fp, compact=args.compact)
+    except Exception as e:
+        log.error("%s", e)
+        return EXIT_FAILURE
+    finally:
+        if file_logger:
+            file_logger.close()
+    return EXIT_SUCCESS
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
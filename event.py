@@ -6,9 +6,16 @@ class Emitter(object):
         self._listeners = {}
     
     def emit(self, event_name, *args):
-        for fn in self._listeners.get(event_name, set()):
-            log.debug("{0} {1} {2} {3}".format(self, event_name, fn, args))
-            fn(*args)
+        listeners = self._listeners.get(event_name)
+        if not listeners:
+            return
+        if log.enabled(log.Level.DEBUG):
+            for fn in listeners:
+                log.debug("%s %s %s %s", self, event_name, fn, args)
+                fn(*args)
+        else:
+            for fn in listeners:
+                fn(*args)
 
     def add_listener(self, event_name, fn):
         if event_name not in self._listeners:
@@ -20,4 +27,4 @@ class Emitter(object):
         listeners = self._listeners.get(event_name, set())
         listeners.remove(fn)
         if not listeners:
-            del self._listeners[event_name]
\ No newline at end of file
+            del self._listeners[event_name]
@@ -0,0 +1,80 @@
+import json
+import model
+
+def _member_values(object_id):
+    values = {}
+    for member_id in model.object_get_members(object_id):
+        field_id = model.member_get_field(member_id)
+        values[model.field_get_name(field_id)] = model.member_get_value(member_id)
+    return values
+
+def to_dict():
+    "Returns the document as plain data, referring to entities by ID."
+    return {
+        "classes": [
+            {
+                "id": class_id,
+                "name": model.class_get_name(class_id),
+                "fields": [model.field_get_name(field_id) for field_id in model.class_get_fields(class_id)],
+            }
+            for class_id in model.get_classes()
+        ],
+        "objects": [
+            {
+                "id": object_id,
+                "name": model.object_get_name(object_id),
+                "class": model.object_get_class(object_id),
+                "visible": model.object_is_visible(object_id),
+                "members": _member_values(object_id),
+            }
+            for object_id in sorted(model.get_objects())
+        ],
+        "relations": [
+            {
+                "id": relation_id,
+                "name": model.relation_get_name(relation_id),
+                "directed": model.relation_is_directed(relation_id),
+                "acyclic": model.relation_is_acyclic(relation_id),
+            }
+            for relation_id in model.get_relations()
+        ],
+        "edges": [
+            {
+                "id": edge_id,
+                "relation": model.edge_get_relation(edge_id),
+                "source": model.edge_get_source_object(edge_id),
+                "destination": model.edge_get_destination_object(edge_id),
+            }
+            for edge_id in sorted(model.get_edges())
+        ],
+    }
+
+def write_json(fp):
+    json.dump(to_dict(), fp, indent=2)
+
+def _quote(text):
+    return '"{0}"'.format(str(text).replace("\\", "\\\\").replace('"', '\\"'))
+
+def write_dot(fp):
+    "Writes the document as a Graphviz digraph, labelling edges by relation."
+    fp.write("digraph {\n")
+    for object_id in sorted(model.get_objects()):
+        color = model.object_get_color(object_id)
+        fp.write('    {0} [label={1}, style=filled, fillcolor="#{2:02x}{3:02x}{4:02x}"];\n'.format(
+            object_id, _quote(model.object_get_name(object_id)), color.r, color.g, color.b))
+    for edge_id in sorted(model.get_edges()):
+        relation_id = model.edge_get_relation(edge_id)
+        color = model.relation_get_color(relation_id)
+        attributes = 'label={0}, color="#{1:02x}{2:02x}{3:02x}"'.format(
+            _quote(model.relation_get_name(relation_id)), color.r, color.g, color.b)
+        if not model.relation_is_directed(relation_id):
+            attributes += ", dir=none"
+        fp.write("    {0} -> {1} [{2}];\n".format(
+            model.edge_get_source_object(edge_id), model.edge_get_destination_object(edge_id), attributes))
+    fp.write("}\n")
+
+formats = {
+    ".json": write_json,
+    ".dot": write_dot,
+    ".gv": write_dot,
+}
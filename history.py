@@ -0,0 +1,103 @@
+import collections
+import contextlib
+
+class History(object):
+    """A bounded log of undoable changes.
+
+    Changes record their inverse as a function and its arguments. The
+    inverses recorded between the outermost begin() and end() form a group,
+    which undo() applies in reverse order. Applying an inverse records the
+    inverse of the inverse, so undoing a group fills a group for redo() and
+    vice versa. Only the last `limit` groups are kept."""
+    def __init__(self, limit=100):
+        self._undo_groups = collections.deque(maxlen=limit)
+        self._redo_groups = collections.deque(maxlen=limit)
+        self._group = []
+        self._name = None
+        self._depth = 0
+        self._replaying = None
+        self._paused = 0
+
+    def set_limit(self, limit):
+        self._undo_groups = collections.deque(self._undo_groups, maxlen=limit)
+        self._redo_groups = collections.deque(self._redo_groups, maxlen=limit)
+
+    def begin(self, name=None):
+        if not self._depth:
+            self._name = name
+        self._depth += 1
+
+    def end(self):
+        self._depth -= 1
+        if self._depth:
+            return
+        group, self._group = self._group, []
+        if not group:
+            return
+        if self._replaying is self._undo_groups:
+            self._redo_groups.append((self._name, group))
+        else:
+            self._undo_groups.append((self._name, group))
+            if self._replaying is None:
+                self._redo_groups.clear()
+
+    @contextlib.contextmanager
+    def group(self, name=None):
+        "Groups the changes made in a with block into one undo step."
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def record(self, fn, args):
+        if not self._paused:
+            self._group.append((fn, args))
+
+    @contextlib.contextmanager
+    def paused(self):
+        "Records nothing in a with block."
+        self._paused += 1
+        try:
+            yield
+        finally:
+            self._paused -= 1
+
+    def clear(self):
+        self._undo_groups.clear()
+        self._redo_groups.clear()
+
+    def can_undo(self):
+        return bool(self._undo_groups)
+
+    def can_redo(self):
+        return bool(self._redo_groups)
+
+    def undo_name(self):
+        "Returns the name of the group undo() would apply, or None."
+        return self._undo_groups[-1][0] if self._undo_groups else None
+
+    def redo_name(self):
+        return self._redo_groups[-1][0] if self._redo_groups else None
+
+    def undo(self):
+        "Applies the inverses of the last group; returns False if there is none."
+        return self._replay(self._undo_groups)
+
+    def redo(self):
+        return self._replay(self._redo_groups)
+
+    def _replay(self, groups):
+        assert not self._depth, "Can't undo or redo inside a group"
+        if not groups:
+            return False
+        name, group = groups.pop()
+        self._replaying = groups
+        self.begin(name)
+        try:
+            for fn, args in reversed(group):
+                fn(*args)
+        finally:
+            self.end()
+            self._replaying = None
+        return True
@@ -0,0 +1,74 @@
+import heapq
+import pmap
+
+class IdAllocator(object):
+    """Hands out entity IDs and dense per-type slot indices.
+
+    IDs are unique across all entity types and never change while an entity
+    lives. Each entity also gets a slot: a small index, unique only within
+    its type, that is reused after the entity is released. Slots of a type
+    stay close to 0..count-1, so they can index arrays and bitmaps."""
+    def __init__(self, next_id=1):
+        self.next_id = next_id
+        self._id_slot = pmap.PMap()  # maps IDs to (type, slot)
+        self._slot_ids = {}          # maps types to PMaps of slots to IDs
+        self._capacity = {}          # maps types to the number of slots ever used
+        self._free_slots = {}        # maps types to min-heaps of free slots
+        self._owner = object()
+
+    def fork(self):
+        "Returns a copy that shares its maps with this allocator; either may then change alone."
+        allocator = IdAllocator(self.next_id)
+        allocator._id_slot = self._id_slot
+        allocator._slot_ids = dict(self._slot_ids)
+        allocator._capacity = dict(self._capacity)
+        allocator._free_slots = {entity_type: list(slots) for entity_type, slots in self._free_slots.items()}
+        self._owner = object()
+        return allocator
+
+    def _take_slot(self, entity_type, entity_id):
+        slot_ids = self._slot_ids.get(entity_type, pmap.EMPTY_MAP)
+        free_slots = self._free_slots.setdefault(entity_type, [])
+        if free_slots:
+            slot = heapq.heappop(free_slots)
+        else:
+            slot = self._capacity.get(entity_type, 0)
+            self._capacity[entity_type] = slot + 1
+        self._slot_ids[entity_type] = slot_ids.set(slot, entity_id, self._owner)
+        self._id_slot = self._id_slot.set(entity_id, (entity_type, slot), self._owner)
+
+    def new_id(self, entity_type):
+        entity_id = self.next_id
+        self.next_id += 1
+        self._take_slot(entity_type, entity_id)
+        return entity_id
+
+    def add(self, entity_type, entity_id):
+        "Registers an existing ID, e.g. one read from a file."
+        assert entity_id not in self._id_slot
+        self._take_slot(entity_type, entity_id)
+        self.next_id = max(self.next_id, entity_id + 1)
+
+    def release(self, entity_id):
+        entity_type, slot = self._id_slot[entity_id]
+        self._id_slot = self._id_slot.delete(entity_id, self._owner)
+        self._slot_ids[entity_type] = self._slot_ids[entity_type].delete(slot, self._owner)
+        heapq.heappush(self._free_slots[entity_type], slot)
+
+    def slot(self, entity_id):
+        return self._id_slot[entity_id][1]
+
+    def slot_id(self, entity_type, slot):
+        "Returns the ID in a slot, or None if the slot is free."
+        return self._slot_ids.get(entity_type, pmap.EMPTY_MAP).get(slot)
+
+    def capacity(self, entity_type):
+        "Returns the number of slots of a type, in use or free."
+        return self._capacity.get(entity_type, 0)
+
+    def count(self, entity_type):
+        return len(self._slot_ids.get(entity_type, pmap.EMPTY_MAP))
+
+def compaction_map(entity_ids, first_id=1):
+    "Maps IDs to consecutive IDs starting at first_id, preserving their order."
+    return {old_id: new_id for new_id, old_id in enumerate(sorted(entity_ids), first_id)}
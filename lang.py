@@ -49,9 +49,11 @@ class Procedure(object):
             rval = eval(expr, env)
         return rval
 
-def eval(expr, env=global_env):
-    "Evaluate an expression."
+def eval(expr, env=None):
+    "Evaluate an expression, by default in the environment of the current graph."
     # N.B. We need to be able to run the Qt event loop concurrently.
+    if env is None:
+        env = model.get_env()
     if type(expr) in (int, float, str):
         return expr
     elif type(expr) == Symbol:
@@ -79,11 +81,11 @@ def eval(expr, env=global_env):
         args = [eval(b[1], env) for b in args[0]]
         return Procedure(parms, body, env)(*args)
     elif op == "define":
-        if type(args[0]) == str:
-            symbol = args[0]
-            value = args[1]
+        if type(args[0]) == Symbol:
+            symbol = args[0].name
+            value = eval(args[1], env)
         else:
-            symbol = args[0][0]
+            symbol = args[0][0].name
             value = Procedure(args[0][1:], args[1:], env)
         env[symbol] = value
     else:
@@ -156,18 +158,15 @@ def haspath(source_id, dest_id, relation_ids):
 
 @builtin("hide-object")
 def hide_object(object_id, symbol):
-    object = model.get_object(object_id)
-    object.set_visible(False, symbol)
+    model.object_set_visible(object_id, False, symbol)
 
 @builtin("show-object")
 def show_object(object_id, symbol):
-    object = model.get_object(object_id)
-    object.set_visible(True, symbol)
+    model.object_set_visible(object_id, True, symbol)
 
 @builtin("object-visible?")
 def visiblep(object_id):
-    object = model.get_object(object_id)
-    return object.is_visible()
+    return model.object_is_visible(object_id)
 
 @builtin("remove-if")
 def remove_if(fn, L):
@@ -175,7 +174,7 @@ def remove_if(fn, L):
 
 @builtin("all-objects")
 def all_objects():
-    return list(map(lambda object: object.id, model.objects))
+    return model.get_objects()
 
 @builtin("apply-all")
 def apply_all(fn, L):
@@ -214,7 +213,7 @@ def innodes(object_id, relation_id):
 @builtin
 def outnodes(object_id, relation_id):
     "Returns the number of nodes with edges pointing from an object."
-    return list(model.outnodes(object_id, relation_id))
+    return list(model.object_get_outnodes(object_id, relation_id))
 
 @builtin
 def echo(*args):
@@ -223,12 +222,12 @@ def echo(*args):
     log.info(' '.join(params))
 
 @builtin("make-object-filter")
-def make_object_filter(title, predicate):
-    return model.make_object_filter(title, predicate)
+def make_object_filter(title, code):
+    return model.object_filter_new(title, code)
 
 @builtin("delete-object-filter")
 def delete_object_filter(object_filter_id):
-    model.delete_object_filter(object_filter_id)
+    model.object_filter_delete(object_filter_id)
 
 @builtin("find-first")
 def find_first(predicate, L):
@@ -440,6 +439,14 @@ def read_list(lexer):
     lexer.accept()
     return L
 
+def read_all(file):
+    "Reads each of the expressions in a string or file in turn."
+    if type(file) == str:
+        file = io.StringIO(file)
+    lexer = Lexer(BufferedReader(file))
+    while lexer.peek().type != Lexeme.EOF:
+        yield read_sexpr(lexer)
+
 def read(file):
     if type(file) == str:
         with io.StringIO(file) as fp:
@@ -0,0 +1,377 @@
+"""Automatic placement of nodes.
+
+Layouts work on node centers, given as a dict of node IDs to (x, y), and
+on edges given as (source ID, destination ID) pairs. They don't depend on
+Qt or on the model, so they can run in worker threads on plain data."""
+import math
+import random
+
+class ForceLayout(object):
+    """A force-directed layout: edges pull their ends together like springs
+    and all nodes push each other apart.
+
+    Repulsion is approximated with a Barnes-Hut quadtree, where a group of
+    nodes that is far away compared to its size pushes like one node at its
+    center of mass, so a step costs O(n log n) instead of O(n^2). A step
+    moves each node at most by the current temperature, which cools down
+    after every step until the layout settles. Fixed nodes push and pull
+    the others but never move."""
+    leaf_size = 8
+
+    def __init__(self, positions, edges, spring_length=500.0, theta=1.0, cooling=0.95, seed=0, fixed=()):
+        self.ids = list(positions)
+        index = {node_id: i for i, node_id in enumerate(self.ids)}
+        self.x = [float(positions[node_id][0]) for node_id in self.ids]
+        self.y = [float(positions[node_id][1]) for node_id in self.ids]
+        self.edges = [(index[a], index[b]) for a, b in edges if a in index and b in index and a != b]
+        fixed = set(fixed)
+        self.movable = [node_id not in fixed for node_id in self.ids]
+        self.spring_length = spring_length
+        self.theta = theta
+        self.cooling = cooling
+        self.temperature = spring_length * max(1.0, math.sqrt(len(self.ids))) / 4
+        self.min_temperature = spring_length / 100
+        self._spread_coincident(random.Random(seed))
+
+    def _spread_coincident(self, rng):
+        "Scatters nodes sharing a position, which no force could separate."
+        groups = {}
+        for i, point in enumerate(zip(self.x, self.y)):
+            groups.setdefault(point, []).append(i)
+        for (x, y), indices in groups.items():
+            if len(indices) < 2:
+                continue
+            radius = self.spring_length * math.sqrt(len(indices))
+            for i in indices:
+                if not self.movable[i]:
+                    continue
+                r = radius * math.sqrt(rng.random())
+                a = 2 * math.pi * rng.random()
+                self.x[i] = x + r * math.cos(a)
+                self.y[i] = y + r * math.sin(a)
+
+    def _build(self, indices, x0, y0, size, leaves):
+        """Returns a quadtree node over the nodes at indices, which lie in the
+        square of the given size at (x0, y0), as (center x, center y, mass,
+        size, children, indices of a leaf). Appends leaves to leaves."""
+        xs = self.x
+        ys = self.y
+        if len(indices) <= self.leaf_size or size < 1e-3:
+            mass = len(indices)
+            leaf = (sum(xs[i] for i in indices) / mass, sum(ys[i] for i in indices) / mass,
+                    mass, size, None, indices)
+            leaves.append(leaf)
+            return leaf
+        half = size / 2
+        mx = x0 + half
+        my = y0 + half
+        quadrants = ([], [], [], [])
+        for i in indices:
+            quadrants[(xs[i] >= mx) + 2 * (ys[i] >= my)].append(i)
+        children = [
+            self._build(quadrant, x0 + half * (k & 1), y0 + half * (k >> 1), half, leaves)
+            for k, quadrant in enumerate(quadrants) if quadrant
+        ]
+        mass = len(indices)
+        cx = sum(child[0] * child[2] for child in children) / mass
+        cy = sum(child[1] * child[2] for child in children) / mass
+        return (cx, cy, mass, size, children, None)
+
+    def _repulsion(self):
+        # The tree is walked once per leaf rather than once per node: a cell
+        # far enough from the whole leaf pushes all of the leaf's nodes by
+        # the same amount, and nodes in nearby leaves push each other exactly.
+        xs = self.x
+        ys = self.y
+        n = len(xs)
+        x0 = min(xs)
+        y0 = min(ys)
+        leaves = []
+        root = self._build(list(range(n)), x0, y0, max(max(xs) - x0, max(ys) - y0) or 1.0, leaves)
+        k2 = self.spring_length * self.spring_length
+        theta2 = self.theta * self.theta
+        fxs = [0.0] * n
+        fys = [0.0] * n
+        for leaf in leaves:
+            lx, ly, leaf_mass, leaf_size, _, leaf_members = leaf
+            fx = fy = 0.0
+            near = []
+            stack = [root]
+            pop = stack.pop
+            while stack:
+                cell = pop()
+                cx, cy, mass, size, children, members = cell
+                dx = lx - cx
+                dy = ly - cy
+                d2 = dx * dx + dy * dy
+                extent = size + leaf_size
+                if cell is not leaf and extent * extent < theta2 * d2:
+                    f = mass * k2 / d2
+                    fx += dx * f
+                    fy += dy * f
+                elif members is not None:
+                    near.extend(members)
+                else:
+                    stack.extend(children)
+            for i in leaf_members:
+                xi = xs[i]
+                yi = ys[i]
+                ix = fx
+                iy = fy
+                for j in near:
+                    dx = xi - xs[j]
+                    dy = yi - ys[j]
+                    d2 = dx * dx + dy * dy
+                    if d2:
+                        ix += dx * k2 / d2
+                        iy += dy * k2 / d2
+                fxs[i] = ix
+                fys[i] = iy
+        return fxs, fys
+
+    def step(self):
+        "Moves the nodes one step and returns the largest distance a node moved."
+        if not self.ids:
+            return 0.0
+        xs = self.x
+        ys = self.y
+        fxs, fys = self._repulsion()
+        k = self.spring_length
+        for a, b in self.edges:
+            dx = xs[a] - xs[b]
+            dy = ys[a] - ys[b]
+            d = math.hypot(dx, dy) / k
+            fxs[a] -= dx * d
+            fys[a] -= dy * d
+            fxs[b] += dx * d
+            fys[b] += dy * d
+        temperature = self.temperature
+        movable = self.movable
+        largest = 0.0
+        for i in range(len(xs)):
+            if not movable[i]:
+                continue
+            fx = fxs[i]
+            fy = fys[i]
+            force = math.hypot(fx, fy)
+            if force:
+                distance = min(force, temperature)
+                xs[i] += fx / force * distance
+                ys[i] += fy / force * distance
+                largest = max(largest, distance)
+        self.temperature = max(self.min_temperature, temperature * self.cooling)
+        return largest
+
+    def positions(self):
+        return {node_id: (x, y) for node_id, x, y in zip(self.ids, self.x, self.y)}
+
+class LayeredLayout(object):
+    """A layered (Sugiyama) layout for hierarchies: each edge points from a
+    parent to a child one or more layers further down.
+
+    The edges of cycles are reversed so that every edge can point down, and
+    each node goes on the layer after its lowest parent. Edges spanning
+    several layers pass through a dummy node on each layer in between. The
+    nodes of each layer are then ordered to reduce crossings by sweeping
+    down and up moving each node to the barycenter of its neighbours, and
+    finally placed as close to their neighbours as spacing allows. Roots
+    are laid out first, in the order given."""
+    dummy_width = 0.25
+
+    def __init__(self, edges, roots=(), layer_spacing=300.0, node_spacing=400.0, sweeps=8):
+        self.layer_spacing = layer_spacing
+        self.node_spacing = node_spacing
+        index = {}
+        for node_id in roots:
+            index.setdefault(node_id, len(index))
+        for a, b in edges:
+            index.setdefault(a, len(index))
+            index.setdefault(b, len(index))
+        self.ids = list(index)
+        self.real_count = len(self.ids)
+        children = [[] for i in self.ids]
+        for a, b in set(edges):
+            if a != b:
+                children[index[a]].append(index[b])
+        self._children = self._remove_cycles(children)
+        self.layer = self._assign_layers(self._children)
+        self.layers = self._add_dummies()
+        self._order(sweeps)
+        self.x = self._place()
+
+    @staticmethod
+    def _remove_cycles(children):
+        "Returns the children lists with the edges closing cycles reversed."
+        n = len(children)
+        state = [0] * n  # 0: not visited, 1: on the DFS path, 2: done
+        acyclic = [[] for i in range(n)]
+        for start in range(n):
+            if state[start]:
+                continue
+            state[start] = 1
+            stack = [(start, iter(children[start]))]
+            while stack:
+                node, it = stack[-1]
+                for child in it:
+                    if state[child] == 1:
+                        acyclic[child].append(node)
+                    else:
+                        acyclic[node].append(child)
+                        if not state[child]:
+                            state[child] = 1
+                            stack.append((child, iter(children[child])))
+                            break
+                else:
+                    state[node] = 2
+                    stack.pop()
+        return [list(dict.fromkeys(c)) for c in acyclic]
+
+    @staticmethod
+    def _assign_layers(children):
+        "Puts each node one layer below its lowest parent, with sources pulled down to their children."
+        n = len(children)
+        parent_count = [0] * n
+        for c in children:
+            for child in c:
+                parent_count[child] += 1
+        layer = [0] * n
+        remaining = list(parent_count)
+        order = [i for i in range(n) if not remaining[i]]
+        for node in order:
+            for child in children[node]:
+                layer[child] = max(layer[child], layer[node] + 1)
+                remaining[child] -= 1
+                if not remaining[child]:
+                    order.append(child)
+        for node in reversed(order):
+            if not parent_count[node] and children[node]:
+                layer[node] = min(layer[child] for child in children[node]) - 1
+        return layer
+
+    def _add_dummies(self):
+        "Splits long edges with dummy nodes and returns the initial order of each layer."
+        layer = self.layer
+        children = self._children
+        ups = [[] for i in layer]
+        downs = [[] for i in layer]
+        for node in range(len(children)):
+            for child in children[node]:
+                upper = node
+                for level in range(layer[node] + 1, layer[child]):
+                    dummy = len(layer)
+                    layer.append(level)
+                    ups.append([upper])
+                    downs.append([])
+                    downs[upper].append(dummy)
+                    upper = dummy
+                downs[upper].append(child)
+                ups[child].append(upper)
+        self._ups = ups
+        self._downs = downs
+        # Depth-first order from the roots keeps subtrees together
+        layers = [[] for i in range(max(layer, default=-1) + 1)]
+        seen = [False] * len(layer)
+        for start in range(self.real_count):
+            if seen[start] or ups[start]:
+                continue
+            seen[start] = True
+            stack = [start]
+            while stack:
+                node = stack.pop()
+                layers[layer[node]].append(node)
+                for child in reversed(downs[node]):
+                    if not seen[child]:
+                        seen[child] = True
+                        stack.append(child)
+        return layers
+
+    def _sweep(self, layers, neighbours, position):
+        for nodes in layers:
+            barycenters = {}
+            for i, node in enumerate(nodes):
+                adjacent = neighbours[node]
+                barycenters[node] = sum(position[a] for a in adjacent) / len(adjacent) if adjacent else i
+            nodes.sort(key=barycenters.__getitem__)
+            for i, node in enumerate(nodes):
+                position[node] = i
+
+    def _crossings(self, position):
+        total = 0
+        downs = self._downs
+        for nodes in self.layers[:-1]:
+            lower = [position[child] for node in nodes for child in sorted(downs[node], key=position.__getitem__)]
+            # Crossings are the inversions of the lower ends, counted with a Fenwick tree
+            tree = [0] * (len(lower) + 1)
+            size = len(tree)
+            for seen, p in enumerate(lower):
+                i = p + 1
+                below = 0
+                while i:
+                    below += tree[i]
+                    i -= i & -i
+                total += seen - below
+                i = p + 1
+                while i < size:
+                    tree[i] += 1
+                    i += i & -i
+        return total
+
+    def _order(self, sweeps):
+        "Reorders the layers with barycenter sweeps, keeping the order with the fewest crossings."
+        layers = self.layers
+        position = [0] * len(self.layer)
+        for nodes in layers:
+            for i, node in enumerate(nodes):
+                position[node] = i
+        best = [list(nodes) for nodes in layers]
+        best_crossings = self._crossings(position)
+        for i in range(sweeps):
+            if not best_crossings:
+                break
+            self._sweep(layers[1:], self._ups, position)
+            self._sweep(layers[-2::-1], self._downs, position)
+            crossings = self._crossings(position)
+            if crossings < best_crossings:
+                best = [list(nodes) for nodes in layers]
+                best_crossings = crossings
+        self.layers = best
+        self.crossings = best_crossings
+
+    def _width(self, node):
+        return self.node_spacing if node < self.real_count else self.node_spacing * self.dummy_width
+
+    def _pack(self, nodes, desired, x):
+        "Places nodes in order as near their desired x as their spacing allows."
+        width = self._width
+        n = len(nodes)
+        left = list(desired)
+        for i in range(1, n):
+            left[i] = max(left[i], left[i - 1] + (width(nodes[i - 1]) + width(nodes[i])) / 2)
+        right = list(desired)
+        for i in range(n - 2, -1, -1):
+            right[i] = min(right[i], right[i + 1] - (width(nodes[i]) + width(nodes[i + 1])) / 2)
+        for i, node in enumerate(nodes):
+            x[node] = (left[i] + right[i]) / 2
+
+    def _place(self, passes=4):
+        x = [0.0] * len(self.layer)
+        for nodes in self.layers:
+            self._pack(nodes, [0.0] * len(nodes), x)
+        for i in range(passes):
+            for layers, neighbours in ((self.layers[1:], self._ups), (self.layers[-2::-1], self._downs)):
+                for nodes in layers:
+                    desired = [
+                        sum(x[a] for a in neighbours[node]) / len(neighbours[node]) if neighbours[node] else x[node]
+                        for node in nodes
+                    ]
+                    self._pack(nodes, desired, x)
+        return x
+
+    def positions(self):
+        "Returns the centers of the nodes, with the leftmost at x = 0 and the roots at y = 0."
+        x = self.x[:self.real_count]
+        x0 = min(x, default=0.0)
+        return {
+            node_id: (x[i] - x0, self.layer[i] * self.layer_spacing)
+            for i, node_id in enumerate(self.ids)
+        }
@@ -1,4 +1,8 @@
+import collections
+import os
+import queue
 import sys
+import threading
 
 class TerminalLogger(object):
     def __init__(self, stderr):
@@ -16,6 +20,116 @@ class TerminalLogger(object):
     def debug(self, message):
         self.stderr.write("DEBUG: {0}\r\n".format(message))
 
+class LogBuffer(object):
+    """A bounded, thread-safe ring buffer of (level, message) pairs.
+
+    Loggers append from any thread; a consumer drains the buffer in batches.
+    Once the buffer holds `capacity` entries, the oldest entries are dropped
+    and counted."""
+    def __init__(self, capacity=10000):
+        self._entries = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._dropped = 0
+
+    def append(self, level, message):
+        with self._lock:
+            if len(self._entries) == self._entries.maxlen:
+                self._dropped += 1
+            self._entries.append((level, message))
+
+    def drain(self):
+        "Returns the buffered entries and the number dropped since the last drain."
+        with self._lock:
+            entries = list(self._entries)
+            self._entries.clear()
+            dropped = self._dropped
+            self._dropped = 0
+        return entries, dropped
+
+    def __len__(self):
+        return len(self._entries)
+
+class FileLogger(object):
+    """Writes log messages to a file from a background thread, rotating the
+    file once it grows past `max_bytes` and keeping `backup_count` old files
+    (path.1 is the newest)."""
+    def __init__(self, path, max_bytes=1 << 20, backup_count=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.Queue()
+        self._file = open(path, "a")
+        self._thread = threading.Thread(target=self._run, name="FileLogger", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        running = True
+        while running:
+            lines = [self._queue.get()]
+            # Write everything that queued up meanwhile before flushing
+            while not self._queue.empty():
+                lines.append(self._queue.get_nowait())
+            for line in lines:
+                if line is None:
+                    running = False
+                else:
+                    self._file.write(line)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        self._file.close()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = "{0}.{1}".format(self.path, i)
+            if os.path.exists(source):
+                os.replace(source, "{0}.{1}".format(self.path, i + 1))
+        if self.backup_count > 0:
+            os.replace(self.path, "{0}.1".format(self.path))
+        self._file = open(self.path, "w")
+
+    def _write(self, level, message):
+        self._queue.put("{0}: {1}\n".format(level, message))
+
+    def close(self):
+        "Writes out the queued messages and stops the writer thread."
+        self._queue.put(None)
+        self._thread.join()
+
+    def error(self, message):
+        self._write("ERROR", message)
+
+    def warn(self, message):
+        self._write("WARN", message)
+
+    def info(self, message):
+        self._write("INFO", message)
+
+    def debug(self, message):
+        self._write("DEBUG", message)
+
+class MultiLogger(object):
+    "Forwards each message to every one of a set of loggers."
+    def __init__(self, *loggers):
+        self.loggers = loggers
+
+    def error(self, message):
+        for logger in self.loggers:
+            logger.error(message)
+
+    def warn(self, message):
+        for logger in self.loggers:
+            logger.warn(message)
+
+    def info(self, message):
+        for logger in self.loggers:
+            logger.info(message)
+
+    def debug(self, message):
+        for logger in self.loggers:
+            logger.debug(message)
+
 __logger = TerminalLogger(sys.stderr)
 
 def set_logger(logger):
@@ -33,18 +147,42 @@ def set_log_level(level):
     global __log_level
     __log_level = level
 
+def enabled(level):
+    """Returns whether messages at the given level are logged.
+
+    Use this to guard expensive argument construction at call sites."""
+    return __log_level >= level
+
+class Message(object):
+    """A log message whose arguments are only formatted when it is converted
+    to a string, so a logger can defer or skip the work."""
+    __slots__ = ("fmt", "args", "_text")
+
+    def __init__(self, fmt, args):
+        self.fmt = fmt
+        self.args = args
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = str(self.fmt) % self.args if self.args else str(self.fmt)
+        return self._text
+
+    def __format__(self, spec):
+        return format(str(self), spec)
+
 def error(fmt, *args):
     if __log_level >= Level.ERROR:
-        __logger.error(fmt % args)
+        __logger.error(Message(fmt, args))
 
 def warn(fmt, *args):
     if __log_level >= Level.WARN:
-        __logger.warn(fmt % args)
+        __logger.warn(Message(fmt, args))
 
 def info(fmt, *args):
     if __log_level >= Level.INFO:
-        __logger.info(fmt % args)
+        __logger.info(Message(fmt, args))
 
 def debug(fmt, *args):
     if __log_level >= Level.DEBUG:
-        __logger.debug(fmt % args)
+        __logger.debug(Message(fmt, args))
@@ -0,0 +1,57 @@
+import collections
+
+class LRUCache(object):
+    """A cache with a budget on the total cost of its values.
+
+    Each value is stored with a cost, e.g. its size in bytes. Storing a
+    value evicts the least recently used ones until the total cost fits the
+    budget again; a value costing more than the whole budget isn't kept."""
+    def __init__(self, budget):
+        self.budget = budget
+        self.cost = 0
+        self._entries = collections.OrderedDict()  # maps keys to (value, cost)
+
+    def get(self, key, default=None):
+        "Returns the value stored under key, marking it used, or default."
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key, default=None):
+        "Returns the value stored under key without marking it used."
+        entry = self._entries.get(key)
+        return default if entry is None else entry[0]
+
+    def put(self, key, value, cost):
+        self.discard(key)
+        if cost > self.budget:
+            return
+        self._entries[key] = (value, cost)
+        self.cost += cost
+        self._evict(self.budget)
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.cost -= entry[1]
+
+    def set_budget(self, budget):
+        self.budget = budget
+        self._evict(budget)
+
+    def clear(self):
+        self._entries.clear()
+        self.cost = 0
+
+    def _evict(self, budget):
+        while self.cost > budget:
+            key, (value, cost) = self._entries.popitem(last=False)
+            self.cost -= cost
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,11 +1,23 @@
 import sys
-import view
-import PyQt5
+import time
+
+# Taken before the Qt imports so that startup time includes them
+started_at = time.perf_counter()
 
 def main(argv):
-    app = PyQt5.QtWidgets.QApplication(argv)
-    win = view.QMainWindow("Reticulus")
+    import argparse
+    import view
+    from PyQt5 import QtCore, QtWidgets
+    app = QtWidgets.QApplication(argv)
+    parser = argparse.ArgumentParser(prog="main.py")
+    parser.add_argument("file", nargs="?", help="document to open")
+    parser.add_argument("--demo", action="store_true", help="start with example classes, relations and a filter")
+    args = parser.parse_args(app.arguments()[1:])
+    win = view.QMainWindow("Reticulus", demo=args.demo, started_at=started_at)
     win.show()
+    if args.file:
+        # Open the document once the window has been shown
+        QtCore.QTimer.singleShot(0, lambda: win.open_file(args.file))
     app.exec_()
     EXIT_SUCCESS = 0
     return EXIT_SUCCESS
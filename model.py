@@ -1,14 +1,21 @@
+import contextvars
+import copy
+import functools
+import history
 import itertools
 import event
+import ids
 import random
+import rwlock
+import sys
+import types
 import lang
 import log
+import pmap
+import stats as _stats
 
-_id = 0
-def make_id():
-    global _id
-    _id += 1
-    return _id
+def make_id(entity_type):
+    return _graph().ids.new_id(entity_type)
 
 class TypeRepr(type):
     def __repr__(klass):
@@ -55,21 +62,39 @@ class VisibilitySuppressor(object):
     def suppressors(self):
         return set(self._suppressors)
 
+class Entity(object):
+    """Base of the model entities.
+
+    A graph and its snapshots share entities. An entity is only changed in
+    place by the graph whose owner token it carries; any other graph first
+    replaces it with a copy of its own (see _edit_entity)."""
+    owner = None
+
+    def copy(self, owner):
+        "Returns a copy owned by owner. Lists, sets and dicts are copied; persistent maps are shared."
+        entity = copy.copy(self)
+        for name, value in vars(self).items():
+            if type(value) in (list, set, dict):
+                setattr(entity, name, type(value)(value))
+        entity.owner = owner
+        return entity
+
 # Classes
 
-class Class(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
+class Class(Entity, event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
     def __init__(self, id, name, color):
         event.Emitter.__init__(self)
         VisibilitySuppressor.__init__(self)
         self.id = id
         self.name = name
         self.color = color
+        self.image = None
         self.fields = []
-        self.objects = set()
+        self.objects = pmap.EMPTY_SET
     
     def suppressable_entities(self):
         for object_id in set(self.objects):
-            yield _get_object(object_id)
+            yield _edit_object(object_id)
     
     def to_dict(self):
         return {
@@ -77,6 +102,7 @@ class Class(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
             "id": self.id,
             "name": self.name,
             "color": self.color,
+            "image": self.image,
             "fields": list(self.fields),
             "objects": set(self.objects),
         }
@@ -84,16 +110,17 @@ class Class(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
     @staticmethod
     def from_dict(d):
         klass = Class(d["id"], d["name"], d["color"])
+        klass.image = d.get("image")
         klass.fields = d["fields"]
-        klass.objects = d["objects"]
+        klass.objects = pmap.PSet(d["objects"])
         return klass
 
 def class_new(name, source="model"):
-    id = make_id()
+    id = make_id(Class)
     klass = Class(id, name, Color.random())
-    __id_entity_map[id] = klass
-    __type_id_map[Class].append(id)
-    _emit.class_created(id, source)
+    _store(klass)
+    _record(class_delete, id)
+    _graph().emit.class_created(id, source)
     return id
 
 def _make_type_getter(expected_type):
@@ -103,92 +130,128 @@ def _make_type_getter(expected_type):
         return entity
     return getter
 
+def _make_type_editor(expected_type):
+    def editor(entity_id):
+        entity = _edit_entity(entity_id)
+        assert type(entity) == expected_type
+        return entity
+    return editor
+
 _get_class = _make_type_getter(Class)
+_edit_class = _make_type_editor(Class)
 
 def get_classes():
-    return list(__type_id_map[Class])
+    return list(_graph().types[Class])
 
 def class_delete(class_id, source="model"):
+    graph = _graph()
     klass = _get_class(class_id)
     for object_id in set(klass.objects):
         object_delete(object_id)
     for field_id in list(klass.fields):
         field_delete(field_id)
-    _emit.class_deleted(class_id, source)
-    __type_id_map[Class].remove(class_id)
-    del __id_entity_map[class_id]
+    _record(_class_restore, _get_class(class_id), graph.types[Class].index(class_id))
+    graph.emit.class_deleted(class_id, source)
+    _forget(class_id)
+
+def _class_restore(klass, position):
+    klass = _restore(klass, position)
+    _record(class_delete, klass.id)
+    _graph().emit.class_created(klass.id, "model")
 
 def class_get_name(class_id):
     klass = _get_class(class_id)
     return klass.name
 
 def class_set_name(class_id, name, source="model"):
-    klass = _get_class(class_id)
+    graph = _graph()
+    klass = _edit_class(class_id)
+    _record(class_set_name, class_id, klass.name)
     klass.name = name
-    _emit.class_changed(class_id, source)
+    graph.emit.class_changed(class_id, source)
     for object_id in klass.objects:
-        _emit.object_changed(object_id, source)
+        graph.emit.object_changed(object_id, source)
 
 def class_is_visible(class_id):
     klass = _get_class(class_id)
     return klass.is_visible()
 
 def class_set_visible(class_id, is_visible, symbol=None):
-    klass: Class = _get_class(class_id)
-    return klass.set_visible(is_visible, symbol if symbol else class_id)
+    klass: Class = _edit_class(class_id)
+    symbol = symbol if symbol else class_id
+    _record_visibility(class_set_visible, klass, is_visible, symbol)
+    return klass.set_visible(is_visible, symbol)
 
 def class_get_color(class_id):
     klass = _get_class(class_id)
     return Color.from_color(klass.color)
 
 def class_set_color(class_id, color, source="model"):
-    klass = _get_class(class_id)
+    klass = _edit_class(class_id)
+    _record(class_set_color, class_id, klass.color)
     new_color = Color.from_color(color)
     klass.color = new_color
     for object_id in klass.objects:
-        _emit.object_changed(object_id, source)
+        _graph().emit.object_changed(object_id, source)
+
+def class_get_image(class_id):
+    "Returns the image file shown on the objects of a class, or None for the default image."
+    klass = _get_class(class_id)
+    return klass.image
+
+def class_set_image(class_id, image, source="model"):
+    graph = _graph()
+    klass = _edit_class(class_id)
+    _record(class_set_image, class_id, klass.image)
+    klass.image = image
+    graph.emit.class_changed(class_id, source)
+    for object_id in klass.objects:
+        graph.emit.object_changed(object_id, source)
 
 def class_get_fields(class_id):
     klass = _get_class(class_id)
     return list(klass.fields)
 
 def class_add_field(class_id, field_name, field_type, initial_value=None, source="model"):
-    klass = _get_class(class_id)
-    field_id = make_id()
+    graph = _graph()
+    klass = _edit_class(class_id)
+    field_id = make_id(Field)
     field = Field(field_id, class_id, field_name, field_type, initial_value)
-    __id_entity_map[field_id] = field
-    __type_id_map[Field].add(field_id)
+    _store(field)
     klass.fields.append(field_id)
     for object_id in klass.objects:
-        object = _get_object(object_id)
-        member_id = make_id()
+        object = _edit_object(object_id)
+        member_id = make_id(Member)
         member = Member(member_id, field_id)
-        __id_entity_map[member_id] = member
-        __type_id_map[Member].add(member_id)
+        _store(member)
         object.members.append(member_id)
-    _emit.class_changed(class_id, source)
+    _record(field_delete, field_id)
+    graph.emit.class_changed(class_id, source)
     for object_id in klass.objects:
-        _emit.object_changed(object_id, source)
+        graph.emit.object_changed(object_id, source)
     return field_id
 
 # Objects
 
-class Object(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
+class Object(Entity, event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
     def __init__(self, id, class_id, suppressors, name="New Object"):
         event.Emitter.__init__(self)
         VisibilitySuppressor.__init__(self, suppressors)
         self.id = id
         self.name = name
         self.klass = class_id
+        self.image = None
         self.members = []
+        # Maps relation IDs to PSets of the IDs of incident edges in that relation
+        self.edges = {}
     
     def visibility_changed(self):
-        _emit.object_changed(self.id, "model")
+        _graph().emit.object_changed(self.id, "model")
     
     def suppressable_entities(self):
-        for relation_id in get_relations():
-            for edge_id in object_get_edges(self.id, relation_id):
-                yield _get_edge(edge_id)
+        for edge_ids in list(self.edges.values()):
+            for edge_id in set(edge_ids):
+                yield _edit_edge(edge_id)
 
     def to_dict(self):
         return {
@@ -196,6 +259,7 @@ class Object(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
             "id": self.id,
             "name": self.name,
             "class_id": self.klass,
+            "image": self.image,
             "members": self.members,
             "suppressors": self._suppressors,
         }
@@ -203,72 +267,93 @@ class Object(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
     @staticmethod
     def from_dict(d):
         object = Object(d["id"], d["class_id"], d["suppressors"], name=d["name"])
+        object.image = d.get("image")
         object.members = d["members"]
         return object
 
 def object_new(class_id, source="model"):
-    klass = _get_class(class_id)
-    object_id = make_id()
+    graph = _graph()
+    klass = _edit_class(class_id)
+    object_id = make_id(Object)
     object = Object(object_id, class_id, klass.suppressors(), name="New {0}".format(klass.name))
 
-    __id_entity_map[object_id] = object
-    klass.objects.add(object_id)
-    __type_id_map[Object].add(object_id)
+    _store(object)
+    klass.objects = klass.objects.add(object_id, graph.owner)
     
     for field_id in klass.fields:
-        member_id = make_id()
+        member_id = make_id(Member)
         member = Member(member_id, field_id)
-        __id_entity_map[member.id] = member
-        __type_id_map[Member].add(member.id)
+        _store(member)
         object.members.append(member.id)
 
-    _emit.object_created(object_id, source)
+    _record(object_delete, object_id)
+    graph.emit.object_created(object_id, source)
 
     return object_id
 
 _get_object = _make_type_getter(Object)
+_edit_object = _make_type_editor(Object)
 
 def get_objects():
-    return list(__type_id_map[Object])
+    return list(_graph().types[Object])
+
+def object_exists(object_id):
+    return object_id in _graph().types[Object]
 
 def object_delete(object_id, source="model"):
+    graph = _graph()
     object = _get_object(object_id)
-    for relation_id in __type_id_map[Relation]:
+    for relation_id in list(object.edges):
         object_delete_edges(object_id, relation_id)
-    _emit.object_deleted(object_id, source)
+    object = _get_object(object_id)
+    _record(_object_restore, object, [_get_member(member_id) for member_id in object.members])
+    graph.emit.object_deleted(object_id, source)
     for member_id in list(object.members):
-        __type_id_map[Member].remove(member_id)
-        del __id_entity_map[member_id]
-    object.members = []
-    __type_id_map[Object].remove(object_id)
-    klass = _get_class(object.klass)
-    klass.objects.remove(object_id)
-    del __id_entity_map[object_id]
+        _forget(member_id)
+    klass = _edit_class(object.klass)
+    klass.objects = klass.objects.remove(object_id, graph.owner)
+    _forget(object_id)
+
+def _object_restore(object, members):
+    graph = _graph()
+    for member in members:
+        _restore(member)
+    object = _restore(object)
+    klass = _edit_class(object.klass)
+    klass.objects = klass.objects.add(object.id, graph.owner)
+    _record(object_delete, object.id)
+    graph.emit.object_created(object.id, "model")
 
 def object_get_innodes(object_id, relation_id):
     relation = _get_relation(relation_id)
-    return list(relation.innodes.get(object_id, {}).keys())
+    return list(relation.innodes.get(object_id, pmap.EMPTY_MAP).keys())
 
 def object_get_outnodes(object_id, relation_id):
     relation = _get_relation(relation_id)
-    return list(relation.outnodes.get(object_id, {}).keys())
+    return list(relation.outnodes.get(object_id, pmap.EMPTY_MAP).keys())
 
 def object_delete_edges(object_id, relation_id):
-    relation = _get_relation(relation_id)
     edge_ids = list(object_get_edges(object_id, relation_id))
     for edge_id in edge_ids:
         edge_delete(edge_id)
 
 def object_get_edges(object_id, relation_id):
-    relation = _get_relation(relation_id)
-    edge_ids = set()
-    innode_ids = dict(relation.innodes.get(object_id, {})).values()
-    for edge_id in innode_ids:
-        edge_ids.add(edge_id)
-    outnode_ids = dict(relation.outnodes.get(object_id, {})).values()
-    for edge_id in outnode_ids:
-        edge_ids.add(edge_id)
-    return edge_ids
+    object = _get_object(object_id)
+    return set(object.edges.get(relation_id, ()))
+
+def _object_index_edge(object, relation_id, edge_id):
+    edge_ids = object.edges.get(relation_id, pmap.EMPTY_SET)
+    object.edges[relation_id] = edge_ids.add(edge_id, _graph().owner)
+
+def _object_unindex_edge(object, relation_id, edge_id):
+    edge_ids = object.edges.get(relation_id)
+    if edge_ids is None:
+        return
+    edge_ids = edge_ids.discard(edge_id, _graph().owner)
+    if edge_ids:
+        object.edges[relation_id] = edge_ids
+    else:
+        del object.edges[relation_id]
 
 def object_get_color(object_id):
     object = _get_object(object_id)
@@ -280,14 +365,35 @@ def object_get_name(object_id):
     return object.name
 
 def object_set_name(object_id, name, source="model"):
-    object = _get_object(object_id)
+    object = _edit_object(object_id)
+    _record(object_set_name, object_id, object.name)
     object.name = name
-    _emit.object_changed(object_id, source)
+    _graph().emit.object_changed(object_id, source)
+
+def object_get_image(object_id):
+    "Returns the image file of an object, or else of its class, or None for the default image."
+    object = _get_object(object_id)
+    if object.image is not None:
+        return object.image
+    return _get_class(object.klass).image
+
+def object_set_image(object_id, image, source="model"):
+    "Sets the image file of an object; None shows the image of its class."
+    object = _edit_object(object_id)
+    _record(object_set_image, object_id, object.image)
+    object.image = image
+    _graph().emit.object_changed(object_id, source)
 
 def object_is_visible(object_id):
     object = _get_object(object_id)
     return object.is_visible()
 
+def object_set_visible(object_id, is_visible, symbol=None):
+    object = _edit_object(object_id)
+    symbol = symbol if symbol else object_id
+    _record_visibility(object_set_visible, object, is_visible, symbol)
+    return object.set_visible(is_visible, symbol)
+
 def object_get_class(object_id):
     object = _get_object(object_id)
     klass = _get_class(object.klass)
@@ -299,7 +405,7 @@ def object_get_members(object_id):
 
 # Fields
 
-class Field(object, metaclass=TypeRepr):
+class Field(Entity, metaclass=TypeRepr):
     def __init__(self, id, class_id, name, type, initial_value=None):
         self.id = id
         self.name = name
@@ -329,18 +435,21 @@ class Field(object, metaclass=TypeRepr):
         return object
 
 _get_field = _make_type_getter(Field)
+_edit_field = _make_type_editor(Field)
 
 def field_get_name(field_id):
     field = _get_field(field_id)
     return field.name
 
 def field_set_name(field_id, name, source="model"):
-    field = _get_field(field_id)
+    graph = _graph()
+    field = _edit_field(field_id)
+    _record(field_set_name, field_id, field.name)
     field.name = name
     klass = _get_class(field.klass)
-    _emit.class_changed(klass.id, source)
+    graph.emit.class_changed(klass.id, source)
     for object_id in klass.objects:
-        _emit.object_changed(object_id, source)
+        graph.emit.object_changed(object_id, source)
 
 def field_get_type(field_id):
     field = _get_field(field_id)
@@ -351,9 +460,10 @@ def field_get_initial_value(field_id):
     return field.initial_value
 
 def field_set_initial_value(field_id, value):
-    field = _get_field(field_id)
+    field = _edit_field(field_id)
     if not field.type.is_valid(value):
-        raise InvalidTypeException()
+        raise InvalidTypeException("{0} is not a valid {1}".format(repr(value), field.type))
+    _record(field_set_initial_value, field_id, field.initial_value)
     field.initial_value = value
 
 def make_str_to(type_or_field):
@@ -369,7 +479,8 @@ def make_str_to(type_or_field):
 # When converting a member value, failure to convert uses field initial value
 
 def field_set_type(field_id, new_type, source="model"):
-    field = _get_field(field_id)
+    graph = _graph()
+    field = _edit_field(field_id)
     convert_field_value = {
         Integer: {
             Integer: int,
@@ -429,41 +540,73 @@ def field_set_type(field_id, new_type, source="model"):
     field.initial_value = new_initial_value
 
     klass = _get_class(field.klass)
-    _emit.class_changed(klass.id, source)
     position = klass.fields.index(field_id)
+    old_values = []
+    convert = convert_member_value[old_type][new_type]
     for object_id in klass.objects:
         # Convert type of corresponding member in object
-        object = _get_object(object_id)
-        member_id = object.members[position]
-        old_member_value = member_get_value(member_id)
-        new_member_value = convert_member_value[old_type][new_type](old_member_value)
-        member_set_value(member_id, new_member_value)
-        _emit.object_changed(object_id, source)
+        member = _edit_member(_get_object(object_id).members[position])
+        old_values.append((member.id, member.value))
+        member.value = convert(member.value)
+    _record(_field_set_column, field_id, old_type, old_initial_value, old_values)
+    graph.emit.class_changed(klass.id, source)
+    for object_id in klass.objects:
+        graph.emit.object_changed(object_id, source)
+
+def _field_set_column(field_id, field_type, initial_value, values):
+    "Sets the type, initial value and member values of a field at once."
+    graph = _graph()
+    field = _edit_field(field_id)
+    old_values = [(member_id, _get_member(member_id).value) for member_id, value in values]
+    _record(_field_set_column, field_id, field.type, field.initial_value, old_values)
+    field.type = field_type
+    field.initial_value = initial_value
+    for member_id, value in values:
+        _edit_member(member_id).value = value
+    klass = _get_class(field.klass)
+    graph.emit.class_changed(klass.id, "model")
+    for object_id in klass.objects:
+        graph.emit.object_changed(object_id, "model")
 
 def field_delete(field_id, source="model"):
+    graph = _graph()
     field = _get_field(field_id)
-    klass = _get_class(field.klass)
+    klass = _edit_class(field.klass)
     # Remove the field from its class, saving its position
     position = klass.fields.index(field_id)
     klass.fields.pop(position)
     # Remove the associated member from each of the objects of the class
+    members = []
     for object_id in klass.objects:
-        object = _get_object(object_id)
+        object = _edit_object(object_id)
         member_id = object.members[position]
-        __type_id_map[Member].remove(member_id)
-        del __id_entity_map[member_id]
+        members.append((object_id, _get_member(member_id)))
+        _forget(member_id)
         object.members.pop(position)
+    _record(_field_restore, field, position, members)
     # Signal the change to the class and object event handlers
-    _emit.class_changed(klass.id, source)
+    graph.emit.class_changed(klass.id, source)
     for object_id in klass.objects:
-        _emit.object_changed(object_id, source)
+        graph.emit.object_changed(object_id, source)
     # Remove the field from the top-level data structures
-    __type_id_map[Field].remove(field_id)
-    del __id_entity_map[field_id]
+    _forget(field_id)
+
+def _field_restore(field, position, members):
+    graph = _graph()
+    field = _restore(field)
+    klass = _edit_class(field.klass)
+    klass.fields.insert(position, field.id)
+    for object_id, member in members:
+        member = _restore(member)
+        _edit_object(object_id).members.insert(position, member.id)
+    _record(field_delete, field.id)
+    graph.emit.class_changed(klass.id, "model")
+    for object_id in klass.objects:
+        graph.emit.object_changed(object_id, "model")
 
 # Members
 
-class Member(object, metaclass=TypeRepr):
+class Member(Entity, metaclass=TypeRepr):
     def __init__(self, id, field_id, value=None):
         self.id = id
         self.field = field_id
@@ -483,6 +626,7 @@ class Member(object, metaclass=TypeRepr):
         return member
 
 _get_member = _make_type_getter(Member)
+_edit_member = _make_type_editor(Member)
 
 def member_get_value(member_id):
     member = _get_member(member_id)
@@ -493,9 +637,11 @@ class InvalidTypeException(Exception):
         super().__init__(message)
 
 def member_set_value(member_id, value):
-    member = _get_member(member_id)
-    if not member.field.type.is_valid(value):
-        raise InvalidTypeException("blam")
+    member = _edit_member(member_id)
+    field = _get_field(member.field)
+    if not field.type.is_valid(value):
+        raise InvalidTypeException("{0} is not a valid {1}".format(repr(value), field.type))
+    _record(member_set_value, member_id, member.value)
     member.value = value
 
 def member_get_field(member_id):
@@ -513,7 +659,7 @@ class RelationException(Exception):
         )
         super().__init__(message)
 
-class Relation(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
+class Relation(Entity, event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
     def __init__(self, id, name):
         event.Emitter.__init__(self)
         VisibilitySuppressor.__init__(self)
@@ -527,13 +673,15 @@ class Relation(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
         self.on_add = "do-nothing"
         self.on_delete = "do-nothing"
         self.reverse = False
-        self.innodes = {}
-        self.outnodes = {}
-        self.forest = []
+        # Map object IDs to PMaps of adjacent object IDs to edge IDs
+        self.innodes = pmap.EMPTY_MAP
+        self.outnodes = pmap.EMPTY_MAP
+        self.forest = pmap.EMPTY_SET
+        self.edges = pmap.EMPTY_SET
     
     def suppressable_entities(self):
-        for edge_id in get_relation_edges(self.id):
-            yield __id_entity_map[edge_id]
+        for edge_id in set(self.edges):
+            yield _edit_edge(edge_id)
 
     def to_dict(self):
         return {
@@ -548,9 +696,10 @@ class Relation(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
             "on_add": self.on_add,
             "on_delete": self.on_delete,
             "reverse": self.reverse,
-            "innodes": dict(self.innodes),
-            "outnodes": dict(self.outnodes),
+            "innodes": {object_id: dict(edge_ids.items()) for object_id, edge_ids in self.innodes.items()},
+            "outnodes": {object_id: dict(edge_ids.items()) for object_id, edge_ids in self.outnodes.items()},
             "forest": list(self.forest),
+            "edges": set(self.edges),
         }
     
     @staticmethod
@@ -564,140 +713,161 @@ class Relation(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
         relation.on_add = d["on_add"]
         relation.on_delete = d["on_delete"]
         relation.reverse = d["reverse"]
-        relation.innodes = d["innodes"]
-        relation.outnodes = d["outnodes"]
-        relation.forest = d["forest"]
+        relation.innodes = pmap.PMap((object_id, pmap.PMap(edge_ids)) for object_id, edge_ids in d["innodes"].items())
+        relation.outnodes = pmap.PMap((object_id, pmap.PMap(edge_ids)) for object_id, edge_ids in d["outnodes"].items())
+        relation.forest = pmap.PSet(d["forest"])
+        if "edges" in d:
+            relation.edges = pmap.PSet(d["edges"])
+        else:
+            # Older files don't store the edge set; recover it from the adjacency maps
+            edge_ids = set()
+            for nodes in (d["innodes"], d["outnodes"]):
+                for node_edge_ids in nodes.values():
+                    edge_ids.update(node_edge_ids.values())
+            relation.edges = pmap.PSet(edge_ids)
         return relation
 
 def relation_new(name, *args, source="model", **kwargs):
-    relation_id = make_id()
+    relation_id = make_id(Relation)
     relation = Relation(relation_id, name, *args, **kwargs)
-    __id_entity_map[relation_id] = relation
-    __type_id_map[Relation].append(relation_id)
-    _emit.relation_created(relation_id, source)
+    _store(relation)
+    _record(relation_delete, relation_id)
+    _graph().emit.relation_created(relation_id, source)
     return relation_id
 
 _get_relation = _make_type_getter(Relation)
+_edit_relation = _make_type_editor(Relation)
 
 def get_relations():
-    return list(__type_id_map[Relation])
+    return list(_graph().types[Relation])
 
 def relation_delete(relation_id, source="model"):
-    _emit.relation_deleted(relation_id, source)
+    graph = _graph()
+    graph.emit.relation_deleted(relation_id, source)
     relation_delete_edges(relation_id)
-    __type_id_map[Relation].remove(relation_id)
-    del __id_entity_map[relation_id]
+    _record(_relation_restore, _get_relation(relation_id), graph.types[Relation].index(relation_id))
+    _forget(relation_id)
+
+def _relation_restore(relation, position):
+    relation = _restore(relation, position)
+    _record(relation_delete, relation.id)
+    _graph().emit.relation_created(relation.id, "model")
 
 def relation_get_edges(relation_id):
     relation = _get_relation(relation_id)
-    innodes = dict(relation.innodes)
-    outnodes = dict(relation.outnodes)
-    visited = set()
-    edge_ids = set()
-    for dest_id, in_edges in innodes.items():
-        in_edges = list(in_edges.values())
-        for edge_id in in_edges:
-            if not edge_id in visited:
-                edge_ids.add(edge_id)
-                visited.add(edge_id)
-    for dest_id, out_edges in outnodes.items():
-        out_edges = list(out_edges.values())
-        for edge_id in out_edges:
-            if not edge_id in visited:
-                edge_ids.add(edge_id)
-                visited.add(edge_id)
-    return edge_ids
+    return set(relation.edges)
+
+def relation_count_edges(relation_id):
+    relation = _get_relation(relation_id)
+    return len(relation.edges)
 
 def relation_get_color(relation_id):
     relation = _get_relation(relation_id)
     return Color.from_color(relation.color)
 
 def relation_set_color(relation_id, color, source="model"):
-    relation = _get_relation(relation_id)
+    graph = _graph()
+    relation = _edit_relation(relation_id)
+    _record(relation_set_color, relation_id, relation.color)
     new_color = Color.from_color(color)
     relation.color = new_color
-    _emit.relation_changed(relation_id, source)
-    for edge_id in relation_get_edges(relation_id):
-        _emit.edge_changed(edge_id, source)
+    graph.emit.relation_changed(relation_id, source)
+    for edge_id in list(relation.edges):
+        graph.emit.edge_changed(edge_id, source)
 
 def relation_get_name(relation_id):
     relation = _get_relation(relation_id)
     return relation.name
 
 def relation_set_name(relation_id, name, source="model"):
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
+    _record(relation_set_name, relation_id, relation.name)
     relation.name = name
-    _emit.relation_changed(relation_id, source)
+    _graph().emit.relation_changed(relation_id, source)
 
 def relation_is_visible(relation_id):
     relation = _get_relation(relation_id)
     return relation.is_visible()
 
+def relation_set_visible(relation_id, is_visible, symbol=None):
+    relation = _edit_relation(relation_id)
+    symbol = symbol if symbol else relation_id
+    _record_visibility(relation_set_visible, relation, is_visible, symbol)
+    return relation.set_visible(is_visible, symbol)
+
 def relation_is_directed(relation_id):
     relation = _get_relation(relation_id)
     return relation.directed
 
 def relation_set_directed(relation_id, is_directed, source="model"):
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
+    _record(relation_set_directed, relation_id, relation.directed)
     relation.directed = is_directed
-    _emit.relation_changed(relation_id, source)
+    _graph().emit.relation_changed(relation_id, source)
 
 def relation_is_acyclic(relation_id):
     relation = _get_relation(relation_id)
     return relation.acyclic
 
 def relation_set_acyclic(relation_id, is_acyclic, source="model"):
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
+    _record(relation_set_acyclic, relation_id, relation.acyclic)
     relation.acyclic = is_acyclic
-    _emit.relation_changed(relation_id, source)
+    _graph().emit.relation_changed(relation_id, source)
 
 def relation_is_reverse(relation_id):
     relation = _get_relation(relation_id)
     return relation.reverse
 
 def relation_set_reverse(relation_id, is_reverse, source="model"):
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
+    _record(relation_set_reverse, relation_id, relation.reverse)
     relation.reverse = is_reverse
-    _emit.relation_changed(relation_id, source)
+    _graph().emit.relation_changed(relation_id, source)
 
 def relation_get_max_innodes(relation_id):
     relation = _get_relation(relation_id)
     return relation.max_innodes
 
 def relation_set_max_innodes(relation_id, max_innodes, source="model"):
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
+    _record(relation_set_max_innodes, relation_id, relation.max_innodes)
     relation.max_innodes = max_innodes
-    _emit.relation_changed(relation_id, source)
+    _graph().emit.relation_changed(relation_id, source)
 
 def relation_get_max_outnodes(relation_id):
     relation = _get_relation(relation_id)
     return relation.max_outnodes
 
 def relation_set_max_outnodes(relation_id, max_outnodes, source="model"):
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
+    _record(relation_set_max_outnodes, relation_id, relation.max_outnodes)
     relation.max_outnodes = max_outnodes
-    _emit.relation_changed(relation_id, source)
+    _graph().emit.relation_changed(relation_id, source)
 
 def relation_get_on_add_handler(relation_id):
     relation = _get_relation(relation_id)
     return relation.on_add
 
 def relation_set_on_add_handler(relation_id, on_add, source="model"):
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
+    _record(relation_set_on_add_handler, relation_id, relation.on_add)
     relation.on_add = on_add
-    _emit.relation_changed(relation_id, source)
+    _graph().emit.relation_changed(relation_id, source)
 
 def relation_get_on_delete_handler(relation_id):
     relation = _get_relation(relation_id)
     return relation.on_delete
 
 def relation_set_on_delete_handler(relation_id, on_delete, source="model"):
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
+    _record(relation_set_on_delete_handler, relation_id, relation.on_delete)
     relation.on_delete = on_delete
-    _emit.relation_changed(relation_id, source)
+    _graph().emit.relation_changed(relation_id, source)
 
 def relation_delete_edges(relation_id):
-    for edge_id in relation_get_edges(relation_id):
+    relation = _get_relation(relation_id)
+    for edge_id in list(relation.edges):
         edge_delete(edge_id)
 
 def relation_roots(relation_id):
@@ -710,7 +880,7 @@ def relation_is_tree(relation_id):
 
 # Edges
 
-class Edge(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
+class Edge(Entity, event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
     def __init__(self, id, relation_id, src_id, dst_id, suppressors=set()):
         event.Emitter.__init__(self)
         VisibilitySuppressor.__init__(self, suppressors)
@@ -723,7 +893,7 @@ class Edge(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
         return []
     
     def visibility_changed(self):
-        _emit.edge_changed(self.id, "model")
+        _graph().emit.edge_changed(self.id, "model")
 
     def to_dict(self):
         return {
@@ -741,68 +911,90 @@ class Edge(event.Emitter, VisibilitySuppressor, metaclass=TypeRepr):
         return edge
 
 def edge_new(relation_id, srcid, dstid, source="model"):
-    relation = _get_relation(relation_id)
-    edge_id = make_id()
+    graph = _graph()
+    relation = _edit_relation(relation_id)
+    edge_id = make_id(Edge)
     edge = Edge(edge_id, relation_id, srcid, dstid, relation.suppressors())
-    _edge_connect(relation_id, srcid, dstid, edge_id)
+    try:
+        _edge_connect(relation_id, srcid, dstid, edge_id)
+    except RelationException:
+        graph.ids.release(edge_id)
+        raise
     if not relation.directed:
         try:
             _edge_connect(relation_id, dstid, srcid, edge_id)
         except RelationException as exception:
-            _edge_disconnect(relation_id, srcid, dstid, source)
+            _edge_disconnect(relation, srcid, dstid, source)
+            graph.ids.release(edge_id)
             raise exception
     
     _edge_update_forest(relation_id, srcid)
     _edge_update_forest(relation_id, dstid)
     
-    __type_id_map[Edge].add(edge_id)
-    __id_entity_map[edge_id] = edge
-    _emit.edge_created(edge_id, source)
+    relation.edges = relation.edges.add(edge_id, graph.owner)
+    _store(edge)
+    _record(_edge_remove, edge_id)
+    graph.emit.edge_created(edge_id, source)
     try:
         lang.eval(lang.read(relation.on_add))(edge_id)
     except Exception as e:
-        log.error(e.message)
+        log.error("On Add handler of %s failed: %s", relation.name, e)
     return edge_id
 
 def _edge_update_forest(relation_id, object_id):
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
     nodes = object_get_innodes if relation.reverse else object_get_outnodes
     if len(nodes(object_id, relation_id)) == 0:
-        relation.forest.append(object_id)
-    elif object_id in relation.forest:
-        relation.forest.remove(object_id)
+        relation.forest = relation.forest.add(object_id, _graph().owner)
+    else:
+        relation.forest = relation.forest.discard(object_id, _graph().owner)
 
-def _edge_connect(relation_id, srcid, dstid, edge_id, source="model"):
-    relation = _get_relation(relation_id)
-    outnodes = relation.outnodes.get(srcid, {})
-    innodes = relation.innodes.get(dstid, {})
-    if len(outnodes) == relation.max_outnodes:
-        raise RelationException(srcid, dstid, relation.name, "Can't add more outnodes.")
+def _adjacency_add(nodes, object_id, adjacent_id, edge_id, owner):
+    return nodes.set(object_id, nodes.get(object_id, pmap.EMPTY_MAP).set(adjacent_id, edge_id, owner), owner)
+
+def _adjacency_remove(nodes, object_id, adjacent_id, owner):
+    edge_ids = nodes[object_id].delete(adjacent_id, owner)
+    return nodes.set(object_id, edge_ids, owner) if edge_ids else nodes.delete(object_id, owner)
+
+def _edge_connect(relation_id, srcid, dstid, edge_id, source="model", check=True):
+    graph = _graph()
+    relation = _edit_relation(relation_id)
+    if check:
+        _edge_check(relation, srcid, dstid)
+
+    # TODO: Restrict the relation to certain types of objects.
     
-    if len(innodes) == relation.max_innodes:
-        raise RelationException(srcid, dstid, relation.name, "Can't add more innodes.")
+    source_object = _edit_object(srcid)
+    relation.outnodes = _adjacency_add(relation.outnodes, srcid, dstid, edge_id, graph.owner)
+    _object_index_edge(source_object, relation_id, edge_id)
+    graph.emit.object_changed(srcid, source)
     
-    if relation.acyclic and has_path(dstid, srcid, relation_id):
-        raise RelationException(srcid, dstid, relation.name, "Relation is acyclic.")
+    dest_object = _edit_object(dstid)
+    relation.innodes = _adjacency_add(relation.innodes, dstid, srcid, edge_id, graph.owner)
+    _object_index_edge(dest_object, relation_id, edge_id)
+    graph.emit.object_changed(dstid, source)
 
-    # TODO: Restrict the relation to certain types of objects.
+def _edge_check(relation, srcid, dstid):
+    if len(relation.outnodes.get(srcid, pmap.EMPTY_MAP)) == relation.max_outnodes:
+        raise RelationException(srcid, dstid, relation.name, "Can't add more outnodes.")
     
-    source_object = _get_object(srcid)
-    outnodes[dstid] = edge_id
-    relation.outnodes[srcid] = outnodes
-    _emit.object_changed(srcid, source)
+    if len(relation.innodes.get(dstid, pmap.EMPTY_MAP)) == relation.max_innodes:
+        raise RelationException(srcid, dstid, relation.name, "Can't add more innodes.")
     
-    dest_object = _get_object(dstid)
-    innodes[srcid] = edge_id
-    relation.innodes[dstid] = innodes
-    _emit.object_changed(dstid, source)
+    if relation.acyclic and has_path(dstid, srcid, relation.id):
+        raise RelationException(srcid, dstid, relation.name, "Relation is acyclic.")
 
 def edge_delete(edge_id, source="model"):
+    _edge_remove(edge_id, source, run_handler=True)
+
+def _edge_remove(edge_id, source="model", run_handler=False):
+    graph = _graph()
     edge = _get_edge(edge_id)
     relation_id = edge.relation_id
-    relation = _get_relation(relation_id)
+    relation = _edit_relation(relation_id)
     srcid = edge.src_id
     dstid = edge.dst_id
+    _record(_edge_restore, edge)
 
     _edge_disconnect(relation, srcid, dstid, source)
     if not relation.directed:
@@ -810,29 +1002,45 @@ def edge_delete(edge_id, source="model"):
     _edge_update_forest(relation_id, srcid)
     _edge_update_forest(relation_id, dstid)
 
-    _emit.edge_deleted(edge_id, source)
-    try:
-        lang.eval(lang.read(relation.on_delete))(edge_id)
-    except Exception as e:
-        log.error(e.message)
-    __type_id_map[Edge].remove(edge_id)
-    del __id_entity_map[edge_id]
+    graph.emit.edge_deleted(edge_id, source)
+    if run_handler:
+        try:
+            lang.eval(lang.read(relation.on_delete))(edge_id)
+        except Exception as e:
+            log.error("On Delete handler of %s failed: %s", relation.name, e)
+    relation.edges = relation.edges.discard(edge_id, graph.owner)
+    _forget(edge_id)
+
+def _edge_restore(edge):
+    "Reconnects a deleted edge without checking the relation's constraints or running its handlers."
+    graph = _graph()
+    relation = _edit_relation(edge.relation_id)
+    _edge_connect(edge.relation_id, edge.src_id, edge.dst_id, edge.id, check=False)
+    if not relation.directed:
+        _edge_connect(edge.relation_id, edge.dst_id, edge.src_id, edge.id, check=False)
+    _edge_update_forest(edge.relation_id, edge.src_id)
+    _edge_update_forest(edge.relation_id, edge.dst_id)
+    relation.edges = relation.edges.add(edge.id, graph.owner)
+    edge = _restore(edge)
+    _record(_edge_remove, edge.id)
+    graph.emit.edge_created(edge.id, "model")
 
 def _edge_disconnect(relation, srcid, dstid, source):
-    del relation.outnodes[srcid][dstid]
-    if not relation.outnodes[srcid]:
-        del relation.outnodes[srcid]
-    _emit.object_changed(srcid, source)
+    graph = _graph()
+    edge_id = relation.outnodes[srcid][dstid]
+    relation.outnodes = _adjacency_remove(relation.outnodes, srcid, dstid, graph.owner)
+    _object_unindex_edge(_edit_object(srcid), relation.id, edge_id)
+    graph.emit.object_changed(srcid, source)
 
-    del relation.innodes[dstid][srcid]
-    if not relation.innodes[dstid]:
-        del relation.innodes[dstid]
-    _emit.object_changed(dstid, source)
+    relation.innodes = _adjacency_remove(relation.innodes, dstid, srcid, graph.owner)
+    _object_unindex_edge(_edit_object(dstid), relation.id, edge_id)
+    graph.emit.object_changed(dstid, source)
 
 _get_edge = _make_type_getter(Edge)
+_edit_edge = _make_type_editor(Edge)
 
 def get_edges():
-    return list(__type_id_map[Edge])
+    return list(_graph().types[Edge])
 
 def edge_get_relation(edge_id):
     edge = _get_edge(edge_id)
@@ -856,7 +1064,7 @@ def edge_get_color(edge_id):
 
 # Object Filters
 
-class ObjectFilter(object, metaclass=TypeRepr):
+class ObjectFilter(Entity, metaclass=TypeRepr):
     def __init__(self, id, name, code, predicate):
         self.id = id
         self.name = name
@@ -878,20 +1086,27 @@ class ObjectFilter(object, metaclass=TypeRepr):
         return edge
 
 def object_filter_new(title, code, source="model"):
-    filter_id = make_id()
+    graph = _graph()
+    filter_id = make_id(ObjectFilter)
     predicate = lang.eval(lang.read(code))
     filter = ObjectFilter(filter_id, title, code, predicate)
-    __id_entity_map[filter_id] = filter
-    __type_id_map[ObjectFilter].add(filter_id)
-    _emit.object_filter_created(filter_id, source)
+    _store(filter)
+    _record(object_filter_delete, filter_id)
+    graph.emit.object_filter_created(filter_id, source)
     return filter_id
 
 _get_object_filter = _make_type_getter(ObjectFilter)
 
 def object_filter_delete(object_filter_id, source="model"):
-    _emit.object_filter_deleted(object_filter_id, source)
-    __type_id_map[ObjectFilter].remove(object_filter_id)
-    del __id_entity_map[object_filter_id]
+    graph = _graph()
+    _record(_object_filter_restore, _get_object_filter(object_filter_id))
+    graph.emit.object_filter_deleted(object_filter_id, source)
+    _forget(object_filter_id)
+
+def _object_filter_restore(filter):
+    filter = _restore(filter)
+    _record(object_filter_delete, filter.id)
+    _graph().emit.object_filter_created(filter.id, "model")
 
 def object_filter_get_name(object_filter_id):
     filter = _get_object_filter(object_filter_id)
@@ -902,7 +1117,7 @@ def object_filter_get_predicate(object_filter_id):
     return filter.predicate
 
 def get_object_filters():
-    return list(__type_id_map[ObjectFilter])
+    return list(_graph().types[ObjectFilter])
 
 # Event Handling
 #
@@ -936,16 +1151,13 @@ def _reload_super_delegate_handler(self, source):
 _event_handler_map = {e : _make_super_delegate_handler(e) for e in _event_handler_names}
 _event_handler_map["reload"] = _reload_super_delegate_handler
 _event_handler_map["__init__"] = _super_delegate_init
-__SuperDelegate = type("__SuperDelegate", (Delegate,), _event_handler_map)
-
-__delegates = set()
-_emit = __SuperDelegate(__delegates)
+_SuperDelegate = type("__SuperDelegate", (Delegate,), _event_handler_map)
 
 def add_delegate(delegate: Delegate):
-    __delegates.add(delegate)
+    _graph().delegates.add(delegate)
 
 def remove_delegate(delegate: Delegate):
-    __delegates.remove(delegate)
+    _graph().delegates.remove(delegate)
 
 # Helper Functions
 
@@ -967,19 +1179,139 @@ def has_path(source_id, dest_id, *relation_ids):
 
 # Top-Level Model Data Structures
 
-__id_entity_map = {}
-__type_id_map = {
-    Class: [],
-    Edge: set(),
-    Object: set(),
-    Relation: [],
-    ObjectFilter: set(),
-    Field: set(),
-    Member: set(),
-}
+class Graph(object):
+    """A document: its entities, ID allocator, delegates and lang environment.
+
+    The module-level functions operate on the current graph of the calling
+    thread, which is the default graph unless another one has been entered
+    with a `with` statement. Calling a model function as a method of a graph,
+    e.g. `graph.object_new(class_id)`, runs it with that graph entered, so
+    graphs can be used side by side or from separate threads.
+
+    Entities are kept in persistent maps (see pmap), so a graph can share
+    them with its snapshots. The graph changes in place only the entities
+    and map nodes carrying its owner token, and copies any others first."""
+    def __init__(self):
+        self.entities = pmap.EMPTY_MAP
+        self.types = {
+            Class: [],
+            Edge: pmap.EMPTY_SET,
+            Object: pmap.EMPTY_SET,
+            Relation: [],
+            ObjectFilter: pmap.EMPTY_SET,
+            Field: pmap.EMPTY_SET,
+            Member: pmap.EMPTY_SET,
+        }
+        self.ids = ids.IdAllocator()
+        self.delegates = set()
+        self.emit = _SuperDelegate(self.delegates)
+        self._env = None
+        self.lock = rwlock.RWLock()
+        self.owner = object()
+        self.history = history.History()
+
+    @property
+    def env(self):
+        # Made on first use: the default graph is made while lang, which
+        # imports this module, may not have defined Env yet
+        if self._env is None:
+            self._env = lang.Env(outer=lang.global_env)
+        return self._env
+
+    @env.setter
+    def env(self, env):
+        self._env = env
+
+    def __enter__(self):
+        _previous_graphs.set(_previous_graphs.get() + (_current_graph.get(),))
+        _current_graph.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        previous_graphs = _previous_graphs.get()
+        _current_graph.set(previous_graphs[-1])
+        _previous_graphs.set(previous_graphs[:-1])
+
+    def __getattr__(self, name):
+        if name not in _graph_functions:
+            raise AttributeError(name)
+        fn = getattr(sys.modules[__name__], name)
+        def method(*args, **kwargs):
+            with self:
+                return fn(*args, **kwargs)
+        method.__name__ = name
+        return method
+
+# Each thread starts out with the default graph as its current graph
+_default_graph = Graph()
+_current_graph = contextvars.ContextVar("current_graph", default=_default_graph)
+_previous_graphs = contextvars.ContextVar("previous_graphs", default=())
+
+def _graph():
+    return _current_graph.get()
+
+def get_graph():
+    "Returns the graph the model functions operate on in the calling thread."
+    return _graph()
+
+def get_env():
+    "Returns the lang environment of the current graph."
+    return _graph().env
 
 def _get_entity(entity_id):
-    return __id_entity_map[entity_id]
+    return _graph().entities[entity_id]
+
+def _edit_entity(entity_id):
+    "Returns an entity that may be changed in place, replacing it with a copy if it is shared."
+    graph = _graph()
+    entity = graph.entities[entity_id]
+    if entity.owner is not graph.owner:
+        entity = entity.copy(graph.owner)
+        graph.entities = graph.entities.set(entity_id, entity, graph.owner)
+    return entity
+
+def _store(entity, position=None):
+    "Adds a new entity to the current graph."
+    graph = _graph()
+    entity.owner = graph.owner
+    graph.entities = graph.entities.set(entity.id, entity, graph.owner)
+    entity_ids = graph.types[type(entity)]
+    if type(entity_ids) == list:
+        entity_ids.insert(len(entity_ids) if position is None else position, entity.id)
+    else:
+        graph.types[type(entity)] = entity_ids.add(entity.id, graph.owner)
+
+def _forget(entity_id):
+    graph = _graph()
+    entity_type = type(graph.entities[entity_id])
+    entity_ids = graph.types[entity_type]
+    if type(entity_ids) == list:
+        entity_ids.remove(entity_id)
+    else:
+        graph.types[entity_type] = entity_ids.remove(entity_id, graph.owner)
+    graph.entities = graph.entities.delete(entity_id, graph.owner)
+    graph.ids.release(entity_id)
+
+def _restore(entity, position=None):
+    "Puts a deleted entity back into the current graph under its old ID."
+    graph = _graph()
+    if entity.owner is not graph.owner:
+        entity = entity.copy(graph.owner)
+    graph.ids.add(type(entity), entity.id)
+    _store(entity, position)
+    return entity
+
+def get_slot(entity_id):
+    "Returns the slot of an entity: a small index, unique within its type, that is reused after deletion."
+    return _graph().ids.slot(entity_id)
+
+def get_slot_capacity(entity_type):
+    "Returns one more than the highest slot ever used by entities of a type."
+    return _graph().ids.capacity(entity_type)
+
+def get_slot_entity(entity_type, slot):
+    "Returns the ID of the entity of a type in a slot, or None."
+    return _graph().ids.slot_id(entity_type, slot)
 
 def delete(entity_id):
     entity = _get_entity(entity_id)
@@ -996,14 +1328,17 @@ def delete(entity_id):
     type_delete_map[entity_type](entity_id)
 
 def reset():
-    for type, v in __type_id_map.items():
-        if type == Member:
-            continue
-        for entity_id in list(v):
-            delete(entity_id)
-    for type, v in __type_id_map.items():
+    graph = _graph()
+    with graph.history.paused():
+        for type, v in graph.types.items():
+            if type == Member:
+                continue
+            for entity_id in list(v):
+                delete(entity_id)
+    graph.history.clear()
+    for type, v in graph.types.items():
         assert len(v) == 0
-    assert len(__id_entity_map) == 0
+    assert len(graph.entities) == 0
 
 # Types
 
@@ -1030,21 +1365,282 @@ class Bool(object, metaclass=TypeRepr):
 # Saving and Loading
 
 def _model():
+    graph = _graph()
     return {
         "version": "0.1.0",
-        "id_entity_map": {id: object.to_dict() for id, object in __id_entity_map.items()},
-        "type_id_map": dict(__type_id_map),
+        "next_id": graph.ids.next_id,
+        "id_entity_map": {id: object.to_dict() for id, object in graph.entities.items()},
+        "type_id_map": {t: list(v) if type(v) == list else set(v) for t, v in graph.types.items()},
     }
 
-def write(file):
-    file.write(repr(_model()))
-
-def read(file):
+def _compact(data):
+    "Returns a copy of saved model data with its IDs renumbered from 1, in their original order."
+    id_map = ids.compaction_map(data["id_entity_map"])
+    def symbols(suppressors):
+        # Suppressors are usually entity IDs, but lang code may use any symbol
+        return {id_map.get(s, s) if type(s) == int else s for s in suppressors}
+    def nodes(adjacency):
+        return {id_map[a]: {id_map[b]: id_map[e] for b, e in edges.items()} for a, edges in adjacency.items()}
+    remap = {
+        Class: lambda d: dict(d, fields=[id_map[i] for i in d["fields"]], objects={id_map[i] for i in d["objects"]}),
+        Object: lambda d: dict(d, class_id=id_map[d["class_id"]], members=[id_map[i] for i in d["members"]],
+                               suppressors=symbols(d["suppressors"])),
+        Field: lambda d: dict(d, class_id=id_map[d["class_id"]]),
+        Member: lambda d: dict(d, field=id_map[d["field"]]),
+        Relation: lambda d: dict(d, innodes=nodes(d["innodes"]), outnodes=nodes(d["outnodes"]),
+                                 forest=[id_map[i] for i in d["forest"] if i in id_map], edges={id_map[i] for i in d["edges"]}),
+        Edge: lambda d: dict(d, relation_id=id_map[d["relation_id"]], src_id=id_map[d["src_id"]],
+                             dst_id=id_map[d["dst_id"]], suppressors=symbols(d["suppressors"])),
+        ObjectFilter: lambda d: dict(d),
+    }
+    id_entity_map = {}
+    for id, d in data["id_entity_map"].items():
+        d = remap[d["type"]](d)
+        d["id"] = id_map[id]
+        id_entity_map[id_map[id]] = d
+    return dict(
+        data,
+        next_id=len(id_map) + 1,
+        id_entity_map=id_entity_map,
+        type_id_map={t: type(v)(id_map[i] for i in v) for t, v in data["type_id_map"].items()},
+    )
+
+def write(file, compact=False):
+    """Writes the model to a file. With compact, the saved IDs are renumbered
+    consecutively from 1; the IDs of the entities in memory don't change."""
+    data = _model()
+    if compact:
+        data = _compact(data)
+    file.write(repr(data))
+
+def _reporting(items, total, progress, every=1000):
+    "Yields items, calling progress with the count so far and total every so many."
+    for count, item in enumerate(items):
+        if progress and not count % every:
+            progress(count, total)
+        yield item
+
+def _load(data, progress=None):
+    graph = _graph()
+    id_entity_map = data["id_entity_map"]
+    total = len(id_entity_map) + len(data["type_id_map"].get(Edge, ()))
+    graph.entities = pmap.PMap(_reporting(
+        ((id, o['type'].from_dict(o)) for id, o in id_entity_map.items()), total, progress))
+    graph.types = {t: list(v) if type(v) == list else pmap.PSet(v) for t, v in data["type_id_map"].items()}
+    graph.ids = ids.IdAllocator(data.get("next_id", 1))
+    for entity in graph.entities.values():
+        entity.owner = graph.owner
+    for entity_type, entity_ids in graph.types.items():
+        for entity_id in (entity_ids if type(entity_ids) == list else sorted(entity_ids)):
+            graph.ids.add(entity_type, entity_id)
+    # The incident edge index isn't saved; rebuild it from the edges.
+    edge_ids = _reporting(graph.types[Edge], total, progress and (lambda count, total: progress(
+        len(id_entity_map) + count, total)))
+    for edge_id in edge_ids:
+        edge = _get_edge(edge_id)
+        _object_index_edge(_get_object(edge.src_id), edge.relation_id, edge_id)
+        _object_index_edge(_get_object(edge.dst_id), edge.relation_id, edge_id)
+    if progress:
+        progress(total, total)
+
+def load(file, progress=None):
+    """Returns a new graph holding the document in a file, leaving the
+    current graph alone, so a worker thread can load a document while the
+    current one is in use; see replace(). progress is called now and then
+    with the number of entities loaded so far and the total."""
     data = eval(file.read())
     # TODO: Switch on data version
-    reset()
-    global __id_entity_map
-    __id_entity_map = {id: o['type'].from_dict(o) for id, o in data["id_entity_map"].items()}
-    global __type_id_map
-    __type_id_map = data["type_id_map"]
-    _emit.reload("model")
\ No newline at end of file
+    graph = Graph()
+    with graph:
+        _load(data, progress)
+    return graph
+
+def replace(graph):
+    """Makes the current graph hold the document of another graph, e.g. one
+    returned by load(), and clears the history. Delegates get a single
+    reload instead of a deletion for each entity of the old document. The
+    current graph keeps its delegates and takes over the other graph's lang
+    environment, where the document's filters and definitions were
+    evaluated; the other graph stays valid with a copy of it."""
+    current = _graph()
+    current.entities = graph.entities
+    current.types = {t: list(v) if type(v) == list else v for t, v in graph.types.items()}
+    current.ids = graph.ids.fork()
+    # Take over what the other graph owned, and leave it to copy on write
+    current.owner = graph.owner
+    graph.owner = object()
+    current.env = graph.env
+    graph.env = lang.Env(outer=lang.global_env)
+    graph.env.update(current.env)
+    current.history.clear()
+    current.emit.reload("model")
+
+def read(file):
+    replace(load(file))
+
+def snapshot():
+    """Returns a copy of the current graph in constant time.
+
+    The copy shares its entities with the original, and whichever of the two
+    changes an entity afterwards changes a copy of it. The copy has no
+    delegates. It can be read from a worker thread, e.g. `with snapshot:` or
+    `snapshot.get_objects()`, while the original is edited, or be edited
+    itself to try out changes. Taking a snapshot from another thread than the
+    one editing the graph requires concurrent mode, and a snapshot must not
+    be taken by a delegate or lang handler while the model is being changed."""
+    graph = _graph()
+    # The write lock, since the owner token is swapped: writers edit in
+    # place whatever carries the token
+    with graph.lock.write():
+        copy_graph = Graph()
+        copy_graph.entities = graph.entities
+        copy_graph.types = {t: list(v) if type(v) == list else v for t, v in graph.types.items()}
+        copy_graph.ids = graph.ids.fork()
+        copy_graph.env.update(graph.env)
+        # Everything the graph owned so far is shared now
+        graph.owner = object()
+    return copy_graph
+
+# Undo
+#
+# Every change records a compact inverse operation in the current graph's
+# history: setters record the old value, deletions the deleted entities and
+# creations the ID to delete. Each call of a public function from outside
+# the model forms one undo step, unless it is made inside undo_group().
+# Inverses reuse the IDs of the entities they restore and run no relation
+# handlers; the changes those handlers made are undone separately.
+
+def _record(fn, *args):
+    _graph().history.record(fn, args)
+
+def _record_visibility(fn, entity, is_visible, symbol):
+    # Showing an entity hidden by another symbol, or hiding it twice, doesn't change it
+    if (symbol in entity.suppressors()) == is_visible:
+        _record(fn, entity.id, not is_visible, symbol)
+
+_grouped_functions = {
+    "class_new", "class_delete", "class_set_name", "class_set_visible", "class_set_color", "class_set_image",
+    "class_add_field", "object_new", "object_delete", "object_delete_edges", "object_set_name", "object_set_image",
+    "object_set_visible",
+    "field_set_name", "field_set_initial_value", "field_set_type", "field_delete", "member_set_value",
+    "relation_new", "relation_delete", "relation_set_color", "relation_set_name", "relation_set_visible",
+    "relation_set_directed", "relation_set_acyclic", "relation_set_reverse", "relation_set_max_innodes",
+    "relation_set_max_outnodes", "relation_set_on_add_handler", "relation_set_on_delete_handler",
+    "relation_delete_edges", "edge_new", "edge_delete", "object_filter_new", "object_filter_delete", "delete",
+}
+
+def _make_grouped(fn):
+    @functools.wraps(fn)
+    def grouped(*args, **kwargs):
+        history = _graph().history
+        history.begin()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            history.end()
+    return grouped
+
+for _name in _grouped_functions:
+    globals()[_name] = _make_grouped(globals()[_name])
+
+def undo_group(name=None):
+    """Returns a context manager that makes the changes in its with block
+    one undo step, e.g. `with model.undo_group("Delete Objects"):`."""
+    return _graph().history.group(name)
+
+def undo():
+    "Reverts the last undo step; returns False if there is none."
+    return _graph().history.undo()
+
+def redo():
+    "Reapplies the last undo step undone; returns False if there is none."
+    return _graph().history.redo()
+
+def can_undo():
+    return _graph().history.can_undo()
+
+def can_redo():
+    return _graph().history.can_redo()
+
+def undo_name():
+    "Returns the name given to the undo step undo() would revert, or None."
+    return _graph().history.undo_name()
+
+def redo_name():
+    return _graph().history.redo_name()
+
+def set_undo_limit(limit):
+    "Sets the number of undo steps kept."
+    _graph().history.set_limit(limit)
+
+def clear_history():
+    _graph().history.clear()
+
+# Concurrency
+#
+# By default the model is used from a single thread and takes no locks. In
+# concurrent mode every mutating function is replaced by one that holds the
+# current graph's write lock, so other threads may take snapshots while the
+# graph is edited.
+
+_mutating_functions = _grouped_functions | {
+    "add_delegate", "remove_delegate", "reset", "read", "replace", "undo", "redo", "set_undo_limit", "clear_history",
+}
+_unlocked_functions = {}
+
+def _make_locked(fn):
+    @functools.wraps(fn)
+    def locked(*args, **kwargs):
+        with _graph().lock.write():
+            return fn(*args, **kwargs)
+    return locked
+
+def set_concurrent(is_concurrent):
+    if is_concurrent == bool(_unlocked_functions):
+        return
+    # Instrumentation wraps the module functions too; take it out while
+    # swapping them so it times the right ones.
+    was_instrumented = is_instrumented()
+    set_instrumented(False)
+    module = globals()
+    for name in _mutating_functions:
+        if is_concurrent:
+            _unlocked_functions[name] = module[name]
+            module[name] = _make_locked(module[name])
+        else:
+            module[name] = _unlocked_functions.pop(name)
+    set_instrumented(was_instrumented)
+
+def is_concurrent():
+    return bool(_unlocked_functions)
+
+# Instrumentation
+#
+# Opt-in call counts and latency histograms for the public model functions,
+# delegate dispatch and the lang reader and evaluator.
+
+_graph_functions = {
+    name for name, value in globals().items()
+    if type(value) == types.FunctionType and value.__module__ == __name__ and not name.startswith("_")
+}
+_graph_functions -= {"get_graph", "get_env", "set_concurrent", "is_concurrent"}
+
+_instrumentation = _stats.Instrumentation()
+for _name in sorted(_graph_functions):
+    _instrumentation.add_target(sys.modules[__name__], _name)
+for _name in _event_handler_names + ["reload"]:
+    _instrumentation.add_target(_SuperDelegate, _name, "delegate." + _name)
+_instrumentation.add_target(lang, "eval", "lang.eval")
+_instrumentation.add_target(lang, "read", "lang.read")
+
+def set_instrumented(is_instrumented):
+    _instrumentation.set_enabled(is_instrumented)
+
+def is_instrumented():
+    return _instrumentation.enabled
+
+def stats():
+    return _instrumentation.stats()
+
+def reset_stats():
+    _instrumentation.reset()
@@ -0,0 +1,284 @@
+"""Persistent maps and sets keyed by non-negative integers, e.g. entity IDs.
+
+A PMap is a radix trie with small dicts for leaves: set() and delete()
+return a new map that shares everything but the path to the changed key
+with the old one, so the old map stays valid and unchanged. Updates may
+pass an owner token; nodes created under a token are updated in place by
+later updates passing the same token instead of being copied again, and
+such updates may return the map they were called on. An owner must switch
+to a new token once its maps are shared, e.g. by a snapshot. A PSet is a
+PMap of its elements."""
+
+_BITS = 8
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+
+# A map whose root is a leaf holds at most _WIDTH keys of any size. Larger
+# maps have branch nodes: the children of a branch at a given shift are
+# indexed by the key bits at that shift, and the leaves at the bottom hold
+# keys that differ only in their lowest _BITS bits.
+
+class _Leaf(dict):
+    __slots__ = ("owner",)
+
+class _Branch(list):
+    __slots__ = ("owner",)
+
+def _leaf(items, owner):
+    leaf = _Leaf(items)
+    leaf.owner = owner
+    return leaf
+
+def _branch(children, owner):
+    branch = _Branch(children)
+    branch.owner = owner
+    return branch
+
+def _editable_leaf(leaf, owner):
+    return leaf if owner is not None and leaf.owner is owner else _leaf(leaf, owner)
+
+def _editable_branch(branch, owner):
+    return branch if owner is not None and branch.owner is owner else _branch(branch, owner)
+
+def _child(branch, index, make, owner):
+    "Returns an editable child of an editable branch, adding it if missing."
+    if index >= len(branch):
+        branch.extend([None] * (index + 1 - len(branch)))
+    child = branch[index]
+    if child is None:
+        child = make((), owner)
+    elif owner is None or child.owner is not owner:
+        child = make(child, owner)
+    branch[index] = child
+    return child
+
+def _split(leaf, owner):
+    "Returns a branch holding the keys of a full root leaf, and its shift."
+    if owner is None:
+        owner = object()
+    shift = _BITS
+    while max(leaf) >> shift >= _WIDTH:
+        shift += _BITS
+    root = _branch((), owner)
+    for key, value in leaf.items():
+        node = root
+        level = shift
+        while level > _BITS:
+            node = _child(node, (key >> level) & _MASK, _branch, owner)
+            level -= _BITS
+        _child(node, (key >> level) & _MASK, _leaf, owner)[key] = value
+    return root, shift
+
+def _iter_items(node, shift):
+    if shift == _BITS:
+        for leaf in node:
+            if leaf is not None:
+                yield from leaf.items()
+    else:
+        for child in node:
+            if child is not None:
+                yield from _iter_items(child, shift - _BITS)
+
+_MISSING = object()
+_EMPTY_LEAF = _leaf((), None)
+
+class _Trie(object):
+    __slots__ = ("_root", "_shift", "_count")
+
+    def __init__(self, items):
+        self._root = _EMPTY_LEAF
+        self._shift = 0
+        self._count = 0
+        owner = object()
+        for key, value in items:
+            trie = self._set(key, value, owner)
+            self._root, self._shift, self._count = trie._root, trie._shift, trie._count
+
+    def _get(self, key, default=None):
+        node = self._root
+        shift = self._shift
+        if shift:
+            if key >> shift >= _WIDTH:
+                return default
+            while shift:
+                index = (key >> shift) & _MASK
+                if index >= len(node):
+                    return default
+                node = node[index]
+                if node is None:
+                    return default
+                shift -= _BITS
+        return node.get(key, default)
+
+    def _updated(self, root, shift, count, owner):
+        if owner is not None and self._root.owner is owner:
+            # Only the owner can reach a trie whose root it owns
+            trie = self
+        else:
+            trie = self.__class__.__new__(self.__class__)
+        trie._root = root
+        trie._shift = shift
+        trie._count = count
+        return trie
+
+    def _set(self, key, value, owner):
+        if key < 0:
+            raise KeyError(key)
+        node = self._root
+        shift = self._shift
+        if owner is not None and node.owner is owner and key >> shift < _WIDTH:
+            # The owner usually owns the whole path, and then updates in place
+            while shift:
+                index = (key >> shift) & _MASK
+                if index >= len(node) or node[index] is None or node[index].owner is not owner:
+                    break
+                node = node[index]
+                shift -= _BITS
+            else:
+                if key in node:
+                    node[key] = value
+                    return self
+                if self._shift or len(node) < _WIDTH:
+                    node[key] = value
+                    self._count += 1
+                    return self
+        old_value = self._get(key, _MISSING)
+        if old_value is value:
+            return self
+        count = self._count + (old_value is _MISSING)
+        root = self._root
+        shift = self._shift
+        if not shift:
+            if old_value is not _MISSING or len(root) < _WIDTH:
+                root = _editable_leaf(root, owner)
+                root[key] = value
+                return self._updated(root, 0, count, owner)
+            root, shift = _split(root, owner)
+        while key >> shift >= _WIDTH:
+            root = _branch([root], owner)
+            shift += _BITS
+        root = node = _editable_branch(root, owner)
+        level = shift
+        while level > _BITS:
+            node = _child(node, (key >> level) & _MASK, _branch, owner)
+            level -= _BITS
+        _child(node, (key >> level) & _MASK, _leaf, owner)[key] = value
+        return self._updated(root, shift, count, owner)
+
+    def _delete(self, key, owner):
+        if self._get(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+        shift = self._shift
+        if not shift:
+            root = _editable_leaf(self._root, owner)
+            del root[key]
+            return self._updated(root, 0, self._count - 1, owner)
+        root = node = _editable_branch(self._root, owner)
+        path = []
+        level = shift
+        while level > _BITS:
+            index = (key >> level) & _MASK
+            path.append((node, index))
+            node = _child(node, index, _branch, owner)
+            level -= _BITS
+        index = (key >> level) & _MASK
+        leaf = _child(node, index, _leaf, owner)
+        del leaf[key]
+        if not leaf:
+            node[index] = None
+            # Unlink branches left empty
+            while path and not any(node):
+                node, index = path.pop()
+                node[index] = None
+        return self._updated(root, shift, self._count - 1, owner)
+
+    def _items(self):
+        if not self._shift:
+            return iter(self._root.items())
+        return _iter_items(self._root, self._shift)
+
+    def __contains__(self, key):
+        return self._get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for key, value in self._items():
+            yield key
+
+class PMap(_Trie):
+    __slots__ = ()
+
+    def __init__(self, items=()):
+        _Trie.__init__(self, items.items() if isinstance(items, dict) else items)
+
+    get = _Trie._get
+
+    def __getitem__(self, key):
+        # Same as _get; inlined because entity lookups are the hottest path
+        node = self._root
+        shift = self._shift
+        if shift:
+            if key >> shift >= _WIDTH:
+                raise KeyError(key)
+            while shift:
+                index = (key >> shift) & _MASK
+                if index >= len(node) or node[index] is None:
+                    raise KeyError(key)
+                node = node[index]
+                shift -= _BITS
+        return node[key]
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for key, value in self._items():
+            yield value
+
+    def items(self):
+        return self._items()
+
+    def set(self, key, value, owner=None):
+        return self._set(key, value, owner)
+
+    def delete(self, key, owner=None):
+        return self._delete(key, owner)
+
+    def discard(self, key, owner=None):
+        return self._delete(key, owner) if key in self else self
+
+    def __eq__(self, other):
+        if not isinstance(other, PMap):
+            return NotImplemented
+        return len(self) == len(other) and all(other.get(key, _MISSING) == value for key, value in self.items())
+
+    def __repr__(self):
+        return "PMap({0})".format(dict(self.items()))
+
+class PSet(_Trie):
+    __slots__ = ()
+
+    def __init__(self, elements=()):
+        _Trie.__init__(self, ((element, True) for element in elements))
+
+    def add(self, element, owner=None):
+        return self._set(element, True, owner)
+
+    def remove(self, element, owner=None):
+        return self._delete(element, owner)
+
+    def discard(self, element, owner=None):
+        return self._delete(element, owner) if element in self else self
+
+    def __eq__(self, other):
+        if isinstance(other, (set, frozenset, PSet)):
+            return len(self) == len(other) and all(element in self for element in other)
+        return NotImplemented
+
+    def __repr__(self):
+        return "PSet({0})".format(set(self))
+
+EMPTY_MAP = PMap()
+EMPTY_SET = PSet()
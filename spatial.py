@@ -0,0 +1,163 @@
+"""A spatial index of the shapes on the canvas, for hit-testing.
+
+The index is a uniform grid of square cells. A box is filed under every
+cell it overlaps, and a line segment only under the cells it passes
+through, so a long diagonal edge doesn't fill the cells of its whole
+bounding box. Queries look at the cells around the query point or area, so
+on a canvas of evenly spread shapes they cost about the same however many
+shapes there are."""
+import math
+
+_BOX = 0
+_SEGMENT = 1
+
+def _segment_distance(x, y, x0, y0, x1, y1):
+    "Returns the distance from (x, y) to the segment from (x0, y0) to (x1, y1)."
+    dx = x1 - x0
+    dy = y1 - y0
+    length2 = dx * dx + dy * dy
+    t = ((x - x0) * dx + (y - y0) * dy) / length2 if length2 else 0.0
+    t = min(1.0, max(0.0, t))
+    return math.hypot(x - (x0 + t * dx), y - (y0 + t * dy))
+
+def _segment_crosses_rect(x0, y0, x1, y1, left, top, right, bottom):
+    "Clips the segment to the rectangle (Liang-Barsky); returns whether anything is left."
+    t0 = 0.0
+    t1 = 1.0
+    dx = x1 - x0
+    dy = y1 - y0
+    for p, q in ((-dx, x0 - left), (dx, right - x0), (-dy, y0 - top), (dy, bottom - y0)):
+        if not p:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                return False
+    return True
+
+class Grid(object):
+    """Boxes and line segments, keyed by any hashable value, filed by the
+    grid cells they touch. Inserting a key again moves its shape."""
+    def __init__(self, cell_size=512.0):
+        self.cell_size = cell_size
+        self._cells = {}   # maps (column, row) to sets of keys
+        self._shapes = {}  # maps keys to (kind, x0, y0, x1, y1, cells)
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __contains__(self, key):
+        return key in self._shapes
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def _box_cells(self, left, top, right, bottom):
+        i0, j0 = self._cell(left, top)
+        i1, j1 = self._cell(right, bottom)
+        return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+
+    def _segment_cells(self, x0, y0, x1, y1):
+        # Steps from cell to cell across whichever cell side the segment
+        # reaches first (Amanatides and Woo)
+        size = self.cell_size
+        i, j = self._cell(x0, y0)
+        i1, j1 = self._cell(x1, y1)
+        dx = x1 - x0
+        dy = y1 - y0
+        step_i = 1 if dx > 0 else -1
+        step_j = 1 if dy > 0 else -1
+        next_x = ((i + (dx > 0)) * size - x0) / dx if dx else math.inf
+        next_y = ((j + (dy > 0)) * size - y0) / dy if dy else math.inf
+        delta_x = size / abs(dx) if dx else math.inf
+        delta_y = size / abs(dy) if dy else math.inf
+        cells = [(i, j)]
+        for step in range(abs(i1 - i) + abs(j1 - j)):
+            if j == j1 or (i != i1 and next_x < next_y):
+                i += step_i
+                next_x += delta_x
+            else:
+                j += step_j
+                next_y += delta_y
+            cells.append((i, j))
+        return cells
+
+    def _file(self, key, shape):
+        self.discard(key)
+        self._shapes[key] = shape
+        cells = self._cells
+        for cell in shape[5]:
+            keys = cells.get(cell)
+            if keys is None:
+                cells[cell] = {key}
+            else:
+                keys.add(key)
+
+    def insert_box(self, key, left, top, right, bottom):
+        self._file(key, (_BOX, left, top, right, bottom, self._box_cells(left, top, right, bottom)))
+
+    def insert_segment(self, key, x0, y0, x1, y1):
+        self._file(key, (_SEGMENT, x0, y0, x1, y1, self._segment_cells(x0, y0, x1, y1)))
+
+    def discard(self, key):
+        shape = self._shapes.pop(key, None)
+        if shape is None:
+            return
+        cells = self._cells
+        for cell in shape[5]:
+            keys = cells[cell]
+            keys.discard(key)
+            if not keys:
+                del cells[cell]
+
+    def _candidates(self, left, top, right, bottom):
+        cells = self._cells
+        candidates = set()
+        for cell in self._box_cells(left, top, right, bottom):
+            keys = cells.get(cell)
+            if keys:
+                candidates.update(keys)
+        return candidates
+
+    def _distance(self, key, x, y):
+        kind, x0, y0, x1, y1, cells = self._shapes[key]
+        if kind == _SEGMENT:
+            return _segment_distance(x, y, x0, y0, x1, y1)
+        return math.hypot(max(x0 - x, 0.0, x - x1), max(y0 - y, 0.0, y - y1))
+
+    def at(self, x, y):
+        "Returns the keys of the boxes containing a point."
+        shapes = self._shapes
+        found = []
+        for key in self._cells.get(self._cell(x, y), ()):
+            kind, x0, y0, x1, y1, cells = shapes[key]
+            if kind == _BOX and x0 <= x <= x1 and y0 <= y <= y1:
+                found.append(key)
+        return found
+
+    def in_rect(self, left, top, right, bottom):
+        "Returns the keys of the shapes overlapping a rectangle."
+        shapes = self._shapes
+        found = []
+        for key in self._candidates(left, top, right, bottom):
+            kind, x0, y0, x1, y1, cells = shapes[key]
+            if kind == _SEGMENT:
+                if _segment_crosses_rect(x0, y0, x1, y1, left, top, right, bottom):
+                    found.append(key)
+            elif x0 <= right and left <= x1 and y0 <= bottom and top <= y1:
+                found.append(key)
+        return found
+
+    def nearest(self, x, y, max_distance):
+        "Returns the key of the shape nearest a point and its distance, or None if none is within max_distance."
+        best = None
+        for key in self._candidates(x - max_distance, y - max_distance, x + max_distance, y + max_distance):
+            distance = self._distance(key, x, y)
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (key, distance)
+        return best
@@ -0,0 +1,122 @@
+import functools
+import threading
+import time
+
+# Latency histogram buckets are powers of two in microseconds: bucket i
+# counts calls that took less than 2**i us (bucket 0 is under 1 us).
+BUCKET_COUNT = 24
+
+def bucket_label(i):
+    "Returns the upper bound of a histogram bucket as a human-readable string."
+    bound = 2 ** i
+    if bound < 1000:
+        return "<{0}us".format(bound)
+    elif bound < 1000000:
+        return "<{0:g}ms".format(bound / 1000)
+    return "<{0:g}s".format(bound / 1000000)
+
+class FunctionStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * BUCKET_COUNT
+        self.calls = threading.local()  # depth: the calling thread's nesting
+
+    def record(self, seconds):
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = min(int(seconds * 1e6).bit_length(), BUCKET_COUNT - 1)
+        self.histogram[bucket] += 1
+
+    def percentile(self, fraction):
+        "Returns the upper bound in seconds of the bucket holding the given fraction of timed calls."
+        timed = sum(self.histogram)
+        if not timed:
+            return 0.0
+        threshold = fraction * timed
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if seen >= threshold:
+                return (2 ** i) / 1e6
+        return self.max
+
+    def to_dict(self):
+        timed = sum(self.histogram)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / timed if timed else 0.0,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "histogram": list(self.histogram),
+        }
+
+def _make_wrapper(fn, stats):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stats.count += 1
+        calls = stats.calls
+        if getattr(calls, "depth", 0):
+            # Recursive calls are counted but timed only by the outermost
+            # call of the same thread.
+            return fn(*args, **kwargs)
+        calls.depth = 1
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats.record(time.perf_counter() - start)
+            calls.depth = 0
+    return wrapper
+
+class Instrumentation(object):
+    """Counts and times calls to a set of functions.
+
+    Targets are attributes of modules or classes. While instrumentation is
+    disabled the original functions are left in place, so there is no
+    overhead; enabling it replaces each target with a timing wrapper."""
+    def __init__(self):
+        self._targets = []
+        self._originals = {}
+        self._stats = {}
+        self.enabled = False
+
+    def add_target(self, owner, attribute, name=None):
+        name = name if name else attribute
+        self._targets.append((owner, attribute, name))
+        self._stats[name] = FunctionStats(name)
+        if self.enabled:
+            self._install(owner, attribute, name)
+
+    def _install(self, owner, attribute, name):
+        fn = owner.__dict__[attribute]
+        self._originals[(owner, attribute)] = fn
+        setattr(owner, attribute, _make_wrapper(fn, self._stats[name]))
+
+    def set_enabled(self, is_enabled):
+        if is_enabled == self.enabled:
+            return
+        if is_enabled:
+            for owner, attribute, name in self._targets:
+                self._install(owner, attribute, name)
+        else:
+            for (owner, attribute), fn in self._originals.items():
+                setattr(owner, attribute, fn)
+            self._originals = {}
+        self.enabled = is_enabled
+
+    def reset(self):
+        for name in self._stats:
+            self._stats[name] = FunctionStats(name)
+        if self.enabled:
+            self.set_enabled(False)
+            self.set_enabled(True)
+
+    def stats(self):
+        "Returns a dict mapping the name of each called target to its statistics."
+        return {name: s.to_dict() for name, s in self._stats.items() if s.count}
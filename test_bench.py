@@ -0,0 +1,38 @@
+from nose.tools import *
+import model
+from bench import graphs
+from bench import suite
+
+@with_setup(teardown=model.reset)
+def test_random_dag_is_reproducible():
+    first = graphs.random_dag(50, seed=7)
+    first_edges = [(model.edge_get_source_object(e), model.edge_get_destination_object(e)) for e in first.edge_ids]
+    first_edges = [(first.object_ids.index(s), first.object_ids.index(d)) for s, d in first_edges]
+    model.reset()
+    second = graphs.random_dag(50, seed=7)
+    second_edges = [(model.edge_get_source_object(e), model.edge_get_destination_object(e)) for e in second.edge_ids]
+    second_edges = [(second.object_ids.index(s), second.object_ids.index(d)) for s, d in second_edges]
+    assert first_edges == second_edges
+
+@with_setup(teardown=model.reset)
+def test_tree_has_one_root():
+    graph = graphs.tree(40, branching=3)
+    relation_id = graph.relation_ids[0]
+    assert 39 == len(graph.edge_ids)
+    roots = [o for o in graph.object_ids if not model.object_get_outnodes(o, relation_id)]
+    assert [graph.object_ids[0]] == roots
+
+@with_setup(teardown=model.reset)
+def test_wide_class_objects_have_a_member_per_field():
+    graph = graphs.wide_class(5, fields=12)
+    assert 12 == len(model.object_get_members(graph.object_ids[0]))
+
+def test_run_reports_every_requested_benchmark():
+    results = suite.run(10, repeat=1, names=["object_new", "filter"])
+    assert ["filter", "object_new"] == sorted(results["results"])
+    assert [] == model.get_objects()
+
+def test_compare_flags_slowdowns_past_threshold():
+    baseline = {"results": {"a": {"best": 1.0}, "b": {"best": 1.0}}}
+    current = {"results": {"a": {"best": 1.1}, "b": {"best": 1.5}, "c": {"best": 9.0}}}
+    assert [("b", 1.0, 1.5)] == suite.compare(current, baseline, threshold=0.2)
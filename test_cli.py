@@ -0,0 +1,72 @@
+from nose.tools import *
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import cli
+import model
+
+def make_document(path):
+    class_id = model.class_new("Task")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    relation_id = model.relation_new("precedes")
+    model.edge_new(relation_id, object_id1, object_id2)
+    with open(path, "w") as fp:
+        model.write(fp)
+    model.reset()
+    return object_id1, object_id2
+
+@with_setup(teardown=model.reset)
+def test_cli_runs_filter_on_loaded_document():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "doc.graph")
+        object_id1, object_id2 = make_document(path)
+        out = io.StringIO()
+        status = cli.main(["cli.py", path, "-f", """
+            (let ((relation-id (find-first (lambda (id) (= (relation-name id) "precedes")) (all-relations))))
+              (lambda (object-id) (zero? (length (innodes object-id relation-id)))))
+        """], out)
+        assert cli.EXIT_SUCCESS == status
+        assert "{0}\tTask\tNew Task\n".format(object_id1) == out.getvalue()
+
+@with_setup(teardown=model.reset)
+def test_cli_runs_actions_in_order():
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, "script.lisp")
+        with open(script, "w") as fp:
+            fp.write("(define x 2)\n(define y (* x 3))\n")
+        out = io.StringIO()
+        status = cli.main(["cli.py", "-e", "(define x 1)", "-s", script, "-e", "(+ x y)"], out)
+        assert cli.EXIT_SUCCESS == status
+        assert "8\n" == out.getvalue()
+
+@with_setup(teardown=model.reset)
+def test_cli_exports_and_saves():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "doc.graph")
+        make_document(path)
+        exported = os.path.join(directory, "doc.json")
+        saved = os.path.join(directory, "copy.graph")
+        status = cli.main(["cli.py", path, "-x", exported, "-o", saved], io.StringIO())
+        assert cli.EXIT_SUCCESS == status
+        with open(exported) as fp:
+            data = json.load(fp)
+        assert 2 == len(data["objects"])
+        assert 1 == len(data["edges"])
+        model.reset()
+        with open(saved) as fp:
+            model.read(fp)
+        assert 1 == len(model.get_edges())
+
+@with_setup(teardown=model.reset)
+def test_cli_reports_failure():
+    status = cli.main(["cli.py", "-x", "doc.unknown"], io.StringIO())
+    assert cli.EXIT_FAILURE == status
+
+def test_cli_does_not_import_qt():
+    code = "import sys, cli; cli.main(['cli.py', '--summary']); assert 'PyQt5' not in sys.modules"
+    directory = os.path.dirname(os.path.abspath(cli.__file__))
+    subprocess.check_call([sys.executable, "-c", code], cwd=directory, stdout=subprocess.DEVNULL)
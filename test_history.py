@@ -0,0 +1,49 @@
+from nose.tools import *
+import history
+
+class Counter(object):
+    def __init__(self, history):
+        self.history = history
+        self.value = 0
+
+    def add(self, amount):
+        with self.history.group():
+            self.history.record(self.add, (-amount,))
+            self.value += amount
+
+def test_undo_and_redo_groups():
+    counter = Counter(history.History())
+    counter.add(1)
+    with counter.history.group("Add Twice"):
+        counter.add(2)
+        counter.add(3)
+    assert "Add Twice" == counter.history.undo_name()
+    assert counter.history.undo()
+    assert 1 == counter.value
+    assert counter.history.redo()
+    assert 6 == counter.value
+    assert not counter.history.can_redo()
+
+def test_new_change_clears_redo():
+    counter = Counter(history.History())
+    counter.add(1)
+    counter.history.undo()
+    assert counter.history.can_redo()
+    counter.add(2)
+    assert not counter.history.can_redo()
+    assert not counter.history.redo()
+
+def test_limit_drops_oldest_groups():
+    counter = Counter(history.History(limit=2))
+    for i in range(3):
+        counter.add(1)
+    assert counter.history.undo()
+    assert counter.history.undo()
+    assert not counter.history.undo()
+    assert 1 == counter.value
+
+def test_paused_records_nothing():
+    counter = Counter(history.History())
+    with counter.history.paused():
+        counter.add(1)
+    assert not counter.history.can_undo()
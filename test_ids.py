@@ -0,0 +1,42 @@
+from nose.tools import *
+import ids
+
+def test_new_ids_are_unique_across_types():
+    allocator = ids.IdAllocator()
+    assert [1, 2, 3] == [allocator.new_id("a"), allocator.new_id("b"), allocator.new_id("a")]
+
+def test_slots_are_dense_per_type():
+    allocator = ids.IdAllocator()
+    a1 = allocator.new_id("a")
+    b1 = allocator.new_id("b")
+    a2 = allocator.new_id("a")
+    assert (0, 0, 1) == (allocator.slot(a1), allocator.slot(b1), allocator.slot(a2))
+    assert 2 == allocator.capacity("a")
+
+def test_released_slot_is_reused_but_id_is_not():
+    allocator = ids.IdAllocator()
+    a1 = allocator.new_id("a")
+    a2 = allocator.new_id("a")
+    allocator.release(a1)
+    assert None == allocator.slot_id("a", 0)
+    a3 = allocator.new_id("a")
+    assert a3 not in (a1, a2)
+    assert 0 == allocator.slot(a3)
+    assert a3 == allocator.slot_id("a", 0)
+    assert 2 == allocator.count("a")
+
+def test_lowest_free_slot_is_reused_first():
+    allocator = ids.IdAllocator()
+    entity_ids = [allocator.new_id("a") for i in range(4)]
+    allocator.release(entity_ids[3])
+    allocator.release(entity_ids[1])
+    assert 1 == allocator.slot(allocator.new_id("a"))
+
+def test_add_resumes_after_highest_id():
+    allocator = ids.IdAllocator()
+    allocator.add("a", 7)
+    allocator.add("a", 3)
+    assert 8 == allocator.new_id("a")
+
+def test_compaction_map_preserves_order():
+    assert {3: 1, 10: 2, 42: 3} == ids.compaction_map([42, 3, 10])
@@ -184,6 +184,14 @@ def test_read_list_nested_elt():
                                 [lang.Symbol("length"), [lang.Symbol("innodes"), lang.Symbol("object-id"), 4]]]]
         assert actual_expr == expected_expr
 
+def test_read_all_reads_each_expression():
+    exprs = list(lang.read_all("(+ 1 2) # comment\n(square 3)"))
+    assert 2 == len(exprs)
+    assert "square" == exprs[1][0]
+
+def test_read_all_empty_input():
+    assert [] == list(lang.read_all(" \n"))
+
 # Evaluator
 
 def test_eq():
@@ -220,3 +228,14 @@ def test_blah():
 
 def test_and():
     assert lang.eval(lang.read("(and 1 2 3 0)")) == False
+
+
+def test_define_evaluates_value():
+    env = lang.Env(outer=lang.global_env)
+    lang.eval(lang.read("(define x (+ 1 2))"), env)
+    assert 3 == lang.eval(lang.read("x"), env)
+
+def test_define_procedure():
+    env = lang.Env(outer=lang.global_env)
+    lang.eval(lang.read("(define (double x) (* x 2))"), env)
+    assert 6 == lang.eval(lang.read("(double 3)"), env)
@@ -0,0 +1,91 @@
+import math
+from nose.tools import *
+import layout
+
+def distance(positions, a, b):
+    (ax, ay), (bx, by) = positions[a], positions[b]
+    return math.hypot(ax - bx, ay - by)
+
+def settle(force_layout, iterations=200):
+    for i in range(iterations):
+        if force_layout.step() < force_layout.min_temperature:
+            break
+    return force_layout.positions()
+
+def test_connected_nodes_end_up_closer():
+    # Two triangles joined by one edge
+    edges = [(1, 2), (2, 3), (3, 1), (4, 5), (5, 6), (6, 4), (3, 4)]
+    start = {i: (100.0 * i, 37.0 * i * i % 300) for i in range(1, 7)}
+    positions = settle(layout.ForceLayout(start, edges))
+    assert distance(positions, 1, 2) < distance(positions, 1, 6)
+    assert distance(positions, 5, 6) < distance(positions, 2, 5)
+
+def test_coincident_nodes_are_spread():
+    positions = layout.ForceLayout({i: (0, 0) for i in range(50)}, []).positions()
+    assert 50 == len(set(positions.values()))
+
+def test_unknown_and_looping_edges_are_ignored():
+    force_layout = layout.ForceLayout({1: (0, 0), 2: (10, 0)}, [(1, 1), (1, 3), (1, 2)])
+    assert [(0, 1)] == force_layout.edges
+
+def test_fixed_nodes_do_not_move():
+    start = {1: (0, 0), 2: (0, 0), 3: (10, 0), 4: (2000, 0)}
+    force_layout = layout.ForceLayout(start, [(1, 3), (3, 4)], fixed=[1, 4])
+    positions = settle(force_layout)
+    assert (0, 0) == positions[1]
+    assert (2000, 0) == positions[4]
+    assert (0, 0) != positions[2]
+    assert 0 < positions[3][0] < 2000
+
+def test_same_seed_gives_same_layout():
+    edges = [(i, i + 1) for i in range(99)]
+    start = {i: (0, 0) for i in range(100)}
+    first = settle(layout.ForceLayout(start, edges, seed=3), 20)
+    second = settle(layout.ForceLayout(start, edges, seed=3), 20)
+    assert first == second
+
+def test_approximation_is_close_to_exact_repulsion():
+    start = {i: ((i * 7919) % 1000, (i * 104729) % 1000) for i in range(300)}
+    approximate = layout.ForceLayout(start, [])
+    exact = layout.ForceLayout(start, [], theta=0.0)
+    afx, afy = approximate._repulsion()
+    efx, efy = exact._repulsion()
+    error = sum(math.hypot(a - e, b - f) for a, b, e, f in zip(afx, afy, efx, efy))
+    total = sum(math.hypot(e, f) for e, f in zip(efx, efy))
+    assert error < 0.05 * total
+
+def test_empty_layout():
+    force_layout = layout.ForceLayout({}, [])
+    assert 0.0 == force_layout.step()
+    assert {} == force_layout.positions()
+
+def test_layers_follow_edges():
+    edges = [(1, 2), (1, 3), (2, 4), (3, 4), (4, 5), (1, 5)]
+    positions = layout.LayeredLayout(edges, [1]).positions()
+    for a, b in edges:
+        assert positions[a][1] < positions[b][1]
+    assert 0 == positions[1][1]
+
+def test_cycles_are_laid_out():
+    edges = [(1, 2), (2, 3), (3, 1), (3, 4)]
+    layered_layout = layout.LayeredLayout(edges, [1])
+    positions = layered_layout.positions()
+    assert [1, 2, 3, 4] == sorted(positions, key=lambda node_id: positions[node_id][1])
+
+def test_trees_have_no_crossings():
+    # Children listed so that the first order crosses
+    edges = [(0, 1), (0, 2), (1, 4), (2, 3), (1, 5), (2, 6)]
+    layered_layout = layout.LayeredLayout(edges, [0])
+    assert 0 == layered_layout.crossings
+
+def test_long_edges_get_dummies():
+    layered_layout = layout.LayeredLayout([(1, 2), (2, 3), (1, 3)], [1])
+    assert 4 == len(layered_layout.layer)
+    assert {1, 2, 3} == set(layered_layout.positions())
+
+def test_nodes_of_a_layer_are_spaced():
+    edges = [(0, i) for i in range(1, 6)]
+    positions = layout.LayeredLayout(edges, [0], node_spacing=100.0).positions()
+    xs = sorted(positions[i][0] for i in range(1, 6))
+    assert all(b - a >= 100.0 - 1e-9 for a, b in zip(xs, xs[1:]))
+    assert abs(positions[0][0] - (xs[0] + xs[-1]) / 2) < 1e-9
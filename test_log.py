@@ -0,0 +1,112 @@
+from nose.tools import *
+import log
+import event
+import os
+import tempfile
+
+class RecordingLogger(object):
+    def __init__(self):
+        self.messages = []
+
+    def error(self, message):
+        self.messages.append(("error", message))
+
+    def warn(self, message):
+        self.messages.append(("warn", message))
+
+    def info(self, message):
+        self.messages.append(("info", message))
+
+    def debug(self, message):
+        self.messages.append(("debug", message))
+
+class ExplodingRepr(object):
+    def __repr__(self):
+        raise AssertionError("formatted a disabled log message")
+
+    __str__ = __repr__
+
+def setup_logger():
+    global logger
+    logger = RecordingLogger()
+    log.set_logger(logger)
+    log.set_log_level(log.Level.INFO)
+
+def teardown_logger():
+    log.set_log_level(log.Level.INFO)
+    log.set_logger(log.TerminalLogger(log.sys.stderr))
+
+@with_setup(setup_logger, teardown_logger)
+def test_enabled_follows_log_level():
+    assert log.enabled(log.Level.INFO)
+    assert not log.enabled(log.Level.DEBUG)
+    log.set_log_level(log.Level.DEBUG)
+    assert log.enabled(log.Level.DEBUG)
+
+@with_setup(setup_logger, teardown_logger)
+def test_disabled_level_is_not_logged():
+    log.debug("%s", ExplodingRepr())
+    assert [] == logger.messages
+
+@with_setup(setup_logger, teardown_logger)
+def test_message_is_formatted_lazily():
+    log.info("%s and %d", "this", 2)
+    level, message = logger.messages[0]
+    assert level == "info"
+    assert message.args == ("this", 2)
+    assert str(message) == "this and 2"
+
+@with_setup(setup_logger, teardown_logger)
+def test_message_without_args_is_not_interpolated():
+    log.info("100%")
+    assert str(logger.messages[0][1]) == "100%"
+
+@with_setup(setup_logger, teardown_logger)
+def test_emit_does_not_format_when_debug_disabled():
+    emitter = event.Emitter()
+    calls = []
+    emitter.add_listener("changed", calls.append)
+    emitter.emit("changed", ExplodingRepr())
+    assert 1 == len(calls)
+    assert [] == logger.messages
+
+@with_setup(setup_logger, teardown_logger)
+def test_emit_logs_when_debug_enabled():
+    log.set_log_level(log.Level.DEBUG)
+    emitter = event.Emitter()
+    emitter.add_listener("changed", lambda arg: None)
+    emitter.emit("changed", 1)
+    assert "debug" == logger.messages[0][0]
+
+# Buffered and file loggers
+
+def test_log_buffer_drains_in_order():
+    buffer = log.LogBuffer(capacity=4)
+    buffer.append("INFO", "a")
+    buffer.append("ERROR", "b")
+    entries, dropped = buffer.drain()
+    assert [("INFO", "a"), ("ERROR", "b")] == entries
+    assert 0 == dropped
+    assert 0 == len(buffer)
+
+def test_log_buffer_drops_oldest_when_full():
+    buffer = log.LogBuffer(capacity=2)
+    for message in "abc":
+        buffer.append("INFO", message)
+    entries, dropped = buffer.drain()
+    assert [("INFO", "b"), ("INFO", "c")] == entries
+    assert 1 == dropped
+
+def test_file_logger_writes_and_rotates():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "graph.log")
+        logger = log.FileLogger(path, max_bytes=10, backup_count=2)
+        logger.info("first message")
+        logger.close()
+        logger = log.FileLogger(path, max_bytes=10, backup_count=2)
+        logger.error("second message")
+        logger.close()
+        with open(path + ".1") as fp:
+            assert "ERROR: second message\n" == fp.read()
+        with open(path + ".2") as fp:
+            assert "INFO: first message\n" == fp.read()
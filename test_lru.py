@@ -0,0 +1,37 @@
+from nose.tools import *
+import lru
+
+def test_evicts_least_recently_used():
+    cache = lru.LRUCache(3)
+    cache.put("a", 1, 1)
+    cache.put("b", 2, 1)
+    cache.put("c", 3, 1)
+    assert 1 == cache.get("a")
+    cache.put("d", 4, 1)
+    assert "b" not in cache
+    assert 1 == cache.get("a")
+    assert 3 == cache.cost
+
+def test_evicts_until_cost_fits():
+    cache = lru.LRUCache(10)
+    for key in "abcd":
+        cache.put(key, key, 3)
+    cache.put("e", "e", 8)
+    assert ["e"] == [key for key in "abcde" if key in cache]
+    assert 8 == cache.cost
+
+def test_value_over_budget_is_not_kept():
+    cache = lru.LRUCache(10)
+    cache.put("a", 1, 5)
+    cache.put("b", 2, 11)
+    assert "b" not in cache
+    assert 1 == cache.get("a")
+
+def test_replacing_a_value_updates_cost():
+    cache = lru.LRUCache(10)
+    cache.put("a", 1, 5)
+    cache.put("a", 2, 3)
+    assert 2 == cache.peek("a")
+    assert 3 == cache.cost
+    cache.set_budget(2)
+    assert 0 == len(cache)
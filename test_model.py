@@ -1,5 +1,12 @@
 from nose.tools import *
 import model
+import io
+import lang
+import log
+import os
+import subprocess
+import sys
+import threading
 
 class EventChain(object):
     def __init__(self, events):
@@ -205,6 +212,70 @@ def test_object_get_edges():
     edge_ids = model.object_get_edges(object_id1, relation_id)
     assert set([edge_id]) == edge_ids
 
+@with_setup(teardown=model.reset)
+def test_object_get_edges_is_per_relation():
+    class_id = model.class_new("Test Class")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    relation_id1 = model.relation_new("Test Relation 1")
+    relation_id2 = model.relation_new("Test Relation 2")
+    edge_id1 = model.edge_new(relation_id1, object_id1, object_id2)
+    edge_id2 = model.edge_new(relation_id2, object_id2, object_id1)
+    assert set([edge_id1]) == model.object_get_edges(object_id1, relation_id1)
+    assert set([edge_id2]) == model.object_get_edges(object_id1, relation_id2)
+
+@with_setup(teardown=model.reset)
+def test_edge_delete_updates_object_edges():
+    class_id = model.class_new("Test Class")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    relation_id = model.relation_new("Test Relation")
+    edge_id = model.edge_new(relation_id, object_id1, object_id2)
+    model.edge_delete(edge_id)
+    assert set() == model.object_get_edges(object_id1, relation_id)
+    assert set() == model.object_get_edges(object_id2, relation_id)
+
+@with_setup(teardown=model.reset)
+def test_object_delete_deletes_incident_edges():
+    class_id = model.class_new("Test Class")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    object_id3 = model.object_new(class_id)
+    relation_id1 = model.relation_new("Test Relation 1")
+    relation_id2 = model.relation_new("Test Relation 2")
+    model.edge_new(relation_id1, object_id1, object_id2)
+    model.edge_new(relation_id2, object_id3, object_id1)
+    edge_id = model.edge_new(relation_id2, object_id2, object_id3)
+    model.object_delete(object_id1)
+    assert [edge_id] == model.get_edges()
+    assert [] == model.object_get_outnodes(object_id3, relation_id2)
+
+@with_setup(teardown=model.reset)
+def test_class_set_visible_hides_incident_edges():
+    class_id1 = model.class_new("Test Class 1")
+    class_id2 = model.class_new("Test Class 2")
+    object_id1 = model.object_new(class_id1)
+    object_id2 = model.object_new(class_id2)
+    relation_id = model.relation_new("Test Relation")
+    edge_id = model.edge_new(relation_id, object_id1, object_id2)
+    model.class_set_visible(class_id1, False)
+    assert not model.edge_is_visible(edge_id)
+    model.class_set_visible(class_id1, True)
+    assert model.edge_is_visible(edge_id)
+
+@with_setup(teardown=model.reset)
+def test_object_image_defaults_to_class_image():
+    class_id = model.class_new("Test Class")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    assert None == model.object_get_image(object_id1)
+    model.class_set_image(class_id, "class.png")
+    model.object_set_image(object_id2, "object.png")
+    assert "class.png" == model.object_get_image(object_id1)
+    assert "object.png" == model.object_get_image(object_id2)
+    model.object_set_image(object_id2, None)
+    assert "class.png" == model.object_get_image(object_id2)
+
 # Relations
 
 @with_setup(teardown=model.reset)
@@ -230,6 +301,56 @@ def test_relation_get_edges():
     edge_ids = model.relation_get_edges(relation_id)
     assert set([edge_id]) == edge_ids
 
+@with_setup(teardown=model.reset)
+def test_relation_get_edges_after_edge_delete():
+    class_id = model.class_new("Test Class")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    object_id3 = model.object_new(class_id)
+    relation_id = model.relation_new("Test Relation")
+    edge_id1 = model.edge_new(relation_id, object_id1, object_id2)
+    edge_id2 = model.edge_new(relation_id, object_id2, object_id3)
+    model.edge_delete(edge_id1)
+    assert set([edge_id2]) == model.relation_get_edges(relation_id)
+    assert 1 == model.relation_count_edges(relation_id)
+
+@with_setup(teardown=model.reset)
+def test_relation_delete_deletes_edges():
+    class_id = model.class_new("Test Class")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    relation_id = model.relation_new("Test Relation")
+    model.edge_new(relation_id, object_id1, object_id2)
+    model.relation_delete(relation_id)
+    assert [] == model.get_edges()
+    assert set() == model.object_get_edges(object_id1, relation_id)
+
+@with_setup(teardown=model.reset)
+def test_relation_set_visible_hides_edges():
+    class_id = model.class_new("Test Class")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    relation_id = model.relation_new("Test Relation")
+    edge_id = model.edge_new(relation_id, object_id1, object_id2)
+    model.relation_set_visible(relation_id, False)
+    assert not model.edge_is_visible(edge_id)
+    model.relation_set_visible(relation_id, True)
+    assert model.edge_is_visible(edge_id)
+
+@with_setup(teardown=model.reset)
+def test_read_restores_relation_and_object_edges():
+    class_id = model.class_new("Test Class")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    relation_id = model.relation_new("Test Relation")
+    edge_id = model.edge_new(relation_id, object_id1, object_id2)
+    with io.StringIO() as fp:
+        model.write(fp)
+        fp.seek(0)
+        model.read(fp)
+    assert set([edge_id]) == model.relation_get_edges(relation_id)
+    assert set([edge_id]) == model.object_get_edges(object_id2, relation_id)
+
 # Edges
 
 @with_setup(teardown=model.reset)
@@ -242,6 +363,25 @@ def test_edge_new_updates_edge_list():
     edges = model.get_edges()
     assert [edge_id] == edges
 
+@with_setup(teardown=model.reset)
+def test_edge_new_survives_failing_on_add_handler():
+    class_id = model.class_new("Test Class")
+    relation_id = model.relation_new("Test Relation")
+    model.relation_set_on_add_handler(relation_id, "no-such-function")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    errors = []
+    class ErrorLogger(log.TerminalLogger):
+        def error(self, message):
+            errors.append(message)
+    log.set_logger(ErrorLogger(log.sys.stderr))
+    try:
+        edge_id = model.edge_new(relation_id, object_id1, object_id2)
+    finally:
+        log.set_logger(log.TerminalLogger(log.sys.stderr))
+    assert [edge_id] == model.get_edges()
+    assert 1 == len(errors)
+
 @with_setup(teardown=model.reset)
 def test_edge_delete_updates_edge_list():
     class_id = model.class_new("Test Class")
@@ -312,3 +452,480 @@ def test_field_removed_after_object_created_is_removed_from_object():
     object_id = model.object_new(class_id)
     model.field_delete(field_id)
     assert [] == model.object_get_members(object_id)
+
+@with_setup(teardown=model.reset)
+def test_field_set_type_converts_members():
+    class_id = model.class_new("Test Class")
+    field_id = model.class_add_field(class_id, "Test Field", model.Integer, 13)
+    object_id = model.object_new(class_id)
+    model.field_set_type(field_id, model.String)
+    member_id = model.object_get_members(object_id)[0]
+    assert model.String == model.field_get_type(field_id)
+    assert "13" == model.member_get_value(member_id)
+
+@with_setup(teardown=model.reset)
+def test_member_set_value_rejects_wrong_type():
+    class_id = model.class_new("Test Class")
+    model.class_add_field(class_id, "Test Field", model.Integer)
+    object_id = model.object_new(class_id)
+    member_id = model.object_get_members(object_id)[0]
+    assert_raises(model.InvalidTypeException, model.member_set_value, member_id, "13")
+
+# Saving and Loading
+
+def save_and_load(compact=False):
+    with io.StringIO() as fp:
+        model.write(fp, compact=compact)
+        fp.seek(0)
+        model.read(fp)
+
+@with_setup(teardown=model.reset)
+def test_new_ids_after_read_do_not_collide():
+    class_id = model.class_new("Test Class")
+    object_id = model.object_new(class_id)
+    save_and_load()
+    new_object_id = model.object_new(class_id)
+    assert new_object_id > object_id
+    assert 2 == len(model.get_objects())
+
+@with_setup(teardown=model.reset)
+def test_object_slot_is_reused_after_delete():
+    class_id = model.class_new("Test Class")
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    slot = model.get_slot(object_id1)
+    model.object_delete(object_id1)
+    object_id3 = model.object_new(class_id)
+    assert slot == model.get_slot(object_id3)
+    assert object_id3 == model.get_slot_entity(model.Object, slot)
+    assert object_id2 == model.get_slot_entity(model.Object, model.get_slot(object_id2))
+
+@with_setup(teardown=model.reset)
+def test_compact_write_renumbers_ids():
+    class_id = model.class_new("Test Class")
+    model.class_add_field(class_id, "Test Field", model.Integer)
+    for i in range(3):
+        model.object_delete(model.object_new(class_id))
+    object_id1 = model.object_new(class_id)
+    object_id2 = model.object_new(class_id)
+    relation_id = model.relation_new("Test Relation")
+    model.edge_new(relation_id, object_id1, object_id2)
+    # Deleting an object's edges leaves it in the relation's forest
+    deleted_object_id = model.object_new(class_id)
+    model.edge_new(relation_id, object_id2, deleted_object_id)
+    model.object_delete(deleted_object_id)
+    model.class_set_visible(class_id, False)
+    save_and_load(compact=True)
+    entity_ids = model.get_classes() + model.get_objects() + model.get_relations() + model.get_edges()
+    assert 8 == max(entity_ids)
+    [relation_id] = model.get_relations()
+    assert set(model.relation_roots(relation_id)) <= set(model.get_objects())
+    [class_id] = model.get_classes()
+    [edge_id] = model.get_edges()
+    object_id1 = model.edge_get_source_object(edge_id)
+    assert [model.edge_get_destination_object(edge_id)] == model.object_get_outnodes(object_id1, relation_id)
+    assert 1 == len(model.object_get_members(object_id1))
+    model.class_set_visible(class_id, True)
+    assert model.object_is_visible(object_id1)
+
+# Graphs
+
+@with_setup(teardown=model.reset)
+def test_graphs_are_independent():
+    graph = model.Graph()
+    class_id = graph.class_new("Test Class")
+    graph.object_new(class_id)
+    assert [] == model.get_classes()
+    assert [class_id] == graph.get_classes()
+    assert 1 == len(graph.get_objects())
+
+@with_setup(teardown=model.reset)
+def test_with_graph_makes_it_current():
+    graph = model.Graph()
+    with graph:
+        class_id = model.class_new("Test Class")
+        assert graph is model.get_graph()
+    assert [] == model.get_classes()
+    assert [class_id] == graph.get_classes()
+
+@with_setup(teardown=model.reset)
+def test_graph_delegates_are_independent():
+    graph = model.Graph()
+    created = []
+    class Recorder(model.Delegate):
+        def class_created(self, id, source):
+            created.append(id)
+    graph.add_delegate(Recorder())
+    model.class_new("Default Class")
+    class_id = graph.class_new("Test Class")
+    assert [class_id] == created
+
+@with_setup(teardown=model.reset)
+def test_graph_lang_environments_are_independent():
+    graph = model.Graph()
+    with graph:
+        lang.eval(lang.read("(define graph-test-value 1)"))
+        assert 1 == lang.eval(lang.read("graph-test-value"))
+    assert "graph-test-value" not in model.get_env()
+
+def test_graphs_in_threads():
+    def build(graph, n):
+        class_id = graph.class_new("Test Class")
+        relation_id = graph.relation_new("Test Relation")
+        object_ids = [graph.object_new(class_id) for i in range(n)]
+        for src_id, dst_id in zip(object_ids, object_ids[1:]):
+            graph.edge_new(relation_id, src_id, dst_id)
+    graphs = [model.Graph() for i in range(4)]
+    threads = [threading.Thread(target=build, args=(graph, 50)) for graph in graphs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for graph in graphs:
+        assert 50 == len(graph.get_objects())
+        assert 49 == len(graph.get_edges())
+    assert [] == model.get_objects()
+
+# Snapshots and Concurrency
+
+@with_setup(teardown=model.reset)
+def test_snapshot_is_unaffected_by_later_changes():
+    class_id = model.class_new("Test Class")
+    relation_id = model.relation_new("Test Relation")
+    a = model.object_new(class_id)
+    b = model.object_new(class_id)
+    edge_id = model.edge_new(relation_id, a, b)
+    snapshot = model.snapshot()
+    model.object_set_name(a, "Renamed")
+    model.edge_delete(edge_id)
+    model.object_new(class_id)
+    assert 2 == len(snapshot.get_objects())
+    assert {edge_id} == snapshot.object_get_edges(a, relation_id)
+    assert "Renamed" != snapshot.object_get_name(a)
+    assert set() == model.object_get_edges(a, relation_id)
+
+@with_setup(teardown=model.reset)
+def test_snapshot_evaluates_lang_against_itself():
+    class_id = model.class_new("Test Class")
+    model.object_new(class_id)
+    lang.eval(lang.read("(define snapshot-test-value 1)"))
+    snapshot = model.snapshot()
+    model.object_new(class_id)
+    with snapshot:
+        assert 1 == lang.eval(lang.read("(length (all-objects))"))
+        assert 1 == lang.eval(lang.read("snapshot-test-value"))
+
+@with_setup(teardown=model.reset)
+def test_editing_snapshot_leaves_original_unchanged():
+    class_id = model.class_new("Test Class")
+    relation_id = model.relation_new("Test Relation")
+    a = model.object_new(class_id)
+    b = model.object_new(class_id)
+    model.edge_new(relation_id, a, b)
+    snapshot = model.snapshot()
+    with snapshot:
+        field_id = model.class_add_field(class_id, "Test Field", model.String)
+        c = model.object_new(class_id)
+        model.edge_new(relation_id, b, c)
+        model.object_delete(a)
+    assert [b] == model.object_get_outnodes(a, relation_id)
+    assert [] == model.object_get_outnodes(b, relation_id)
+    assert [] == model.class_get_fields(class_id)
+    assert {a, b} == set(model.get_objects())
+    assert [field_id] == snapshot.class_get_fields(class_id)
+    assert {b, c} == set(snapshot.get_objects())
+
+@with_setup(teardown=model.reset)
+def test_snapshots_taken_between_edits():
+    class_id = model.class_new("Test Class")
+    relation_id = model.relation_new("Test Relation")
+    object_ids = [model.object_new(class_id)]
+    snapshots = []
+    for i in range(20):
+        object_ids.append(model.object_new(class_id))
+        model.edge_new(relation_id, object_ids[-2], object_ids[-1])
+        snapshots.append(model.snapshot())
+    for i, snapshot in enumerate(snapshots):
+        assert i + 2 == len(snapshot.get_objects())
+        assert i + 1 == snapshot.relation_count_edges(relation_id)
+        assert [] == snapshot.object_get_outnodes(object_ids[i + 1], relation_id)
+
+def stop_concurrency():
+    model.set_concurrent(False)
+    model.reset()
+
+@with_setup(teardown=stop_concurrency)
+def test_snapshots_are_consistent_while_editing():
+    model.set_concurrent(True)
+    class_id = model.class_new("Test Class")
+    relation_id = model.relation_new("Test Relation")
+    def edit():
+        for i in range(200):
+            a = model.object_new(class_id)
+            b = model.object_new(class_id)
+            model.edge_new(relation_id, a, b)
+    thread = threading.Thread(target=edit)
+    thread.start()
+    snapshots = []
+    while thread.is_alive():
+        snapshots.append(model.get_graph().snapshot())
+    thread.join()
+    for snapshot in snapshots:
+        edge_ids = snapshot.get_edges()
+        object_ids = set(snapshot.get_objects())
+        for edge_id in edge_ids:
+            assert snapshot.edge_get_source_object(edge_id) in object_ids
+            assert snapshot.edge_get_destination_object(edge_id) in object_ids
+
+@with_setup(teardown=stop_concurrency)
+def test_snapshots_from_several_threads_stay_unchanged():
+    model.set_concurrent(True)
+    class_id = model.class_new("Test Class")
+    graph = model.get_graph()
+    done = threading.Event()
+    snapshots = []
+    def take_snapshots():
+        while not done.is_set():
+            snapshot = graph.snapshot()
+            snapshots.append((snapshot, sorted(snapshot.get_objects())))
+    threads = [threading.Thread(target=take_snapshots) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for i in range(300):
+        object_id = model.object_new(class_id)
+        model.object_set_name(object_id, "Renamed")
+    done.set()
+    for thread in threads:
+        thread.join()
+    for snapshot, object_ids in snapshots:
+        assert object_ids == sorted(snapshot.get_objects())
+
+@with_setup(teardown=stop_concurrency)
+def test_concurrent_mode_keeps_instrumentation():
+    model.set_instrumented(True)
+    model.set_concurrent(True)
+    try:
+        model.class_new("Test Class")
+        assert 1 == model.stats()["class_new"]["count"]
+    finally:
+        model.set_instrumented(False)
+        model.reset_stats()
+
+# Undo
+
+def document_state():
+    "Returns the saved form of the model, minus the ordering of its sets and adjacency maps."
+    state = {}
+    for entity_id, d in model._model()["id_entity_map"].items():
+        state[entity_id] = {k: sorted(v) if type(v) in (set, list) and k in ("objects", "forest") else v for k, v in d.items()}
+    return repr(sorted(state.items(), key=lambda item: item[0]))
+
+@with_setup(teardown=model.reset)
+def test_undo_restores_deleted_class():
+    class_id = model.class_new("Test Class")
+    field_id = model.class_add_field(class_id, "Test Field", model.Integer)
+    relation_id = model.relation_new("Test Relation")
+    a = model.object_new(class_id)
+    b = model.object_new(class_id)
+    edge_id = model.edge_new(relation_id, a, b)
+    model.member_set_value(model.object_get_members(a)[0], 7)
+    before = document_state()
+    model.class_delete(class_id)
+    assert [] == model.get_objects()
+    assert model.undo()
+    assert before == document_state()
+    assert [a] == model.object_get_innodes(b, relation_id)
+    assert {edge_id} == model.relation_get_edges(relation_id)
+    assert [field_id] == model.class_get_fields(class_id)
+    assert model.redo()
+    assert [] == model.get_objects()
+    assert [] == model.get_edges()
+
+@with_setup(teardown=model.reset)
+def test_undo_group_is_one_step():
+    class_id = model.class_new("Test Class")
+    object_ids = [model.object_new(class_id) for i in range(3)]
+    with model.undo_group("Rename Objects"):
+        for object_id in object_ids:
+            model.object_set_name(object_id, "Renamed")
+    assert "Rename Objects" == model.undo_name()
+    model.undo()
+    assert ["New Test Class"] * 3 == [model.object_get_name(o) for o in object_ids]
+    model.redo()
+    assert ["Renamed"] * 3 == [model.object_get_name(o) for o in object_ids]
+
+@with_setup(teardown=model.reset)
+def test_undo_field_set_type_restores_member_values():
+    class_id = model.class_new("Test Class")
+    field_id = model.class_add_field(class_id, "Test Field", model.String)
+    object_id = model.object_new(class_id)
+    member_id = model.object_get_members(object_id)[0]
+    model.member_set_value(member_id, "not a number")
+    model.field_set_type(field_id, model.Integer)
+    assert 0 == model.member_get_value(member_id)
+    model.undo()
+    assert model.String == model.field_get_type(field_id)
+    assert "not a number" == model.member_get_value(member_id)
+    model.redo()
+    assert 0 == model.member_get_value(member_id)
+
+@with_setup(teardown=model.reset)
+def test_undo_replays_events():
+    class_id = model.class_new("Test Class")
+    relation_id = model.relation_new("Test Relation")
+    a = model.object_new(class_id)
+    b = model.object_new(class_id)
+    edge_id = model.edge_new(relation_id, a, b)
+    model.object_delete(a)
+    events = []
+    class Delegate(model.Delegate):
+        def object_created(self, id, source):
+            events.append(("object_created", id))
+        def edge_created(self, id, source):
+            events.append(("edge_created", id))
+    delegate = Delegate()
+    model.add_delegate(delegate)
+    try:
+        model.undo()
+    finally:
+        model.remove_delegate(delegate)
+    assert [("object_created", a), ("edge_created", edge_id)] == events
+
+@with_setup(teardown=model.reset)
+def test_undo_does_not_run_relation_handlers():
+    class_id = model.class_new("Test Class")
+    relation_id = model.relation_new("Test Relation")
+    model.relation_set_on_delete_handler(relation_id, '(lambda (edge-id) (make-object-filter "Deleted" "identity"))')
+    a = model.object_new(class_id)
+    b = model.object_new(class_id)
+    model.edge_new(relation_id, a, b)
+    model.undo()
+    assert [] == model.get_edges()
+    assert [] == model.get_object_filters()
+
+@with_setup(teardown=model.reset)
+def test_undo_visibility_keeps_other_symbols():
+    class_id = model.class_new("Test Class")
+    object_id = model.object_new(class_id)
+    model.class_set_visible(class_id, False)
+    model.object_set_visible(object_id, False)
+    model.object_set_visible(object_id, False)
+    model.undo()
+    assert not model.object_is_visible(object_id)
+    model.undo()
+    assert model.object_is_visible(object_id)
+
+@with_setup(teardown=model.reset)
+def test_read_clears_history():
+    model.class_new("Test Class")
+    fp = io.StringIO()
+    model.write(fp)
+    fp.seek(0)
+    model.read(fp)
+    assert not model.can_undo()
+
+@with_setup(teardown=model.reset)
+def test_load_leaves_current_graph_alone():
+    class_id = model.class_new("Test Class")
+    object_id = model.object_new(class_id)
+    fp = io.StringIO()
+    model.write(fp)
+    model.object_delete(object_id)
+    fp.seek(0)
+    progress = []
+    graph = model.load(fp, lambda count, total: progress.append((count, total)))
+    assert [] == model.get_objects()
+    assert [object_id] == graph.get_objects()
+    assert (0, 2) == progress[0]
+    assert (2, 2) == progress[-1]
+
+@with_setup(teardown=model.reset)
+def test_read_emits_one_reload_and_no_deletions():
+    class_id = model.class_new("Test Class")
+    model.object_new(class_id)
+    fp = io.StringIO()
+    model.write(fp)
+    fp.seek(0)
+    events = []
+    class Delegate(model.Delegate):
+        def object_deleted(self, id, source):
+            events.append(("object_deleted", id))
+        def class_deleted(self, id, source):
+            events.append(("class_deleted", id))
+        def reload(self, source):
+            events.append(("reload", source))
+    delegate = Delegate()
+    model.add_delegate(delegate)
+    try:
+        model.read(fp)
+    finally:
+        model.remove_delegate(delegate)
+    assert [("reload", "model")] == events
+
+@with_setup(teardown=model.reset)
+def test_replaced_graph_stays_separate():
+    graph = model.Graph()
+    class_id = graph.class_new("Test Class")
+    object_id = graph.object_new(class_id)
+    model.replace(graph)
+    graph.object_set_name(object_id, "Loaded")
+    model.object_set_name(object_id, "Current")
+    assert "Loaded" == graph.object_get_name(object_id)
+    assert "Current" == model.object_get_name(object_id)
+    assert model.object_new(class_id) > object_id
+
+@with_setup(teardown=model.reset)
+def test_replace_takes_the_loaded_environment():
+    graph = model.Graph()
+    with graph:
+        lang.eval(lang.read("(define loaded-value 1)"))
+        lang.eval(lang.read("(define (loaded-function) loaded-value)"))
+    model.replace(graph)
+    assert 1 == lang.eval(lang.read("(loaded-function)"))
+    lang.eval(lang.read("(define current-value 2)"))
+    assert "current-value" not in graph.env
+    assert "loaded-value" in graph.env
+
+# Instrumentation
+
+def disable_instrumentation():
+    model.set_instrumented(False)
+    model.reset_stats()
+    model.reset()
+
+@with_setup(teardown=disable_instrumentation)
+def test_stats_empty_when_not_instrumented():
+    class_id = model.class_new("Test Class")
+    model.object_new(class_id)
+    assert {} == model.stats()
+
+@with_setup(teardown=disable_instrumentation)
+def test_stats_counts_calls_when_instrumented():
+    model.set_instrumented(True)
+    class_id = model.class_new("Test Class")
+    model.object_new(class_id)
+    model.object_new(class_id)
+    stats = model.stats()
+    assert 2 == stats["object_new"]["count"]
+    assert 2 == stats["delegate.object_created"]["count"]
+    assert 2 == sum(stats["object_new"]["histogram"])
+
+@with_setup(teardown=disable_instrumentation)
+def test_set_instrumented_false_restores_functions():
+    object_new = model.object_new
+    model.set_instrumented(True)
+    assert object_new is not model.object_new
+    model.set_instrumented(False)
+    assert object_new is model.object_new
+
+def _import_first(module_name):
+    "Imports a module in a fresh interpreter before anything imports model."
+    directory = os.path.dirname(os.path.abspath(model.__file__))
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    subprocess.check_call([sys.executable, "-c", "import " + module_name], cwd=directory, env=env)
+
+def test_lang_imports_first():
+    _import_first("lang")
+
+def test_view_imports_first():
+    _import_first("view")
@@ -0,0 +1,65 @@
+from nose.tools import *
+import random
+import pmap
+
+def test_set_leaves_original_unchanged():
+    a = pmap.PMap({1: "one"})
+    b = a.set(2, "two")
+    assert {1: "one"} == dict(a.items())
+    assert {1: "one", 2: "two"} == dict(b.items())
+
+def test_delete_leaves_original_unchanged():
+    a = pmap.PMap({1: "one", 2: "two"})
+    b = a.delete(1)
+    assert 2 == len(a) and 1 in a
+    assert 1 == len(b) and 1 not in b
+
+@raises(KeyError)
+def test_delete_missing_key_raises():
+    pmap.PMap().delete(1)
+
+def test_matches_dict_under_random_updates():
+    rng = random.Random(0)
+    expected = {}
+    actual = pmap.PMap()
+    owner = object()
+    for i in range(20000):
+        key = rng.randrange(100000) if rng.random() < 0.9 else rng.randrange(10 ** 9)
+        if rng.random() < 0.3 and key in expected:
+            del expected[key]
+            actual = actual.delete(key, owner)
+        else:
+            expected[key] = i
+            actual = actual.set(key, i, owner)
+    assert len(expected) == len(actual)
+    assert expected == dict(actual.items())
+    assert all(actual[key] == value for key, value in expected.items())
+    assert None == actual.get(10 ** 12)
+
+def test_owned_updates_do_not_leak_into_shared_maps():
+    owner = object()
+    a = pmap.PMap()
+    for i in range(1000):
+        a = a.set(i, i, owner)
+    shared = a
+    owner = object()
+    for i in range(1000):
+        a = a.set(i, -i, owner)
+    a = a.delete(500, owner)
+    a = a.set(10 ** 6, 0, owner)
+    assert list(range(1000)) == sorted(shared.values())
+    assert 1000 == len(shared)
+    assert 1000 == len(a)
+
+def test_unowned_updates_copy():
+    a = pmap.PMap((i, i) for i in range(1000))
+    b = a.set(5, -5).delete(6)
+    assert 5 == a[5] and 6 in a
+    assert -5 == b[5] and 6 not in b
+
+def test_set_operations():
+    s = pmap.PSet([1, 2])
+    t = s.add(3).discard(1)
+    assert {1, 2} == s
+    assert {2, 3} == t
+    assert t is t.discard(5)
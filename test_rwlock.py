@@ -0,0 +1,38 @@
+from nose.tools import *
+import threading
+import rwlock
+
+def test_readers_share_the_lock():
+    lock = rwlock.RWLock()
+    inside = threading.Barrier(2, timeout=5)
+    def read():
+        with lock.read():
+            inside.wait()
+    thread = threading.Thread(target=read)
+    thread.start()
+    read()
+    thread.join()
+
+def test_writer_excludes_readers():
+    lock = rwlock.RWLock()
+    events = []
+    lock.acquire_write()
+    def read():
+        with lock.read():
+            events.append("read")
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join(0.05)
+    events.append("write")
+    lock.release_write()
+    thread.join()
+    assert ["write", "read"] == events
+
+def test_writer_may_reacquire():
+    lock = rwlock.RWLock()
+    with lock.write():
+        with lock.write():
+            with lock.read():
+                pass
+    with lock.read():
+        pass
@@ -0,0 +1,62 @@
+from nose.tools import *
+import spatial
+
+def test_box_at_point():
+    grid = spatial.Grid(100)
+    grid.insert_box("a", 10, 10, 250, 60)
+    grid.insert_box("b", 200, 0, 300, 100)
+    assert ["a"] == grid.at(20, 20)
+    assert {"a", "b"} == set(grid.at(220, 50))
+    assert [] == grid.at(20, 80)
+    assert [] == grid.at(-500, -500)
+
+def test_reinserting_moves_a_box():
+    grid = spatial.Grid(100)
+    grid.insert_box("a", 0, 0, 50, 50)
+    grid.insert_box("a", 1000, 1000, 1050, 1050)
+    assert [] == grid.at(10, 10)
+    assert ["a"] == grid.at(1010, 1010)
+    assert 1 == len(grid)
+
+def test_discard():
+    grid = spatial.Grid(100)
+    grid.insert_segment("e", 0, 0, 1000, 700)
+    grid.discard("e")
+    grid.discard("e")
+    assert "e" not in grid
+    assert not grid._cells
+
+def test_segments_only_fill_the_cells_they_cross():
+    grid = spatial.Grid(100)
+    grid.insert_segment("e", 5, 5, 995, 995)
+    # A box over the segment's bounding box would fill 100 cells
+    assert len(grid._cells) < 30
+    assert [] == grid.in_rect(700, 100, 900, 300)
+    assert ["e"] == grid.in_rect(480, 480, 520, 520)
+
+def test_segment_cells_are_connected():
+    grid = spatial.Grid(10)
+    for x0, y0, x1, y1 in [(3, 3, 97, 41), (95, 3, -47, 60), (5, 5, 5, 85), (-12, 7, 88, 7), (50, 50, 50, 50)]:
+        cells = grid._segment_cells(x0, y0, x1, y1)
+        assert cells[0] == grid._cell(x0, y0)
+        assert cells[-1] == grid._cell(x1, y1)
+        for (i0, j0), (i1, j1) in zip(cells, cells[1:]):
+            assert 1 == abs(i1 - i0) + abs(j1 - j0)
+
+def test_nearest_segment():
+    grid = spatial.Grid(100)
+    grid.insert_segment("horizontal", 0, 0, 1000, 0)
+    grid.insert_segment("vertical", 500, 10, 500, 1000)
+    key, distance = grid.nearest(300, 4, 10)
+    assert "horizontal" == key
+    assert abs(distance - 4) < 1e-9
+    assert "vertical" == grid.nearest(503, 500, 10)[0]
+    assert None == grid.nearest(300, 300, 10)
+
+def test_rect_query_mixes_boxes_and_segments():
+    grid = spatial.Grid(64)
+    grid.insert_box("node", 0, 0, 300, 200)
+    grid.insert_segment("edge", 150, 100, 2000, 100)
+    assert {"node", "edge"} == set(grid.in_rect(250, 50, 400, 150))
+    assert ["edge"] == grid.in_rect(1000, 0, 1100, 150)
+    assert [] == grid.in_rect(1000, 150, 1100, 300)
@@ -0,0 +1,47 @@
+from nose.tools import *
+import threading
+import stats
+
+class Target(object):
+    pass
+
+def test_calls_from_other_threads_are_timed():
+    started = threading.Event()
+    release = threading.Event()
+    def wait(block):
+        if block:
+            started.set()
+            release.wait()
+    Target.wait = wait
+    instrumentation = stats.Instrumentation()
+    instrumentation.add_target(Target, "wait")
+    instrumentation.set_enabled(True)
+    try:
+        thread = threading.Thread(target=Target.wait, args=(True,))
+        thread.start()
+        started.wait()
+        # The other thread is inside wait(), but this call isn't nested in it
+        Target.wait(False)
+        release.set()
+        thread.join()
+    finally:
+        instrumentation.set_enabled(False)
+    wait_stats = instrumentation.stats()["wait"]
+    assert 2 == wait_stats["count"]
+    assert 2 == sum(wait_stats["histogram"])
+
+def test_recursive_calls_are_timed_once():
+    def countdown(n):
+        if n:
+            Target.countdown(n - 1)
+    Target.countdown = countdown
+    instrumentation = stats.Instrumentation()
+    instrumentation.add_target(Target, "countdown")
+    instrumentation.set_enabled(True)
+    try:
+        Target.countdown(3)
+    finally:
+        instrumentation.set_enabled(False)
+    countdown_stats = instrumentation.stats()["countdown"]
+    assert 4 == countdown_stats["count"]
+    assert 1 == sum(countdown_stats["histogram"])
@@ -0,0 +1,79 @@
+from nose.tools import *
+import io
+import os
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt5 import QtCore, QtWidgets
+import log
+import model
+import view
+
+app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+def wait_for(condition, timeout_ms=5000):
+    timer = QtCore.QElapsedTimer()
+    timer.start()
+    while not condition():
+        assert timer.elapsed() < timeout_ms
+        app.processEvents()
+
+@with_setup(teardown=model.reset)
+def test_object_filter_drops_deleted_objects_at_once():
+    model.set_concurrent(True)
+    try:
+        class_id = model.class_new("Task")
+        object_ids = [model.object_new(class_id) for i in range(3)]
+        filter_id = model.object_filter_new("All", "(lambda (object-id) 1)")
+        object_filter = view.QObjectFilter(filter_id)
+        matches = object_filter.model()
+        wait_for(lambda: matches.rowCount() == 3)
+        model.object_delete(object_ids[1])
+        assert 2 == matches.rowCount()
+        names = [matches.data(matches.index(row, 1)) for row in range(matches.rowCount())]
+        assert [model.object_get_name(object_ids[0]), model.object_get_name(object_ids[2])] == names
+        object_filter.grab()
+        object_filter.close()
+    finally:
+        model.set_concurrent(False)
+
+def scene_delegate(scene):
+    return next(delegate for delegate in model.get_graph().delegates
+                if isinstance(delegate, view.QNodeSceneDelegate) and delegate.scene is scene)
+
+def test_edges_of_nodes_left_unbuilt_by_a_cancelled_load():
+    scene = view.QNodeScene()
+    delegate = scene_delegate(scene)
+    loaders = []
+    scene.loading.connect(loaders.append)
+    try:
+        class_id = model.class_new("Task")
+        relation_id = model.relation_new("precedes")
+        object_ids = [model.object_new(class_id) for i in range(3)]
+        fp = io.StringIO()
+        model.write(fp)
+        fp.seek(0)
+        model.read(fp)
+        loader = loaders[-1]
+        loader.cancel()
+        assert loader.is_pending(object_ids[0])
+        edge_id = model.edge_new(relation_id, object_ids[0], object_ids[1])
+        model.edge_delete(edge_id)
+        assert [] == model.get_edges()
+        edge_id = model.edge_new(relation_id, object_ids[1], object_ids[2])
+        loader.resume()
+        wait_for(lambda: not loader.is_loading())
+        assert not loader.has_pending()
+        assert view.get_edge(edge_id) in scene.edge_index
+        assert all(view.get_object(object_id).scene() is scene for object_id in object_ids)
+    finally:
+        model.remove_delegate(delegate)
+        model.reset()
+
+def test_logger_formats_messages_when_they_are_logged():
+    textbox = QtWidgets.QTextEdit()
+    logger = view.QLogger(textbox)
+    values = [1]
+    logger.info(log.Message("values: %s", (values,)))
+    values.append(2)
+    assert_raises(TypeError, logger.info, log.Message("%d items", ("abc",)))
+    logger.flush()
+    assert "INFO: values: [1]" == textbox.toPlainText()
@@ -1,9 +1,17 @@
 # graph.py -- A network layout program.
+import bisect
+import heapq
 import math
+import os
+import random
+import time
 import lang
+import layout
 import log
+import lru
 import model
 import event
+import spatial
 import sys
 from PyQt5 import QtCore
 from PyQt5 import QtWidgets
@@ -31,29 +39,29 @@ def is_relation_active():
 qnodes = {} # maps node IDs to QNode objects
 qedges = {} # maps (origin node id, destination node id, relation) to a QEdge
 
-def distance(x, y):
-    return math.sqrt(x**2 + y**2)
-
-def angle(dx, dy):
-    r = distance(dx, dy)
-    if dx >= 0:
-        if dy >= 0:
-            theta = math.acos(dx/r) # quadrant I
-        else:
-            theta = math.asin(dy/r) + 2*math.pi # quadrant IV
-    else:
-        if dy >= 0:
-            theta = math.acos(dx/r) # quadrant II
-        else:
-            theta = math.pi - math.asin(dy/r) # quadrant III
-    return theta
+def arrowhead(x1, y1, x2, y2, radius, cos, sin):
+    """Returns the far ends (ax, ay, bx, by) of the sides of an arrowhead at
+    (x2, y2) on the line from (x1, y1), or None if the line has no length.
+    cos and sin are those of half the arrowhead's angle."""
+    dx = x2 - x1
+    dy = y2 - y1
+    length = math.hypot(dx, dy)
+    if not length:
+        return None
+    # The arrowhead's sides point back along the line, turned by half
+    # the arrowhead's angle either way.
+    ux = dx / length * radius
+    uy = dy / length * radius
+    return (x2 - ux * cos - uy * sin, y2 + ux * sin - uy * cos,
+            x2 - ux * cos + uy * sin, y2 - ux * sin - uy * cos)
 
 class QArrow(QtWidgets.QGraphicsItemGroup):
     def __init__(self, relation_id, radius=20, angle=math.pi/6):
         QtWidgets.QGraphicsItemGroup.__init__(self)
         self.id = relation_id
         self._radius = radius
-        self._angle = angle
+        self._cos = math.cos(angle / 2)
+        self._sin = math.sin(angle / 2)
 
         color = model.relation_get_color(relation_id)
         stroke = QtGui.QBrush(QtCore.Qt.SolidPattern)
@@ -71,7 +79,6 @@ class QArrow(QtWidgets.QGraphicsItemGroup):
         self.addToGroup(self._line)
         self.addToGroup(self._arrow1)
         self.addToGroup(self._arrow2)
-        self._updateLines()
     
     def setColor(self, color):
         stroke = QtGui.QBrush(QtCore.Qt.SolidPattern)
@@ -81,66 +88,233 @@ class QArrow(QtWidgets.QGraphicsItemGroup):
         self._line.setPen(self._thinpen)
         self._arrow1.setPen(self._thickpen)
         self._arrow2.setPen(self._thickpen)
-        self._updateLines()
 
-    def _updateLines(self):
-        line = self._line.line()
-        x1 = line.x1()
-        y1 = line.y1()
-        x2 = line.x2()
-        y2 = line.y2()
+    def setLineWidth(self, width):
+        pen = QtGui.QPen(self._thinpen)
+        pen.setWidth(width)
+        self._line.setPen(pen)
 
+    def setLine(self, x1, y1, x2, y2):
         self._line.setLine(x1, y1, x2, y2)
+        head = arrowhead(x1, y1, x2, y2, self._radius, self._cos, self._sin)
+        if head:
+            ax, ay, bx, by = head
+            self._arrow1.setLine(x2, y2, ax, ay)
+            self._arrow2.setLine(x2, y2, bx, by)
+
+def clip_to_rect(x0, y0, cx, cy, half_width, half_height):
+    """Returns where the line from (x0, y0) to the center (cx, cy) of a
+    rectangle enters the rectangle."""
+    dx = cx - x0
+    dy = cy - y0
+    # Fraction of (dx, dy) from the center back to the nearest side
+    t = min(half_width / abs(dx) if dx else math.inf, half_height / abs(dy) if dy else math.inf)
+    if t >= 1:
+        # The start point lies inside the rectangle
+        return x0, y0
+    return cx - dx * t, cy - dy * t
+
+class QEdgeRouter(QtCore.QObject):
+    """Recomputes the geometry of edges whose nodes moved, once per frame.
+
+    Moving a node marks its edges; the marked edges are routed together
+    when the frame timer fires, however many times their nodes moved in
+    between. Edge batches whose edges moved or were hidden are then fitted
+    to what they still draw."""
+    frame_ms = 16
 
-        dx = x2 - x1
-        dy = y2 - y1
-        if not distance(dx, dy):
-            return
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self._dirty = set()
+        self._batches = set()
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.frame_ms)
+        self._timer.timeout.connect(self.flush)
+
+    def mark(self, edge):
+        self._dirty.add(edge)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def discard(self, edge):
+        self._dirty.discard(edge)
+
+    def fit(self, batch):
+        self._batches.add(batch)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def discard_batch(self, batch):
+        self._batches.discard(batch)
+
+    def flush(self):
+        dirty, self._dirty = self._dirty, set()
+        for edge in dirty:
+            edge.route()
+        batches, self._batches = self._batches, set()
+        for batch in batches:
+            batch.fit()
+
+_edge_router = None
+def edge_router():
+    global _edge_router
+    if _edge_router is None:
+        _edge_router = QEdgeRouter()
+    return _edge_router
+
+class _EdgeTile(object):
+    "The edges a QEdgeBatch files under one tile, with their bounds and paths cached."
+    __slots__ = ("lines", "_rect", "_paths")
 
-        theta = angle(dx, dy)
-        atheta = math.pi + theta - self._angle/2
-        ax = x2 + self._radius * math.cos(atheta)
-        ay = y2 + self._radius * math.sin(atheta)
-        self._arrow1.setLine(x2, y2, ax, ay)
+    def __init__(self):
+        self.lines = {}  # maps QEdges to (x0, y0, x1, y1, arrowhead or None)
+        self.changed()
+
+    def changed(self):
+        self._rect = None
+        self._paths = None
+
+    def rect(self, margin):
+        if self._rect is None:
+            left = top = math.inf
+            right = bottom = -math.inf
+            for x0, y0, x1, y1, head in self.lines.values():
+                if x0 > x1:
+                    x0, x1 = x1, x0
+                if y0 > y1:
+                    y0, y1 = y1, y0
+                if x0 < left:
+                    left = x0
+                if x1 > right:
+                    right = x1
+                if y0 < top:
+                    top = y0
+                if y1 > bottom:
+                    bottom = y1
+            self._rect = QtCore.QRectF(left - margin, top - margin,
+                                       right - left + 2 * margin, bottom - top + 2 * margin)
+        return self._rect
+
+    def paths(self):
+        "Returns a path of the edges' lines and one of their arrowheads."
+        if self._paths is None:
+            lines = QtGui.QPainterPath()
+            heads = QtGui.QPainterPath()
+            for x0, y0, x1, y1, head in self.lines.values():
+                lines.moveTo(x0, y0)
+                lines.lineTo(x1, y1)
+                if head:
+                    ax, ay, bx, by = head
+                    heads.moveTo(ax, ay)
+                    heads.lineTo(x1, y1)
+                    heads.lineTo(bx, by)
+            self._paths = (lines, heads)
+        return self._paths
+
+class QEdgeBatch(QtWidgets.QGraphicsItem):
+    """Draws the shown edges of a relation as one scene item.
+
+    The edges are filed under square tiles by their midpoints. A tile
+    caches painter paths of its lines and arrowheads, which are built again
+    only when one of its edges moved, and only the tiles in the exposed
+    area are drawn. All the edges share the relation's pens."""
+    tile_size = 2048.0
+    radius = 20
+    angle = math.pi / 6
 
-        btheta = math.pi + theta + self._angle/2
-        bx = x2 + self._radius * math.cos(btheta)
-        by = y2 + self._radius * math.sin(btheta)
-        self._arrow2.setLine(x2, y2, bx, by)
+    def __init__(self, relation_id):
+        QtWidgets.QGraphicsItem.__init__(self)
+        self.relation_id = relation_id
+        self.edges = set()  # the relation's QEdges on the canvas, shown or hidden
+        self._tiles = {}    # maps (column, row) to _EdgeTiles
+        self._tile_keys = {}
+        self._rect = QtCore.QRectF()
+        self._loose = False  # whether _rect may be larger than the shown edges
+        self._margin = self.radius + 2
+        self._cos = math.cos(self.angle / 2)
+        self._sin = math.sin(self.angle / 2)
+        self._rgb = None
+        self.set_color(model.relation_get_color(relation_id))
+        self.setZValue(-1.0)
+        self.setAcceptedMouseButtons(QtCore.Qt.NoButton)
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption)
 
-    def setLine(self, x1, y1, x2, y2):
-        self._line.setLine(x1, y1, x2, y2)
-        self._updateLines()
-
-def boundary(dest_node, source_node, line):
-    dest_pos = dest_node.pos()
-    dest_bounding_rect = dest_node.boundingRect()
-    top = dest_pos.y()
-    left = dest_pos.x()
-    bottom = top + dest_bounding_rect.height()
-    right = left + dest_bounding_rect.width()
-
-    m = line.dy() / line.dx() if line.dx() else 0
-    p0 = source_node.pos() + midpoint(source_node)
-    x0 = p0.x()
-    y0 = p0.y()
-
-    vectors = []
-    for side in (right, left):
-        y1 = m * (side - x0) + y0
-        if top <= y1 and y1 <= bottom:
-            vectors.append(QtCore.QPointF(side, y1))
-    
-    for side in (top, bottom):
-        x1 = ((side - y0)/m + x0) if m else x0
-        if left <= x1 and x1 <= right:
-            vectors.append(QtCore.QPointF(x1, side))
-    
-    def distance(q):
-        r = q - p0
-        return math.sqrt(QtCore.QPointF.dotProduct(r, r))
-    vectors.sort(key=distance)
-    return vectors[0]
+    def set_color(self, color):
+        rgb = (color.r, color.g, color.b)
+        if rgb == self._rgb:
+            return
+        self._rgb = rgb
+        qcolor = QtGui.QColor(*rgb)
+        self._thin_pen = QtGui.QPen(qcolor, 1)
+        self._thick_pen = QtGui.QPen(qcolor, 2)
+        self.update()
+
+    def _line_rect(self, x0, y0, x1, y1):
+        margin = self._margin
+        return QtCore.QRectF(min(x0, x1) - margin, min(y0, y1) - margin,
+                             abs(x1 - x0) + 2 * margin, abs(y1 - y0) + 2 * margin)
+
+    def show_edge(self, edge, x0, y0, x1, y1):
+        "Draws an edge from (x0, y0) to (x1, y1), moving it if it is drawn already."
+        self.hide_edge(edge)
+        size = self.tile_size
+        key = (math.floor((x0 + x1) / 2 / size), math.floor((y0 + y1) / 2 / size))
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = self._tiles[key] = _EdgeTile()
+        tile.lines[edge] = (x0, y0, x1, y1, arrowhead(x0, y0, x1, y1, self.radius, self._cos, self._sin))
+        tile.changed()
+        self._tile_keys[edge] = key
+        rect = self._line_rect(x0, y0, x1, y1)
+        if not self._rect.contains(rect):
+            self.prepareGeometryChange()
+            self._rect = self._rect.united(rect)
+        self.update(rect)
+
+    def hide_edge(self, edge):
+        key = self._tile_keys.pop(edge, None)
+        if key is None:
+            return
+        tile = self._tiles[key]
+        x0, y0, x1, y1, head = tile.lines.pop(edge)
+        if tile.lines:
+            tile.changed()
+        else:
+            del self._tiles[key]
+        rect = self._line_rect(x0, y0, x1, y1)
+        self.update(rect)
+        bounds = self._rect
+        # Only an edge on the bounding rectangle's border can shrink it
+        if not self._loose and (rect.left() <= bounds.left() or rect.top() <= bounds.top() or
+                                rect.right() >= bounds.right() or rect.bottom() >= bounds.bottom()):
+            self._loose = True
+            edge_router().fit(self)
+
+    def fit(self):
+        "Shrinks the bounding rectangle to the shown edges."
+        if not self._loose:
+            return
+        self._loose = False
+        rect = QtCore.QRectF()
+        for tile in self._tiles.values():
+            rect = rect.united(tile.rect(self._margin))
+        if rect != self._rect:
+            self.prepareGeometryChange()
+            self._rect = rect
+
+    def boundingRect(self):
+        return self._rect
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect
+        for tile in self._tiles.values():
+            if tile.rect(self._margin).intersects(exposed):
+                lines, heads = tile.paths()
+                painter.setPen(self._thin_pen)
+                painter.drawPath(lines)
+                painter.setPen(self._thick_pen)
+                painter.drawPath(heads)
 
 class QObjectDelegate(object):
     def __init__(self, qedge):
@@ -149,65 +323,105 @@ class QObjectDelegate(object):
     def object_moved(self, qobject):
         self.qedge.object_moved()
 
-class QEdge(QArrow):
-    def __init__(self, relation_id, edge_id, origin, dest, radius=20, angle=math.pi/6):
-        QArrow.__init__(self, relation_id, radius=radius, angle=angle)
+class QEdge(object):
+    """An edge on the canvas. It follows its nodes, and files its line in
+    the scene's edge index and in its relation's QEdgeBatch, which draws
+    it; only a selected edge gets an item of its own, drawn over the batch."""
+    def __init__(self, relation_id, edge_id, origin, dest):
         self._edge_id = edge_id
-        self.setZValue(-1.0)
+        self._relation_id = relation_id
         self._origin = origin
         self._dest = dest
         self._origin.add_listener("graphical_object_changed", self._onNodeUpdate)
         self._dest.add_listener("graphical_object_changed", self._onNodeUpdate)
-        self._relation_id = relation_id
-        self._setArrows()
-        is_visible = model.edge_is_visible(edge_id)
-        self.setVisible(is_visible)
-    
+        self._segment = (0.0, 0.0, 0.0, 0.0)
+        self._is_visible = model.edge_is_visible(edge_id)
+        self._scene = None
+        self._batch = None
+        self._selection = None
+
+    @property
+    def relation_id(self):
+        return self._relation_id
+
+    def attach(self, scene, batch):
+        "Puts the edge on a scene, drawn by a batch; see QNodeScene.add_edge()."
+        self._scene = scene
+        self._batch = batch
+        self.route()
+
+    def set_visible(self, is_visible):
+        if is_visible != self._is_visible:
+            self._is_visible = is_visible
+            self._draw()
+
+    def is_visible(self):
+        return self._is_visible
+
     def set_color(self, color):
-        self.setColor(QtGui.QColor(color.r, color.g, color.b))
+        if self._batch:
+            self._batch.set_color(color)
+        if self._selection:
+            self._selection.setColor(QtGui.QColor(color.r, color.g, color.b))
+            self._selection.setLineWidth(2)
     
     def delete(self):
-        self._origin.remove_listener("graphical_object_changed", self._onNodeUpdate)
-        self._dest.remove_listener("graphical_object_changed", self._onNodeUpdate)
         model.edge_delete(self._edge_id)
 
-    def _setArrows(self):
-        start = self._origin.pos() + midpoint(self._origin)
-        end = self._dest.pos() + midpoint(self._dest)
-        self.setLine(start.x(), start.y(), end.x(), end.y())
-        end = boundary(self._dest, self._origin, self._line.line())
-        self.setLine(start.x(), start.y(), end.x(), end.y())
+    def detach(self):
+        "Stops following the nodes; called when the edge is deleted."
+        self._origin.remove_listener("graphical_object_changed", self._onNodeUpdate)
+        self._dest.remove_listener("graphical_object_changed", self._onNodeUpdate)
+        edge_router().discard(self)
+        self.unselect()
+
+    def route(self):
+        "Runs the edge from the center of its origin to the side of its destination."
+        origin = self._origin.pos()
+        origin_rect = self._origin.boundingRect()
+        x0 = origin.x() + origin_rect.width() / 2
+        y0 = origin.y() + origin_rect.height() / 2
+        dest = self._dest.pos()
+        dest_rect = self._dest.boundingRect()
+        half_width = dest_rect.width() / 2
+        half_height = dest_rect.height() / 2
+        x1, y1 = clip_to_rect(x0, y0, dest.x() + half_width, dest.y() + half_height, half_width, half_height)
+        self._segment = (x0, y0, x1, y1)
+        self._draw()
+
+    def _draw(self):
+        scene = self._scene
+        if scene is None:
+            return
+        if self._is_visible:
+            self._batch.show_edge(self, *self._segment)
+            scene.edge_index.insert_segment(self, *self._segment)
+        else:
+            self._batch.hide_edge(self)
+            scene.edge_index.discard(self)
+        if self._selection:
+            self._selection.setLine(*self._segment)
+            self._selection.setVisible(self._is_visible)
 
     def select(self):
-        stroke = QtGui.QBrush(QtCore.Qt.SolidPattern)
-        color = model.relation_get_color(self._relation_id)
-        stroke.setColor(QtGui.QColor(color.r, color.g, color.b))
-        pen = QtGui.QPen(stroke, 2)
-        self._line.setPen(pen)
+        if self._selection or self._scene is None:
+            return
+        self._selection = QArrow(self._relation_id)
+        self._selection.setLineWidth(2)
+        self._selection.setZValue(-0.5)
+        self._selection.setAcceptedMouseButtons(QtCore.Qt.NoButton)
+        self._selection.setLine(*self._segment)
+        self._selection.setVisible(self._is_visible)
+        self._scene.addItem(self._selection)
 
     def unselect(self):
-        stroke = QtGui.QBrush(QtCore.Qt.SolidPattern)
-        color = model.relation_get_color(self._relation_id)
-        stroke.setColor(QtGui.QColor(color.r, color.g, color.b))
-        pen = QtGui.QPen(stroke, 1)
-        self._line.setPen(pen)
+        if self._selection:
+            self._scene.removeItem(self._selection)
+            self._selection = None
 
     def _onNodeUpdate(self, node):
         assert node is self._origin or node is self._dest
-        self._setArrows()
-
-    def mousePressEvent(self, event):
-        button = event.button()
-        mouse = event.pos()
-        pos = self.scenePos()
-        scene = event.scenePos()
-
-        if button != QtCore.Qt.LeftButton:
-            event.ignore()
-            return
-
-        for view in self.scene().views():
-            view.set_selected_item(self)
+        edge_router().mark(self)
 
 class QCollectionFilterDock(QtWidgets.QDockWidget):
     def __init__(self, title):
@@ -229,73 +443,582 @@ class QCollectionFilterDock(QtWidgets.QDockWidget):
             timer.timeout.connect(delete)
             timer.start(0)
 
-class QObjectFilter(QtWidgets.QTableWidget, model.Delegate):
+class _QRunnable(QtCore.QRunnable):
+    def __init__(self, fn):
+        QtCore.QRunnable.__init__(self)
+        self._fn = fn
+
+    def run(self):
+        self._fn()
+
+class QBackgroundTask(QtCore.QObject):
+    """Runs a function in a worker thread on a snapshot of the current graph.
+
+    The result is delivered to `on_finished` in the Qt thread through a
+    queued signal, unless the task was cancelled in the meantime. Errors are
+    logged. The model must be in concurrent mode, so the snapshot taken by
+    the worker is consistent while the Qt thread keeps editing."""
+    finished = QtCore.pyqtSignal(object)
+
+    def __init__(self, fn, on_finished):
+        QtCore.QObject.__init__(self)
+        self._fn = fn
+        self._on_finished = on_finished
+        self._graph = model.get_graph()
+        self._cancelled = False
+        self.finished.connect(self._deliver, QtCore.Qt.QueuedConnection)
+
+    def start(self):
+        QtCore.QThreadPool.globalInstance().start(_QRunnable(self._run))
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _run(self):
+        try:
+            with self._graph.snapshot():
+                result = self._fn()
+        except Exception as e:
+            log.error("Background task failed: %s", e)
+            return
+        if not self._cancelled:
+            self.finished.emit(result)
+
+    def _deliver(self, result):
+        if not self._cancelled:
+            self._on_finished(result)
+
+class QDocumentLoader(QtCore.QObject):
+    """Reads a document into a new graph in a worker thread, so the window
+    stays responsive while a large document is parsed and indexed.
+
+    Progress and the new graph are delivered in the Qt thread through
+    queued signals, where the caller swaps the graph in with
+    model.replace(). Errors are logged."""
+    progress = QtCore.pyqtSignal(int, int)  # entities loaded so far, total
+    loaded = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal()
+    _loaded = QtCore.pyqtSignal(object)  # from the worker, with the graph or None
+
+    def __init__(self, filename):
+        QtCore.QObject.__init__(self)
+        self.filename = filename
+        self._cancelled = False
+        self._loaded.connect(self._deliver, QtCore.Qt.QueuedConnection)
+
+    def start(self):
+        QtCore.QThreadPool.globalInstance().start(_QRunnable(self._run))
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _report(self, done, total):
+        if not self._cancelled:
+            self.progress.emit(done, total)
+
+    def _run(self):
+        try:
+            with open(self.filename) as fp:
+                graph = model.load(fp, self._report)
+        except Exception as e:
+            log.error("Couldn't open %s: %s", self.filename, e)
+            graph = None
+        self._loaded.emit(graph)
+
+    def _deliver(self, graph):
+        if self._cancelled:
+            return
+        if graph is None:
+            self.failed.emit()
+        else:
+            self.loaded.emit(graph)
+
+class QLayoutTask(QtCore.QObject):
+    """Lays out the canvas in a worker thread.
+
+    The node centers are taken when the task starts, and the edges of the
+    chosen relations from a snapshot of the graph in the worker, which then
+    calls _layout(centers, edges). Subclasses override _layout with the
+    layout to run. Positions it sends with positions_changed are applied to
+    the nodes on the UI thread."""
+    positions_changed = QtCore.pyqtSignal(object)
+
+    def __init__(self, relation_ids):
+        QtCore.QObject.__init__(self)
+        self._relation_ids = list(relation_ids)
+        self._graph = model.get_graph()
+        self._cancelled = False
+        self.positions_changed.connect(self._apply, QtCore.Qt.QueuedConnection)
+
+    def start(self):
+        centers = {}
+        width = height = 0.0
+        for object_id, node in qnodes.items():
+            if node.scene() is not None:
+                rect = node.boundingRect()
+                center = node.pos() + rect.center()
+                centers[object_id] = (center.x(), center.y())
+                width = max(width, rect.width())
+                height = max(height, rect.height())
+        self._node_size = (width, height)
+        QtCore.QThreadPool.globalInstance().start(_QRunnable(lambda: self._run(centers)))
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _edge_ends(self, relation_id, edge_id):
+        return (model.edge_get_source_object(edge_id), model.edge_get_destination_object(edge_id))
+
+    def _run(self, centers):
+        try:
+            with self._graph.snapshot():
+                relation_ids = set(model.get_relations())
+                edges = [
+                    self._edge_ends(relation_id, edge_id)
+                    for relation_id in self._relation_ids if relation_id in relation_ids
+                    for edge_id in model.relation_get_edges(relation_id)
+                ]
+                self._read_graph()
+            started_at = time.perf_counter()
+            self._layout(centers, [(a, b) for a, b in edges if a in centers and b in centers])
+            log.info("Layout of %d objects took %.1f s", len(centers), time.perf_counter() - started_at)
+        except Exception as e:
+            log.error("Layout failed: %s", e)
+
+    def _read_graph(self):
+        "Reads anything else the layout needs; called in the worker inside the snapshot."
+        pass
+
+    def _layout(self, centers, edges):
+        """Lays out the nodes at centers, joined by edges, and sends their
+        positions with positions_changed; called in the worker. Subclasses
+        must override this: the task itself moves nothing."""
+        pass
+
+    def _apply(self, positions):
+        if self._cancelled:
+            return
+        for object_id, (x, y) in positions.items():
+            node = qnodes.get(object_id)
+            if node is not None and node.scene() is not None:
+                node.setPos(QtCore.QPointF(x, y) - midpoint(node))
+                node.emit("graphical_object_changed", node)
+
+class QForceLayoutTask(QLayoutTask):
+    """Runs a force-directed layout with the chosen relations as springs.
+
+    Positions are sent back to the canvas at most `updates_per_second` times
+    a second, and once more when the layout settles or runs out of iterations."""
+    def __init__(self, relation_ids, iterations=500, updates_per_second=10):
+        QLayoutTask.__init__(self, relation_ids)
+        self._iterations = iterations
+        self._update_interval = 1.0 / updates_per_second
+
+    def _layout(self, centers, edges):
+        force_layout = layout.ForceLayout(centers, edges)
+        sent_at = time.perf_counter()
+        for i in range(self._iterations):
+            if self._cancelled:
+                return
+            if force_layout.step() < force_layout.min_temperature:
+                break
+            now = time.perf_counter()
+            if now - sent_at >= self._update_interval:
+                self.positions_changed.emit(force_layout.positions())
+                sent_at = now
+        self.positions_changed.emit(force_layout.positions())
+
+class QLayeredLayoutTask(QLayoutTask):
+    """Arranges the objects of hierarchical relations in layers, with the
+    roots of each relation's forest at the top, and moves them all at once.
+    The objects in no edge of the relations stay where they are."""
+    def _edge_ends(self, relation_id, edge_id):
+        # Roots are the objects without outnodes, so edges point up from child to parent
+        source_id, destination_id = QLayoutTask._edge_ends(self, relation_id, edge_id)
+        return (source_id, destination_id) if model.relation_is_reverse(relation_id) else (destination_id, source_id)
+
+    def _read_graph(self):
+        relation_ids = set(model.get_relations())
+        self._roots = [
+            object_id for relation_id in self._relation_ids if relation_id in relation_ids
+            for object_id in sorted(model.relation_roots(relation_id))
+        ]
+
+    def _layout(self, centers, edges):
+        width, height = self._node_size
+        roots = [object_id for object_id in self._roots if object_id in centers]
+        layered_layout = layout.LayeredLayout(edges, roots, layer_spacing=height * 2, node_spacing=width * 1.25)
+        positions = layered_layout.positions()
+        if self._cancelled or not positions:
+            return
+        # Keep the hierarchy where its objects were
+        x0 = min(centers[object_id][0] for object_id in positions)
+        y0 = min(centers[object_id][1] for object_id in positions)
+        self.positions_changed.emit({object_id: (x0 + x, y0 + y) for object_id, (x, y) in positions.items()})
+
+class QIncrementalLayout(QtCore.QObject, model.Delegate):
+    """Tidies the canvas around the edits made to the graph, leaving the
+    rest of it where it is.
+
+    Objects created by the model, e.g. by scripts, are placed next to the
+    objects they are connected to. The objects within `hops` edges of each
+    new edge are then relaxed by a force-directed layout, with the objects
+    one hop further out and those overlapping the area held fixed. The
+    layout runs on the UI thread for at most `budget_ms` per frame."""
+    hops = 2
+    max_movable = 200
+    spring_length = 500.0
+    frame_ms = 16
+    budget_ms = 8
+
+    def __init__(self, scene):
+        QtCore.QObject.__init__(self)
+        model.Delegate.__init__(self)
+        self.scene = scene
+        self._unplaced = set()
+        self._seeds = set()
+        self._layout = None
+        self._movable = []
+        self._rng = random.Random(0)
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(self.frame_ms)
+        self._timer.timeout.connect(self._frame)
+
+    def stop(self):
+        self._unplaced.clear()
+        self._seeds.clear()
+        self._layout = None
+        self._timer.stop()
+
+    def reload(self, source):
+        self.stop()
+
+    def object_created(self, object_id, source):
+        if source == "model":
+            self._unplaced.add(object_id)
+            self._mark(object_id)
+
+    def object_deleted(self, object_id, source):
+        self._unplaced.discard(object_id)
+        self._seeds.discard(object_id)
+        self._layout = None
+
+    def edge_created(self, edge_id, source):
+        self._mark(model.edge_get_source_object(edge_id))
+        self._mark(model.edge_get_destination_object(edge_id))
+
+    def edge_deleted(self, edge_id, source):
+        self._layout = None
+
+    def _mark(self, object_id):
+        self._seeds.add(object_id)
+        self._layout = None
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _node(self, object_id):
+        "Returns the node of an object if it is on the canvas, or None."
+        node = qnodes.get(object_id)
+        return node if node is not None and node.scene() is self.scene else None
+
+    def _center(self, node):
+        center = node.pos() + midpoint(node)
+        return (center.x(), center.y())
+
+    def _neighbours(self, object_id):
+        for relation_id in model.get_relations():
+            yield from model.object_get_outnodes(object_id, relation_id)
+            yield from model.object_get_innodes(object_id, relation_id)
+
+    def _place_unplaced(self):
+        # Objects placed in this pass count as placed for the next, so a
+        # new chain grows out of the object it hangs from
+        unplaced = {object_id for object_id in self._unplaced if self._node(object_id)}
+        self._unplaced.clear()
+        placed = True
+        while unplaced and placed:
+            placed = False
+            for object_id in sorted(unplaced):
+                centers = [
+                    self._center(node) for node in map(self._node, self._neighbours(object_id))
+                    if node is not None and node.id not in unplaced
+                ]
+                if not centers:
+                    continue
+                angle = 2 * math.pi * self._rng.random()
+                x = sum(x for x, y in centers) / len(centers) + self.spring_length * math.cos(angle)
+                y = sum(y for x, y in centers) / len(centers) + self.spring_length * math.sin(angle)
+                node = self._node(object_id)
+                node.setPos(QtCore.QPointF(x, y) - midpoint(node))
+                node.emit("graphical_object_changed", node)
+                unplaced.discard(object_id)
+                placed = True
+
+    def _make_layout(self):
+        hop = {object_id: 0 for object_id in sorted(self._seeds) if self._node(object_id)}
+        frontier = list(hop)
+        for depth in range(1, self.hops + 2):
+            next_frontier = []
+            for object_id in frontier:
+                for neighbour_id in self._neighbours(object_id):
+                    if neighbour_id not in hop and len(hop) < 4 * self.max_movable and self._node(neighbour_id):
+                        hop[neighbour_id] = depth
+                        next_frontier.append(neighbour_id)
+            frontier = next_frontier
+        self._movable = [object_id for object_id, depth in hop.items() if depth <= self.hops][:self.max_movable]
+        if not self._movable:
+            return None
+        fixed = set(hop).difference(self._movable)
+        centers = {object_id: self._center(self._node(object_id)) for object_id in hop}
+        area = QtCore.QRectF()
+        for object_id in self._movable:
+            area = area.united(self._node(object_id).sceneBoundingRect())
+        for node in self.scene.nodes_in(area):
+            if node.id not in centers:
+                centers[node.id] = self._center(node)
+                fixed.add(node.id)
+        edges = [
+            (object_id, neighbour_id) for object_id in centers
+            for relation_id in model.get_relations()
+            for neighbour_id in model.object_get_outnodes(object_id, relation_id) if neighbour_id in centers
+        ]
+        force_layout = layout.ForceLayout(centers, edges, spring_length=self.spring_length, fixed=fixed)
+        # Start cool: the neighbourhood only needs settling, not untangling
+        force_layout.temperature = force_layout.spring_length / 2
+        return force_layout
+
+    def _frame(self):
+        started_at = time.perf_counter()
+        if self._layout is None:
+            self._place_unplaced()
+            self._layout = self._make_layout()
+            if self._layout is None:
+                self.stop()
+                return
+        force_layout = self._layout
+        settled = False
+        while not settled and time.perf_counter() - started_at < self.budget_ms / 1000:
+            # Nodes held by fixed ones may jitter forever, so stop once cold too
+            largest = force_layout.step()
+            settled = max(largest, force_layout.temperature) <= force_layout.min_temperature
+        positions = force_layout.positions()
+        for object_id in self._movable:
+            node = self._node(object_id)
+            if node is not None:
+                node.setPos(QtCore.QPointF(*positions[object_id]) - midpoint(node))
+                node.emit("graphical_object_changed", node)
+        if settled:
+            self.stop()
+
+class QRelationChooser(QtWidgets.QDialog):
+    "Asks which relations to use, those passing is_checked checked at first."
+    def __init__(self, title, parent=None, is_checked=lambda relation_id: True):
+        QtWidgets.QDialog.__init__(self, parent)
+        self.setWindowTitle(title)
+        layout = QtWidgets.QVBoxLayout()
+        self._list = QListWidget()
+        for relation_id in model.get_relations():
+            item = QtWidgets.QListWidgetItem(model.relation_get_name(relation_id))
+            item.setData(QtCore.Qt.ItemDataRole.UserRole, relation_id)
+            item.setCheckState(QtCore.Qt.Checked if is_checked(relation_id) else QtCore.Qt.Unchecked)
+            self._list.addItem(item)
+        layout.addWidget(self._list)
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+
+    def relation_ids(self):
+        items = [self._list.item(row) for row in range(self._list.count())]
+        return [item.data(QtCore.Qt.ItemDataRole.UserRole) for item in items if item.checkState() == QtCore.Qt.Checked]
+
+class QObjectFilterModel(QtCore.QAbstractTableModel):
+    """The objects matching a filter, as rows of class and object names.
+
+    Rows are kept in ID order, so finding an object's row is a bisection.
+    Names are read from the model only when a row is shown. Views take
+    time proportional to the row count to insert or remove a row, so
+    batches of more than `reset_threshold` changes reset the model instead."""
+    headers = ("Class", "Title")
+    reset_threshold = 16
+
+    def __init__(self):
+        QtCore.QAbstractTableModel.__init__(self)
+        self._ids = []
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.headers[section]
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignLeft
+        return None
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        object_id = self._ids[index.row()]
+        if not model.object_exists(object_id):
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            if index.column() == 0:
+                return model.class_get_name(model.object_get_class(object_id))
+            return model.object_get_name(object_id)
+        if role == QtCore.Qt.ItemDataRole.UserRole:
+            return object_id
+        return None
+
+    def row(self, object_id):
+        "Returns the row of an object, or -1 if it isn't in the table."
+        row = bisect.bisect_left(self._ids, object_id)
+        return row if row < len(self._ids) and self._ids[row] == object_id else -1
+
+    def __contains__(self, object_id):
+        return self.row(object_id) >= 0
+
+    def clear(self):
+        self.beginResetModel()
+        self._ids = []
+        self.endResetModel()
+
+    def change(self, added=(), removed=()):
+        "Adds the objects in added and removes those in removed, ignoring those already added or removed."
+        added = sorted(object_id for object_id in set(added) if object_id not in self)
+        removed = {object_id for object_id in removed if object_id in self}
+        if len(added) + len(removed) > self.reset_threshold:
+            self.beginResetModel()
+            ids = [object_id for object_id in self._ids if object_id not in removed] if removed else self._ids
+            self._ids = list(heapq.merge(ids, added))
+            self.endResetModel()
+            return
+        for object_id in removed:
+            row = self.row(object_id)
+            self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+            del self._ids[row]
+            self.endRemoveRows()
+        for object_id in added:
+            row = bisect.bisect_left(self._ids, object_id)
+            self.beginInsertRows(QtCore.QModelIndex(), row, row)
+            self._ids.insert(row, object_id)
+            self.endInsertRows()
+
+    def update(self, object_id=None):
+        "Tells the view an object's names, or all names if object_id is None, may have changed."
+        first, last = (0, len(self._ids) - 1) if object_id is None else (self.row(object_id),) * 2
+        if 0 <= first <= last:
+            self.dataChanged.emit(self.index(first, 0), self.index(last, len(self.headers) - 1))
+
+class QObjectFilter(QtWidgets.QTableView, model.Delegate):
+    """Lists the objects matching a filter's predicate.
+
+    Objects that start or stop matching are added and removed in one batch
+    per event loop turn, so a script changing many objects doesn't update
+    the table for each of them. Deleted objects are removed at once, since
+    their rows can't be shown any more."""
     def __init__(self, object_filter_id):
-        QtWidgets.QTableWidget.__init__(self)
+        QtWidgets.QTableView.__init__(self)
         model.Delegate.__init__(self)
         self.id = object_filter_id
         self.predicate = model.object_filter_get_predicate(object_filter_id)
-        self._matches = set()
-        self._matches_list = []
+        self._task = None
+        self._changed = set()
+        self._added = set()
+        self._removed = set()
+        self._matches = QObjectFilterModel()
+        self.setModel(self._matches)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self._change_timer = QtCore.QTimer(self)
+        self._change_timer.setSingleShot(True)
+        self._change_timer.timeout.connect(self._change_matches)
+
+        self._find_matches()
 
-        self.setColumnCount(2)
-        header_class = QtWidgets.QTableWidgetItem("Class")
-        header_class.setTextAlignment(QtCore.Qt.AlignLeft)
-        self.setHorizontalHeaderItem(0, header_class)
+        model.add_delegate(self)
+    
+    def _find_matches(self):
+        "Evaluates the predicate on every object in the background."
+        if self._task:
+            self._task.cancel()
+        self._changed = set()
+        predicate = self.predicate
+        def find_matches():
+            return [object_id for object_id in model.get_objects() if predicate(object_id)]
+        self._task = QBackgroundTask(find_matches, self._on_matches_found)
+        self._task.start()
+
+    def _on_matches_found(self, object_ids):
+        # Objects changed since the snapshot have already been handled
+        # by object_changed and object_deleted.
+        self._task = None
+        live_object_ids = set(model.get_objects())
+        self._add_later(
+            object_id for object_id in object_ids
+            if object_id in live_object_ids and object_id not in self._changed
+        )
+        self._changed = set()
 
-        header_title = QtWidgets.QTableWidgetItem("Title")
-        header_title.setTextAlignment(QtCore.Qt.AlignLeft)
-        self.setHorizontalHeaderItem(1, header_title)
+    def _add_later(self, object_ids):
+        object_ids = set(object_ids)
+        self._added.update(object_ids)
+        self._removed.difference_update(object_ids)
+        self._change_later()
 
-        for object_id in model.get_objects():
-            self.object_created(object_id, "view")
+    def _remove(self, object_id):
+        self._added.discard(object_id)
+        if object_id in self._matches:
+            self._removed.add(object_id)
+            self._change_later()
 
-        model.add_delegate(self)
-    
-    def reload(self, source):
-        self.clearContents()
-        self._matches = set()
-        self._matches_list = []
-        for object_id in model.get_objects():
-            self.object_created(object_id, source)
-    
-    def insert_object(self, object_id, row):
-        class_id = model.object_get_class(object_id)
-        class_name = model.class_get_name(class_id)
-        class_item = QtWidgets.QTableWidgetItem(class_name)
-        class_item.setFlags(class_item.flags() & ~QtCore.Qt.ItemFlag.ItemIsEditable)
-        self.setItem(row, 0, class_item)
+    def _change_later(self):
+        if not self._change_timer.isActive():
+            self._change_timer.start()
 
-        object_name = model.object_get_name(object_id)
-        object_item = QtWidgets.QTableWidgetItem(object_name)
-        object_item.setFlags(object_item.flags() & ~QtCore.Qt.ItemFlag.ItemIsEditable)
-        self.setItem(row, 1, object_item)
+    def _change_matches(self):
+        added, self._added = self._added, set()
+        removed, self._removed = self._removed, set()
+        self._matches.change(added, removed)
+
+    def reload(self, source):
+        self._added = set()
+        self._removed = set()
+        self._matches.clear()
+        self._find_matches()
     
     def object_created(self, object_id, source):
-        self._matches_list.append(object_id)
-        self._matches.add(object_id)
-        nrows = len(self._matches_list)
-        row = nrows - 1
-        self.setRowCount(nrows)
-        self.insert_object(object_id, row)
+        if self._task:
+            self._changed.add(object_id)
+        if self.predicate(object_id):
+            self._add_later([object_id])
     
     def object_changed(self, object_id, source):
+        if self._task:
+            self._changed.add(object_id)
         if not self.predicate(object_id):
-            self.object_deleted(object_id, source)
-        elif object_id in self._matches:
-            row = self._matches_list.index(object_id)
-            self.insert_object(object_id, row)
+            self._remove(object_id)
+        elif object_id in self._matches and object_id not in self._removed:
+            self._matches.update(object_id)
         else:
-            self.object_created(object_id, source)
+            self._add_later([object_id])
     
     def object_deleted(self, object_id, source):
-        if object_id in self._matches:
-            row = self._matches_list.index(object_id)
-            self.removeRow(row)
-            self._matches_list.remove(object_id)
-            self._matches.remove(object_id)
+        if self._task:
+            self._changed.add(object_id)
+        self._added.discard(object_id)
+        self._removed.discard(object_id)
+        self._matches.change(removed=[object_id])
+
+    def class_changed(self, class_id, source):
+        # Only the shown rows are read again
+        self._matches.update()
 
     def closeEvent(self, event):
+        if self._task:
+            self._task.cancel()
         model.remove_delegate(self)
 
 def make_edge(edge_id):
@@ -308,32 +1031,181 @@ def make_edge(edge_id):
     qedges[edge_id] = graphical_edge
     return graphical_edge
 
-class QNodeProxy(QtWidgets.QGraphicsProxyWidget, event.Emitter):
-    def __init__(self, widget, id):
-        QtWidgets.QGraphicsProxyWidget.__init__(self)
+default_image = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pic.jpg")
+
+class QImageCache(QtCore.QObject):
+    """Node images scaled to the sizes they are drawn at, shared by all nodes.
+
+    Pixmaps are keyed by image file and size. Each is decoded once, at its
+    final size, by a worker thread, and get() returns None until it is
+    ready; `loaded` is emitted when one arrives. The least recently used
+    pixmaps are dropped when their total size exceeds the budget."""
+    loaded = QtCore.pyqtSignal()
+    _decoded = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, budget=64 * 1024 * 1024):
+        QtCore.QObject.__init__(self)
+        self._pixmaps = lru.LRUCache(budget)
+        self._pending = set()
+        self._decoded.connect(self._on_decoded, QtCore.Qt.QueuedConnection)
+
+    def get(self, filename, width, height):
+        "Returns the image in a file scaled to a size, or None if it is still being decoded."
+        key = (filename, width, height)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is None and key not in self._pending:
+            self._pending.add(key)
+            QtCore.QThreadPool.globalInstance().start(_QRunnable(lambda: self._decode(key)))
+        return pixmap
+
+    def peek(self, filename, width, height):
+        "Returns the image in a file scaled to a size if it is cached, without decoding it."
+        return self._pixmaps.peek((filename, width, height))
+
+    def set_budget(self, budget):
+        self._pixmaps.set_budget(budget)
+
+    def _decode(self, key):
+        filename, width, height = key
+        reader = QtGui.QImageReader(filename)
+        reader.setScaledSize(QtCore.QSize(width, height))
+        image = reader.read()
+        if image.isNull():
+            log.warn("Can't read image %s: %s", filename, reader.errorString())
+        self._decoded.emit(key, image)
+
+    def _on_decoded(self, key, image):
+        self._pending.discard(key)
+        # A file that can't be read is cached as a null pixmap, so it isn't read again
+        pixmap = QtGui.QPixmap.fromImage(image)
+        self._pixmaps.put(key, pixmap, max(1, pixmap.width() * pixmap.height() * 4))
+        self.loaded.emit()
+
+_image_cache = None
+def image_cache():
+    global _image_cache
+    if _image_cache is None:
+        _image_cache = QImageCache()
+    return _image_cache
+
+class QNode(QtWidgets.QGraphicsItem, event.Emitter):
+    """An object on the canvas: a box with the object's class color, the node
+    image and the object's name below it.
+
+    The node paints itself instead of embedding widgets, and lays out its
+    text only when the object changes. Zoomed far out it paints just the
+    box."""
+    image_size = QtCore.QSize(300, 200)
+    margin = 12
+    spacing = 6
+    detail_threshold = 0.25
+    # Images are drawn from thumbnails at these fractions of their full size
+    image_scales = (0.25, 0.5, 1.0)
+
+    _font = None
+
+    def __init__(self, object_id):
+        QtWidgets.QGraphicsItem.__init__(self)
         event.Emitter.__init__(self)
-        self.setWidget(widget)
-        self.id = id
+        self.id = object_id
         self._dx = 0
         self._dy = 0
-    
+        self._line_width = 1
+        self._color = QtGui.QColor()
+        self._image = default_image
+        self._text = QtGui.QStaticText()
+        self._text.setTextFormat(QtCore.Qt.PlainText)
+        self._text.setTextWidth(self.image_size.width())
+        self._rect = QtCore.QRectF()
+        self.setFlag(QtWidgets.QGraphicsItem.ItemSendsGeometryChanges)
+        self.object_changed(object_id)
+
     def __repr__(self):
-        return "{0}({1})".format(type(self).__name__, repr(self.widget()))
-    
+        return "{0}({1})".format(type(self).__name__, repr(self.id))
+
+    @classmethod
+    def font(cls):
+        if cls._font is None:
+            cls._font = QtGui.QFont()
+            cls._font.setPointSize(20)
+        return cls._font
+
+    def boundingRect(self):
+        return self._rect
+
+    def paint(self, painter, option, widget=None):
+        painter.fillRect(self._rect, self._color)
+        level_of_detail = option.levelOfDetailFromTransform(painter.worldTransform())
+        if level_of_detail >= self.detail_threshold:
+            self._paint_image(painter, level_of_detail)
+            painter.setFont(self.font())
+            painter.drawStaticText(self.margin, self.margin + self.image_size.height() + self.spacing, self._text)
+        if self._line_width:
+            pen = QtGui.QPen(QtCore.Qt.black, self._line_width)
+            pen.setJoinStyle(QtCore.Qt.MiterJoin)
+            painter.setPen(pen)
+            inset = self._line_width / 2
+            painter.drawRect(self._rect.adjusted(inset, inset, -inset, -inset))
+
+    def _paint_image(self, painter, level_of_detail):
+        cache = image_cache()
+        scale = next((s for s in self.image_scales if s >= level_of_detail), self.image_scales[-1])
+        size = self.image_size * scale
+        pixmap = cache.get(self._image, size.width(), size.height())
+        if pixmap is None:
+            # Draw any other thumbnail at hand until this one is decoded
+            for scale in self.image_scales:
+                size = self.image_size * scale
+                pixmap = cache.peek(self._image, size.width(), size.height())
+                if pixmap is not None:
+                    break
+        if pixmap is not None and not pixmap.isNull():
+            target = QtCore.QRectF(self.margin, self.margin, self.image_size.width(), self.image_size.height())
+            painter.drawPixmap(target, pixmap, QtCore.QRectF(pixmap.rect()))
+
+    def object_changed(self, object_id):
+        color = model.object_get_color(object_id)
+        self._color = QtGui.QColor(color.r, color.g, color.b)
+        self._image = model.object_get_image(object_id) or default_image
+        self._text.setText(model.object_get_name(object_id))
+        self._text.prepare(QtGui.QTransform(), self.font())
+        text_height = self._text.size().height()
+        width = self.image_size.width() + 2 * self.margin
+        height = self.image_size.height() + self.spacing + text_height + 2 * self.margin
+        if QtCore.QSizeF(width, height) != self._rect.size():
+            self.prepareGeometryChange()
+            self._rect = QtCore.QRectF(0, 0, width, height)
+            self._index()
+        self.update()
+
+    def _index(self):
+        scene = self.scene()
+        if scene is not None:
+            if self.isVisible():
+                rect = self.sceneBoundingRect()
+                scene.node_index.insert_box(self, rect.left(), rect.top(), rect.right(), rect.bottom())
+            else:
+                scene.node_index.discard(self)
+
+    def itemChange(self, change, value):
+        if change in (QtWidgets.QGraphicsItem.ItemPositionHasChanged, QtWidgets.QGraphicsItem.ItemSceneHasChanged,
+                      QtWidgets.QGraphicsItem.ItemVisibleHasChanged):
+            self._index()
+        elif change == QtWidgets.QGraphicsItem.ItemSceneChange and self.scene() is not None:
+            self.scene().node_index.discard(self)
+        return QtWidgets.QGraphicsItem.itemChange(self, change, value)
+
     def delete(self):
-        model.object_delete(self.widget().id)
+        model.object_delete(self.id)
 
-    def _connect(self, newedge, source_proxy, dest_proxy):
-        source_widget = source_proxy.widget()
-        dest_widget = dest_proxy.widget()
+    def _connect(self, newedge, source_node, dest_node):
         try:
-            model.edge_new(newedge.id, source_widget.id, dest_widget.id)
+            model.edge_new(newedge.id, source_node.id, dest_node.id)
         except model.RelationException as exception:
             QMessageBox.critical(None, "Error", exception.args[0])
 
     def _getTarget(self, event):
-        nodes = [n for n in self.scene().items(event.scenePos()) if isinstance(n, QNodeProxy)]
-        return nodes[0] if nodes else None
+        return self.scene().node_at(event.scenePos())
     
     def _focus(self):
         """Place the object in front of all others."""
@@ -343,17 +1215,15 @@ class QNodeProxy(QtWidgets.QGraphicsProxyWidget, event.Emitter):
 
     def select(self):
         self._focus()
-        self.widget().setLineWidth(2)
+        self._line_width = 2
+        self.update()
     
     def unselect(self):
-        self.widget().setLineWidth(0)
+        self._line_width = 0
+        self.update()
 
     def mousePressEvent(self, event):
-        global selectedEdge
-        global editor
-
         button = event.button()
-        mouse = event.pos()
         pos = self.scenePos()
         scene = event.scenePos()
 
@@ -373,7 +1243,6 @@ class QNodeProxy(QtWidgets.QGraphicsProxyWidget, event.Emitter):
 
     def mouseReleaseEvent(self, event):
         global newedge
-        global editor
 
         if newedge:
             target = self._getTarget(event)
@@ -388,8 +1257,6 @@ class QNodeProxy(QtWidgets.QGraphicsProxyWidget, event.Emitter):
         global newedge
 
         scene = event.scenePos()
-        mouse = event.pos()
-        pos = self.scenePos()
 
         if newedge:
             start = self.pos() + midpoint(self)
@@ -400,59 +1267,6 @@ class QNodeProxy(QtWidgets.QGraphicsProxyWidget, event.Emitter):
             self.emit("graphical_object_changed", self)
         event.accept()
 
-    def _object_changed(self, object_id):
-        pass
-
-    def object_changed(self, object_id):
-        self.widget().object_changed(object_id)
-
-class QNodeWidget(QtWidgets.QFrame, event.Emitter):
-    def __init__(self, object_id):
-        QtWidgets.QFrame.__init__(self)
-        #self.setMaximumWidth(300)
-        self.setFrameShape(QtWidgets.QFrame.Box)
-        self.setFrameShadow(QtWidgets.QFrame.Plain)
-        self.setAutoFillBackground(True)
-        self._layout = QtWidgets.QVBoxLayout(self)
-
-        self._pixmap = QtGui.QPixmap("./pic.jpg")
-        self._image = QtWidgets.QLabel()
-        #policy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
-        #self._image.setSizePolicy(policy)
-        self._image.setPixmap(self._pixmap)
-        self._image.setScaledContents(True)
-        #self._image.setMaximumHeight(200)
-        self._image.setMaximumWidth(300)
-        self._image.setMaximumHeight(200)
-        self._layout.addWidget(self._image)
-
-        self.id = object_id
-        self._text = QtWidgets.QLabel()
-        # label.setFrameStyle(QtWidgets.QFrame.StyledPanel | QtWidgets.QFrame.Plain)
-        font = self._text.font()
-        font.setPointSize(20)
-        self._text.setFont(font)
-        self._text.setWordWrap(True)
-        self._layout.addWidget(self._text)
-        self.object_changed(object_id)
-    
-    def __repr__(self):
-        return "{0}({1})".format(type(self).__name__, repr(self.id))
-
-    def object_changed(self, object_id):
-        # Set background color
-        palette = self.palette()
-        color = model.object_get_color(object_id)
-        bgcolor = QtGui.QColor(color.r, color.g, color.b)
-        palette.setColor(self.backgroundRole(), bgcolor)
-        self.setPalette(palette)
-
-        # Set label
-        object_name = model.object_get_name(object_id)
-        self._text.setText(object_name)
-
-        self.emit("object_changed", object_id)
-
 def midpoint(qgraphicsitem):
     r = qgraphicsitem.boundingRect()
     x = r.width() / 2
@@ -461,6 +1275,8 @@ def midpoint(qgraphicsitem):
     return p
 
 class QNodeView(QtWidgets.QGraphicsView):
+    edge_tolerance = 4  # how far from an edge a click picks it, in pixels
+
     def __init__(self, scene, edit):
         super().__init__(scene)
         self._edit = edit
@@ -522,17 +1338,23 @@ class QNodeView(QtWidgets.QGraphicsView):
             self.scale(1/1.1, 1/1.1)
 
     def mousePressEvent(self, event):
+        scene = self.scene()
+        point = self.mapToScene(event.pos())
+        node = scene.node_at(point)
+        if not node and event.button() == QtCore.Qt.LeftButton:
+            edge = scene.edge_near(point, self.edge_tolerance / self.transform().m11())
+            if edge:
+                self.set_selected_item(edge)
+                event.accept()
+                return
         super().mousePressEvent(event)
-        selected_item = self.get_selected_item()
-        if not self.itemAt(event.pos()) and selected_item:
+        if not node and self.get_selected_item():
             self.set_selected_item(no_selected_item)
 
 def make_graphical_object(object_id):
-    qnode = QNodeWidget(object_id)
-    proxy = QNodeProxy(qnode, object_id)
-    qnodes[object_id] = proxy
-    qnode.add_listener("object_changed", proxy._object_changed)
-    return proxy
+    qnode = QNode(object_id)
+    qnodes[object_id] = qnode
+    return qnode
 
 def make_object(class_id):
     object_id = model.object_new(class_id, source="view")
@@ -547,54 +1369,378 @@ def get_object(object_id):
 def get_edge(edge_id):
     return qedges[edge_id]
 
+class QSceneLoader(QtCore.QObject):
+    """Builds the canvas items of a whole document a slice at a time.
+
+    Each turn of the event loop builds items for at most `slice_ms`, nodes
+    before edges, so the window stays responsive while a large document
+    appears. The scene's own item index and the views' painting are
+    switched off until the loader finishes, as they would otherwise be
+    updated for every item added or slice built. Items not built yet are
+    pending, as are edges created meanwhile that join pending nodes; a
+    cancelled loader leaves them unbuilt until resume() is called."""
+    progress = QtCore.pyqtSignal(int, int)
+    finished = QtCore.pyqtSignal()
+    slice_ms = 15
+
+    def __init__(self, delegate, object_ids, edge_ids):
+        QtCore.QObject.__init__(self)
+        self._delegate = delegate
+        self._queue = [(False, object_id) for object_id in object_ids]
+        self._queue.extend((True, edge_id) for edge_id in edge_ids)
+        self._next = 0
+        self._pending_objects = {object_id for is_edge, object_id in self._queue if not is_edge}
+        self._pending_edges = {edge_id for is_edge, edge_id in self._queue if is_edge}
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._build_slice)
+
+    def start(self):
+        scene = self._delegate.scene
+        scene.setItemIndexMethod(QtWidgets.QGraphicsScene.NoIndex)
+        for view in scene.views():
+            view.viewport().setUpdatesEnabled(False)
+        self.progress.emit(self._next, len(self._queue))
+        self._timer.start()
+
+    def resume(self):
+        "Goes on building the items a cancelled loader left pending."
+        if not self._timer.isActive() and self.has_pending():
+            self.start()
+
+    def cancel(self):
+        if self._timer.isActive():
+            log.warn("Stopped loading the canvas: %d objects and %d edges are not shown",
+                     len(self._pending_objects), len(self._pending_edges))
+            self._finish()
+
+    def is_loading(self):
+        return self._timer.isActive()
+
+    def has_pending(self):
+        return bool(self._pending_objects or self._pending_edges)
+
+    def is_pending(self, object_id):
+        return object_id in self._pending_objects
+
+    def is_edge_pending(self, edge_id):
+        return edge_id in self._pending_edges
+
+    def add_edge(self, edge_id):
+        "Builds an edge created since the loader started after the nodes it joins."
+        self._queue.append((True, edge_id))
+        self._pending_edges.add(edge_id)
+
+    def discard(self, object_id):
+        self._pending_objects.discard(object_id)
+
+    def discard_edge(self, edge_id):
+        self._pending_edges.discard(edge_id)
+
+    def _build_slice(self):
+        deadline = time.perf_counter() + self.slice_ms / 1000
+        queue = self._queue
+        while self._next < len(queue) and time.perf_counter() < deadline:
+            for is_edge, entity_id in queue[self._next:self._next + 32]:
+                if is_edge:
+                    if entity_id in self._pending_edges:
+                        self._pending_edges.discard(entity_id)
+                        self._delegate.build_edge(entity_id)
+                elif entity_id in self._pending_objects:
+                    self._pending_objects.discard(entity_id)
+                    self._delegate.build_object(entity_id)
+            self._next = min(self._next + 32, len(queue))
+        self.progress.emit(self._next, len(queue))
+        if self._next == len(queue):
+            self._finish()
+
+    def _finish(self):
+        self._timer.stop()
+        scene = self._delegate.scene
+        scene.setItemIndexMethod(QtWidgets.QGraphicsScene.BspTreeIndex)
+        for view in scene.views():
+            view.viewport().setUpdatesEnabled(True)
+        self.finished.emit()
+
 class QNodeSceneDelegate(model.Delegate):
     def __init__(self, scene):
         model.Delegate.__init__(self)
         self.scene = scene
+        self.loader = None
     
     def reload(self, source):
-        for object_id in model.get_objects():
-            self.object_created(object_id, source)
-        for edge_id in model.get_edges():
-            self.edge_created(edge_id, source)
+        if self.loader:
+            self.loader.cancel()
+        self.clear()
+        self.loader = QSceneLoader(self, model.get_objects(), model.get_edges())
+        self.scene.loading.emit(self.loader)
+        self.loader.start()
+
+    def clear(self):
+        """Removes the items of the old document. Reading a document replaces
+        the graph without an event for each entity it deletes."""
+        global newedge
+        newedge = None
+        for view in self.scene.views():
+            view.set_selected_item(no_selected_item)
+        self.scene.clear()
+        qnodes.clear()
+        qedges.clear()
+
+    def _is_pending(self, object_id):
+        return self.loader is not None and self.loader.is_pending(object_id)
+
+    def _is_edge_pending(self, edge_id):
+        return self.loader is not None and self.loader.is_edge_pending(edge_id)
+
+    def build_object(self, object_id):
+        # TODO: Position in a suitable place
+        graphical_object = make_graphical_object(object_id)
+        graphical_object.setVisible(model.object_is_visible(object_id))
+        self.scene.addItem(graphical_object)
+
+    def build_edge(self, edge_id):
+        self.scene.add_edge(make_edge(edge_id))
     
     def object_created(self, object_id, source):
         if source == "model":
-            # TODO: Position in a suitable place
-            graphical_object = make_graphical_object(object_id)
-            graphical_object.setVisible(model.object_is_visible(object_id))
-            self.scene.addItem(graphical_object)
+            self.build_object(object_id)
 
     def object_deleted(self, object_id, source):
+        if self._is_pending(object_id):
+            self.loader.discard(object_id)
+            return
         object = get_object(object_id)
         self.scene.removeItem(object)
     
     def object_changed(self, object_id, source):
+        if self._is_pending(object_id):
+            return
         graphical_object = get_object(object_id)
         graphical_object.object_changed(object_id)
         is_visible = model.object_is_visible(object_id)
         graphical_object.setVisible(is_visible)
 
     def edge_created(self, edge_id, source):
-        if source == "model":
-            graphical_edge = make_edge(edge_id)
-            self.scene.addItem(graphical_edge)
+        if source != "model":
+            return
+        source_id = model.edge_get_source_object(edge_id)
+        destination_id = model.edge_get_destination_object(edge_id)
+        if self._is_pending(source_id) or self._is_pending(destination_id):
+            self.loader.add_edge(edge_id)
+        else:
+            self.build_edge(edge_id)
     
     def edge_changed(self, edge_id, source):
+        if self._is_edge_pending(edge_id):
+            return
         graphical_edge = get_edge(edge_id)
         is_visible = model.edge_is_visible(edge_id)
-        graphical_edge.setVisible(is_visible)
+        graphical_edge.set_visible(is_visible)
         color = model.edge_get_color(edge_id)
         graphical_edge.set_color(color)
 
     def edge_deleted(self, edge_id, source):
-        edge = get_edge(edge_id)
-        self.scene.removeItem(edge)
+        if self._is_edge_pending(edge_id):
+            self.loader.discard_edge(edge_id)
+            return
+        self.scene.remove_edge(get_edge(edge_id))
 
 class QNodeScene(QtWidgets.QGraphicsScene):
+    """The canvas. Qt's own item index serves painting; hit-testing uses
+    spatial indexes of the visible nodes' boxes and edges' lines, which
+    the items keep up to date as they move. Edges aren't items: each
+    relation's edges are drawn by one QEdgeBatch."""
+    loading = QtCore.pyqtSignal(object)  # emitted with the QSceneLoader of each reload
     def __init__(self):
         super().__init__()
+        self.node_index = spatial.Grid()
+        self.edge_index = spatial.Grid()
+        self.edge_batches = {}  # maps relation IDs to QEdgeBatch items
         model.add_delegate(QNodeSceneDelegate(self))
+        image_cache().loaded.connect(self.update)
+
+    def add_edge(self, edge):
+        batch = self.edge_batches.get(edge.relation_id)
+        if batch is None:
+            batch = self.edge_batches[edge.relation_id] = QEdgeBatch(edge.relation_id)
+            self.addItem(batch)
+        batch.edges.add(edge)
+        edge.attach(self, batch)
+
+    def remove_edge(self, edge):
+        edge.detach()
+        self.edge_index.discard(edge)
+        batch = self.edge_batches[edge.relation_id]
+        batch.hide_edge(edge)
+        batch.edges.discard(edge)
+        if not batch.edges:
+            edge_router().discard_batch(batch)
+            self.removeItem(batch)
+            del self.edge_batches[edge.relation_id]
+
+    def clear(self):
+        "Removes all the items and edges."
+        for batch in self.edge_batches.values():
+            edge_router().discard_batch(batch)
+            for edge in batch.edges:
+                edge.detach()
+        super().clear()
+        self.node_index = spatial.Grid()
+        self.edge_index = spatial.Grid()
+        self.edge_batches = {}
+
+    def node_at(self, point):
+        "Returns the topmost node at a point, or None."
+        nodes = self.node_index.at(point.x(), point.y())
+        return max(nodes, key=QNode.zValue) if nodes else None
+
+    def nodes_in(self, rect):
+        return self.node_index.in_rect(rect.left(), rect.top(), rect.right(), rect.bottom())
+
+    def edge_near(self, point, distance):
+        "Returns the edge nearest a point if it is within distance, or None."
+        nearest = self.edge_index.nearest(point.x(), point.y(), distance)
+        return nearest[0] if nearest else None
+
+class QEntityListModel(QtCore.QAbstractListModel):
+    """Classes or relations as rows of names, with check boxes showing
+    whether they are visible.
+
+    A dict maps IDs to rows, so events find their row without a search.
+    Names and visibility are read from the model only when a row is shown,
+    and checking a row sets the entity's visibility."""
+    def __init__(self, get_name, is_visible, set_visible):
+        QtCore.QAbstractListModel.__init__(self)
+        self._get_name = get_name
+        self._is_visible = is_visible
+        self._set_visible = set_visible
+        self._ids = []
+        self._rows = {}
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        entity_id = self._ids[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return self._get_name(entity_id)
+        if role == QtCore.Qt.CheckStateRole:
+            return QtCore.Qt.Checked if self._is_visible(entity_id) else QtCore.Qt.Unchecked
+        if role == QtCore.Qt.ItemDataRole.UserRole:
+            return entity_id
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if role != QtCore.Qt.CheckStateRole:
+            return False
+        entity_id = self._ids[index.row()]
+        is_checked = value == QtCore.Qt.Checked
+        if self._is_visible(entity_id) != is_checked:
+            self._set_visible(entity_id, is_checked)
+        return True
+
+    def flags(self, index):
+        return (QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable |
+                QtCore.Qt.ItemIsUserCheckable | QtCore.Qt.ItemIsDragEnabled)
+
+    def row(self, entity_id):
+        "Returns the row of an entity, or -1 if it isn't listed."
+        return self._rows.get(entity_id, -1)
+
+    def set_ids(self, entity_ids):
+        self.beginResetModel()
+        self._ids = list(entity_ids)
+        self._rows = {entity_id: row for row, entity_id in enumerate(self._ids)}
+        self.endResetModel()
+
+    def append(self, entity_ids):
+        "Adds the entities not listed yet at the end, as one insertion."
+        entity_ids = [entity_id for entity_id in dict.fromkeys(entity_ids) if entity_id not in self._rows]
+        if not entity_ids:
+            return
+        first = len(self._ids)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(entity_ids) - 1)
+        self._ids.extend(entity_ids)
+        self._rows.update((entity_id, row) for row, entity_id in enumerate(entity_ids, first))
+        self.endInsertRows()
+
+    def remove(self, entity_id):
+        row = self.row(entity_id)
+        if row < 0:
+            return
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self._ids[row]
+        del self._rows[entity_id]
+        for later_row in range(row, len(self._ids)):
+            self._rows[self._ids[later_row]] = later_row
+        self.endRemoveRows()
+
+    def update(self, entity_id):
+        row = self.row(entity_id)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+class QEntityList(QtWidgets.QListView):
+    """A list of classes or relations following the model's events.
+
+    Created entities are appended in one batch per event loop turn, so a
+    document generating thousands of them inserts rows once, and the last
+    one becomes current. Deleted entities are removed at once, before the
+    list could show them."""
+    def __init__(self, list_model, get_ids, edit):
+        QtWidgets.QListView.__init__(self)
+        self._model = list_model
+        self._get_ids = get_ids
+        self._edit = edit
+        self._created = {}
+        self.setModel(list_model)
+        self.setUniformItemSizes(True)
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._append_created)
+        self.clicked.connect(self._clicked)
+        self.reload()
+
+    def current_id(self):
+        "Returns the ID of the current entity, or None."
+        index = self.currentIndex()
+        return index.data(QtCore.Qt.ItemDataRole.UserRole) if index.isValid() else None
+
+    def count(self):
+        return self._model.rowCount() + len(self._created)
+
+    def reload(self):
+        "Lists the entities in the model again, making the last one current."
+        self._created = {}
+        entity_ids = self._get_ids()
+        self._model.set_ids(entity_ids)
+        if entity_ids:
+            self._select(entity_ids[-1])
+
+    def created(self, entity_id):
+        self._created[entity_id] = True
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def deleted(self, entity_id):
+        self._created.pop(entity_id, None)
+        self._model.remove(entity_id)
+
+    def changed(self, entity_id):
+        self._model.update(entity_id)
+
+    def _append_created(self):
+        created, self._created = list(self._created), {}
+        self._model.append(created)
+        if created:
+            self._select(created[-1])
+
+    def _select(self, entity_id):
+        self.setCurrentIndex(self._model.index(self._model.row(entity_id)))
+
+    def _clicked(self, index):
+        self._edit(index.data(QtCore.Qt.ItemDataRole.UserRole))
 
 class QClassListDelegate(model.Delegate):
     def __init__(self, class_list):
@@ -602,70 +1748,34 @@ class QClassListDelegate(model.Delegate):
         self.class_list = class_list
     
     def reload(self, source):
-        self.class_list.clear()
-        for class_id in model.get_classes():
-            self.class_created(class_id, source)
+        self.class_list.reload()
     
     def class_created(self, class_id, source):
-        class_name = model.class_get_name(class_id)
-        class_is_visible = model.class_is_visible(class_id)
-        item = QtWidgets.QListWidgetItem(class_name)
-        item.setData(QtCore.Qt.ItemDataRole.UserRole, class_id)
-        item.setCheckState(QtCore.Qt.Checked if class_is_visible else QtCore.Qt.Unchecked)
-        self.class_list.addItem(item)
-        self.class_list.setCurrentItem(item)
+        self.class_list.created(class_id)
     
     def class_deleted(self, class_id, source):
-        row = self.class_list._id_to_row(class_id)
-        self.class_list.takeItem(row)
+        self.class_list.deleted(class_id)
 
     def class_changed(self, class_id, source):
-        item = self.class_list._id_to_item(class_id)
-        class_name = model.class_get_name(class_id)
-        item.setText(class_name)
+        self.class_list.changed(class_id)
 
-class QClassList(QtWidgets.QListWidget):
+class QClassList(QEntityList):
     def __init__(self, edit):
-        QtWidgets.QListWidget.__init__(self)
+        list_model = QEntityListModel(model.class_get_name, model.class_is_visible, model.class_set_visible)
+        QEntityList.__init__(self, list_model, model.get_classes, edit)
         self.delegate = QClassListDelegate(self)
         model.add_delegate(self.delegate)
-        for class_id in model.get_classes():
-            self.delegate.class_created(class_id, "view")
-        self.clicked.connect(self._clicked)
-        self._edit = edit
         self.setDragEnabled(True)
         self.setDragDropMode(QtWidgets.QAbstractItemView.DragOnly)
-    
-    def _clicked(self, index):
-        item = self.item(index.row())
-        class_id = item.data(QtCore.Qt.ItemDataRole.UserRole)
-        class_is_visible = model.class_is_visible(class_id)
-        is_checked = item.checkState() == QtCore.Qt.Checked
-        if class_is_visible != is_checked:
-            model.class_set_visible(class_id, is_checked)
-        self._edit(class_id)
-    
-    def _id_to_item(self, member_id):
-        item = list(filter(
-            lambda item: item.data(QtCore.Qt.ItemDataRole.UserRole) == member_id,
-            [self.item(row) for row in range(self.count())]
-        ))[0]
-        return item
-    
-    def _id_to_row(self, member_id):
-        row = list(filter(
-            lambda row: self.item(row).data(QtCore.Qt.ItemDataRole.UserRole) == member_id,
-            range(self.count())
-        ))[0]
-        return row
 
     def closeEvent(self, event):
         model.remove_delegate(self.delegate)
 
     def startDrag(self, supportedActions):
-        item = self.currentItem()
+        class_id = self.current_id()
+        if class_id is None:
+            return
         mime_data = QtCore.QMimeData()
-        class_id = item.data(QtCore.Qt.ItemDataRole.UserRole)
         mime_data.setText(str(class_id))
         drag = QtGui.QDrag(self)
         drag.setMimeData(mime_data)
@@ -677,62 +1787,34 @@ class QRelationListDelegate(model.Delegate):
         self.relation_list = relation_list
     
     def reload(self, source):
-        self.relation_list.clear()
-        for relation_id in model.get_relations():
-            self.relation_created(relation_id, source)
+        self.relation_list.reload()
     
     def relation_created(self, relation_id, source):
-        relation_name = model.relation_get_name(relation_id)
-        relation_is_visible = model.relation_is_visible(relation_id)
-        item = QtWidgets.QListWidgetItem(relation_name)
-        item.setData(QtCore.Qt.ItemDataRole.UserRole, relation_id)
-        item.setCheckState(QtCore.Qt.Checked if relation_is_visible else QtCore.Qt.Unchecked)
-        self.relation_list.addItem(item)
-        self.relation_list.setCurrentItem(item)
+        self.relation_list.created(relation_id)
         set_active_relation(relation_id)
     
     def relation_deleted(self, relation_id, source):
-        row = self.relation_list._id_to_row(relation_id)
-        self.relation_list.takeItem(row)
+        self.relation_list.deleted(relation_id)
 
     def relation_changed(self, relation_id, source):
-        item = self.relation_list._id_to_item(relation_id)
-        relation_name = model.relation_get_name(relation_id)
-        item.setText(relation_name)
+        self.relation_list.changed(relation_id)
 
-class QRelationList(QtWidgets.QListWidget):
+class QRelationList(QEntityList):
     def __init__(self, edit):
-        super().__init__()
+        list_model = QEntityListModel(model.relation_get_name, model.relation_is_visible, model.relation_set_visible)
+        QEntityList.__init__(self, list_model, model.get_relations, edit)
         self.delegate = QRelationListDelegate(self)
         model.add_delegate(self.delegate)
-        for relation_id in model.get_relations():
-            self.delegate.relation_created(relation_id, "view")
-        self.clicked.connect(self._clicked)
-        self._edit = edit
+
+    def reload(self):
+        QEntityList.reload(self)
+        relation_id = self.current_id()
+        if relation_id is not None:
+            set_active_relation(relation_id)
 
     def _clicked(self, index):
-        item = self.item(index.row())
-        relation_id = item.data(QtCore.Qt.ItemDataRole.UserRole)
-        relation_is_visible = model.relation_is_visible(relation_id)
-        is_checked = item.checkState() == QtCore.Qt.Checked
-        if relation_is_visible != is_checked:
-            model.relation_set_visible(is_checked)
-        set_active_relation(relation_id)
-        self._edit(relation_id)
-    
-    def _id_to_item(self, member_id):
-        item = list(filter(
-            lambda item: item.data(QtCore.Qt.ItemDataRole.UserRole) == member_id,
-            [self.item(row) for row in range(self.count())]
-        ))[0]
-        return item
-    
-    def _id_to_row(self, member_id):
-        row = list(filter(
-            lambda row: self.item(row).data(QtCore.Qt.ItemDataRole.UserRole) == member_id,
-            range(self.count())
-        ))[0]
-        return row
+        set_active_relation(index.data(QtCore.Qt.ItemDataRole.UserRole))
+        QEntityList._clicked(self, index)
 
     def closeEvent(self, event):
         model.remove_delegate(self.delegate)
@@ -740,7 +1822,7 @@ class QRelationList(QtWidgets.QListWidget):
 class QCollectionPalette(QtWidgets.QWidget):
     def __init__(self, list_widget):
         QtWidgets.QWidget.__init__(self)
-        self._list: QListWidget = list_widget
+        self._list: QEntityList = list_widget
 
         button_layout = QHBoxLayout()
 
@@ -764,12 +1846,14 @@ class QCollectionPalette(QtWidgets.QWidget):
         self.on_add()
 
     def _on_del(self):
-        self.on_delete(self._list.currentItem())
+        entity_id = self._list.current_id()
+        if entity_id is not None:
+            self.on_delete(entity_id)
     
-    def on_add(self, item):
+    def on_add(self):
         pass
 
-    def on_delete(self, item):
+    def on_delete(self, entity_id):
         pass
 
 class QClassPalette(QCollectionPalette):
@@ -779,8 +1863,7 @@ class QClassPalette(QCollectionPalette):
     def on_add(self):
         class_id = model.class_new("Class {0}".format(self._list.count()))
     
-    def on_delete(self, item):
-        class_id = item.data(QtCore.Qt.ItemDataRole.UserRole)
+    def on_delete(self, class_id):
         model.class_delete(class_id)
 
 class QRelationPalette(QCollectionPalette):
@@ -790,8 +1873,7 @@ class QRelationPalette(QCollectionPalette):
     def on_add(self):
         relation_id = model.relation_new("relation {0}".format(self._list.count()))
     
-    def on_delete(self, item):
-        relation_id = item.data(QtCore.Qt.ItemDataRole.UserRole)
+    def on_delete(self, relation_id):
         model.relation_delete(relation_id)
 
 def make_log_dock():
@@ -804,19 +1886,35 @@ def make_log_dock():
     dock.setWidget(textbox)
     return dock
 
+class QLazyDock(QtWidgets.QDockWidget):
+    """A dock widget that builds its contents the first time it is shown.
+
+    Building is posted to the event loop so that showing the dock, e.g. with
+    the main window, doesn't wait for it."""
+    def __init__(self, title, make_widget):
+        QtWidgets.QDockWidget.__init__(self, title)
+        self._make_widget = make_widget
+        self.visibilityChanged.connect(self._on_visibility_changed)
+    
+    def _on_visibility_changed(self, is_visible):
+        if is_visible and self._make_widget:
+            QtCore.QTimer.singleShot(0, self.build)
+    
+    def build(self):
+        if self._make_widget:
+            make_widget = self._make_widget
+            self._make_widget = None
+            self.setWidget(make_widget())
+
 def make_class_dock(editor):
-    dock = QtWidgets.QDockWidget("Classes")
     def edit(class_id):
         class_editor = QClassEditor(class_id)
         editor.setWidget(class_editor)
-    dock.setWidget(QClassPalette(edit))
-    return dock
+    return QLazyDock("Classes", lambda: QClassPalette(edit))
 
 def make_relation_dock(editor):
-    dock = QtWidgets.QDockWidget("Relations")
     edit = lambda relation: editor.setWidget(QRelationEditor(relation))
-    dock.setWidget(QRelationPalette(edit))
-    return dock
+    return QLazyDock("Relations", lambda: QRelationPalette(edit))
 
 def make_object_dock(object_filter_id):
     filter_name = model.object_filter_get_name(object_filter_id)
@@ -826,6 +1924,65 @@ def make_object_dock(object_filter_id):
     dock.setWidget(list)
     return dock
 
+class QStatsTable(QtWidgets.QWidget):
+    """Shows the model instrumentation statistics, refreshed while visible."""
+    columns = ["Function", "Calls", "Total (ms)", "Mean (us)", "p95 (us)", "Max (us)"]
+
+    def __init__(self, interval_ms=1000):
+        QtWidgets.QWidget.__init__(self)
+        self._enabled = QtWidgets.QCheckBox("Record")
+        self._enabled.setChecked(model.is_instrumented())
+        self._enabled.stateChanged.connect(self._on_enabled_changed)
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self._on_reset)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self._enabled)
+        button_layout.addWidget(reset_button)
+        button_panel = QtWidgets.QWidget()
+        button_panel.setLayout(button_layout)
+
+        self._table = QtWidgets.QTableWidget(0, len(self.columns))
+        self._table.setHorizontalHeaderLabels(self.columns)
+        self._table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(button_panel)
+        layout.addWidget(self._table)
+        self.setLayout(layout)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start(interval_ms)
+
+    def _on_enabled_changed(self, state):
+        model.set_instrumented(bool(state))
+
+    def _on_reset(self):
+        model.reset_stats()
+        self.refresh()
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+        rows = sorted(model.stats().items(), key=lambda item: item[1]["total"], reverse=True)
+        self._table.setSortingEnabled(False)
+        self._table.setRowCount(len(rows))
+        for row, (name, s) in enumerate(rows):
+            values = [
+                name,
+                str(s["count"]),
+                "{0:.2f}".format(s["total"] * 1e3),
+                "{0:.1f}".format(s["mean"] * 1e6),
+                "{0:g}".format(s["p95"] * 1e6),
+                "{0:.1f}".format(s["max"] * 1e6),
+            ]
+            for column, value in enumerate(values):
+                self._table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+
+def make_stats_dock():
+    return QLazyDock("Statistics", QStatsTable)
+
 def make_tag_dock():
     model = QTagModel()
     view = QTagView(model)
@@ -849,19 +2006,34 @@ class QMainWindowDelegate(model.Delegate):
         self.window.remove_object_filter(id)
 
 class QMainWindow(QtWidgets.QMainWindow):
-    def __init__(self, title):
+    def __init__(self, title, demo=False, started_at=None):
         super().__init__()
         self._title = title
         self._filename = ""
+        self._started_at = started_at if started_at is not None else time.perf_counter()
+        self._painted = False
+        # Background tasks snapshot the model while the window edits it
+        model.set_concurrent(True)
 
         # set size to 70% of screen
         #self.resize(QtWidgets.QDesktopWidget().availableGeometry(self).size() * 0.7)
         self.setWindowTitle(title)
         scene = QNodeScene()
+        self._incremental_layout = QIncrementalLayout(scene)
+        self._opener = None
+        self._loader = None
+        self._load_progress = QtWidgets.QProgressBar()
+        cancel_load = QtWidgets.QPushButton("Cancel")
+        cancel_load.clicked.connect(self._cancel_loading)
+        self._load_widgets = (self._load_progress, cancel_load)
+        for widget in self._load_widgets:
+            self.statusBar().addPermanentWidget(widget)
+            widget.hide()
+        scene.loading.connect(self._on_loading)
         def edit_entity(graphical_object):
             if graphical_object == no_selected_item:
                 editor.setWidget(QtWidgets.QFrame())
-            elif type(graphical_object) == QNodeProxy:
+            elif type(graphical_object) == QNode:
                 object_id = graphical_object.id
                 editor.setWidget(QObjectEditor(object_id))
         view = QNodeView(scene, edit_entity)
@@ -873,6 +2045,9 @@ class QMainWindow(QtWidgets.QMainWindow):
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, make_class_dock(editor))
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, make_relation_dock(editor))
         self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, make_log_dock())
+        stats_dock = make_stats_dock()
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, stats_dock)
+        stats_dock.hide()
 
         self._toolbar = self.addToolBar("Task")
         self.add_button("&New Object", QtWidgets.QStyle.SP_FileIcon, self._on_button_click)
@@ -895,6 +2070,44 @@ class QMainWindow(QtWidgets.QMainWindow):
         open_file.triggered.connect(self._open_file)
         file_menu.addAction(open_file)
 
+        edit_menu = self.menuBar().addMenu("&Edit")
+        undo = QtWidgets.QAction("&Undo", self)
+        undo.setShortcut(QtGui.QKeySequence.Undo)
+        undo.triggered.connect(self._undo)
+        edit_menu.addAction(undo)
+        redo = QtWidgets.QAction("&Redo", self)
+        redo.setShortcut(QtGui.QKeySequence.Redo)
+        redo.triggered.connect(self._redo)
+        edit_menu.addAction(redo)
+
+        self._layout_task = None
+        layout_menu = self.menuBar().addMenu("&Layout")
+        force_layout = QtWidgets.QAction("&Force-Directed...", self)
+        force_layout.triggered.connect(self._force_layout)
+        layout_menu.addAction(force_layout)
+        layered_layout = QtWidgets.QAction("&Layered...", self)
+        layered_layout.triggered.connect(self._layered_layout)
+        layout_menu.addAction(layered_layout)
+        incremental_layout = QtWidgets.QAction("&Incremental", self)
+        incremental_layout.setCheckable(True)
+        incremental_layout.toggled.connect(self._set_incremental_layout)
+        layout_menu.addAction(incremental_layout)
+        stop_layout = QtWidgets.QAction("&Stop", self)
+        stop_layout.triggered.connect(self._stop_layout)
+        layout_menu.addAction(stop_layout)
+
+        view_menu = self.menuBar().addMenu("&View")
+        view_menu.addAction(stats_dock.toggleViewAction())
+        self._resume_loading_action = QtWidgets.QAction("&Resume Loading Canvas", self)
+        self._resume_loading_action.triggered.connect(self._resume_loading)
+        self._resume_loading_action.setEnabled(False)
+        view_menu.addAction(self._resume_loading_action)
+
+        if demo:
+            self._add_demo_entities()
+            model.clear_history()
+    
+    def _add_demo_entities(self):
         model.class_new("Tag")
         goal_class = model.class_new("Goal")
         model.class_new("Task")
@@ -909,10 +2122,87 @@ class QMainWindow(QtWidgets.QMainWindow):
         model.class_add_field(goal_class, "Baz", model.String, "Quux")
         model.class_add_field(goal_class, "Flufu", model.Float, 3.14)
     
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._painted:
+            self._painted = True
+            log.info("First paint %.0f ms after start", (time.perf_counter() - self._started_at) * 1e3)
+    
     def _new_file(self, is_checked):
         # TODO: Ask user if they want to save their work.
         model.reset()
     
+    def _undo(self, is_checked):
+        if not model.undo():
+            log.info("Nothing to undo")
+
+    def _redo(self, is_checked):
+        if not model.redo():
+            log.info("Nothing to redo")
+
+    def _force_layout(self, is_checked):
+        chooser = QRelationChooser("Springs", self)
+        if chooser.exec_() == QtWidgets.QDialog.Accepted:
+            self.start_layout(QForceLayoutTask(chooser.relation_ids()))
+
+    def _layered_layout(self, is_checked):
+        chooser = QRelationChooser("Hierarchies", self, model.relation_is_acyclic)
+        if chooser.exec_() == QtWidgets.QDialog.Accepted:
+            self.start_layout(QLayeredLayoutTask(chooser.relation_ids()))
+
+    def start_layout(self, task):
+        self._stop_layout(False)
+        self._layout_task = task
+        task.start()
+
+    def _on_loading(self, loader):
+        self._loader = loader
+        loader.progress.connect(self._on_load_progress)
+        loader.finished.connect(self._on_load_finished)
+        self._show_loading()
+
+    def _show_loading(self):
+        self._load_progress.setFormat("Loading canvas: %p%")
+        self._resume_loading_action.setEnabled(False)
+        for widget in self._load_widgets:
+            widget.show()
+
+    def _on_load_progress(self, done, total):
+        self._load_progress.setMaximum(max(1, total))
+        self._load_progress.setValue(done)
+
+    def _on_load_finished(self):
+        if self._loader and not self._loader.has_pending():
+            self._loader = None
+        self._resume_loading_action.setEnabled(self._loader is not None)
+        for widget in self._load_widgets:
+            widget.hide()
+
+    def _resume_loading(self, is_checked):
+        if self._loader and self._loader.has_pending():
+            self._show_loading()
+            self._loader.resume()
+
+    def _cancel_loading(self):
+        if self._opener:
+            self._opener.cancel()
+            self._opener = None
+            self._on_load_finished()
+        if self._loader and self._loader.is_loading():
+            self._loader.cancel()
+
+    def _set_incremental_layout(self, is_checked):
+        if is_checked:
+            model.add_delegate(self._incremental_layout)
+        else:
+            model.remove_delegate(self._incremental_layout)
+            self._incremental_layout.stop()
+
+    def _stop_layout(self, is_checked):
+        if self._layout_task:
+            self._layout_task.cancel()
+            self._layout_task = None
+
     def _save_file(self, is_checked):
         user_cancelled_save = True
         if not self._filename:
@@ -937,10 +2227,37 @@ class QMainWindow(QtWidgets.QMainWindow):
         filename, filename_filter = QtWidgets.QFileDialog.getOpenFileName(self)
         user_cancelled_open = not filename
         if not user_cancelled_open:
-            with open(filename) as fp:
-                model.read(fp)
-            self._filename = filename
-            self.setWindowTitle("{0} - {1}".format(self._filename, self._title))
+            self.open_file(filename)
+    
+    def open_file(self, filename):
+        "Reads a document in the background; the open one stays in use until it is ready."
+        if self._opener:
+            self._opener.cancel()
+        self._opener = QDocumentLoader(filename)
+        self._opener.progress.connect(self._on_open_progress)
+        self._opener.loaded.connect(self._on_opened)
+        self._opener.failed.connect(self._on_open_failed)
+        self._load_progress.setFormat("Opening: %p%")
+        self._load_progress.setValue(0)
+        for widget in self._load_widgets:
+            widget.show()
+        self._opener.start()
+
+    def _on_open_progress(self, done, total):
+        if self._opener is self.sender():
+            self._on_load_progress(done, total)
+
+    def _on_opened(self, graph):
+        filename = self._opener.filename
+        self._opener = None
+        self._stop_layout(False)
+        model.replace(graph)
+        self._filename = filename
+        self.setWindowTitle("{0} - {1}".format(self._filename, self._title))
+
+    def _on_open_failed(self):
+        self._opener = None
+        self._on_load_finished()
 
     def add_button(self, text, icontype, callback):
         icon = self.style().standardIcon(icontype)
@@ -1001,23 +2318,77 @@ class QColorWidget(QtWidgets.QPushButton):
         color = QColorDialog.getColor()
         self._set_color(color)
 
-class QLogger(object):
-    def __init__(self, textbox: QTextEdit):
+class QImageWidget(QtWidgets.QWidget):
+    "Picks an image file; None stands for the default image."
+    imageChanged = QtCore.pyqtSignal(object)
+    def __init__(self, image, default_text="Default"):
+        QtWidgets.QWidget.__init__(self)
+        self._default_text = default_text
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self._choose = QPushButton()
+        self._choose.clicked.connect(self._on_choose)
+        layout.addWidget(self._choose, 1)
+        clear = QPushButton("Clear")
+        clear.clicked.connect(lambda: self._set_image(None))
+        layout.addWidget(clear)
+        self.setLayout(layout)
+        self._image = image
+        self._choose.setText(os.path.basename(image) if image else default_text)
+
+    def _set_image(self, image):
+        self._image = image
+        self._choose.setText(os.path.basename(image) if image else self._default_text)
+        self.imageChanged.emit(image)
+
+    def _on_choose(self):
+        filename, filename_filter = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Image", os.path.dirname(self._image or ""), "Images (*.png *.jpg *.jpeg *.bmp *.gif)")
+        if filename:
+            self._set_image(filename)
+
+class QLogger(QtCore.QObject):
+    """Shows log messages in a text box.
+
+    Messages may be logged from any thread. They are queued in a bounded
+    ring buffer and appended to the text box in one batch per timer tick,
+    and the text box keeps at most `max_lines` lines."""
+    def __init__(self, textbox: QTextEdit, capacity=10000, max_lines=5000, interval_ms=100):
+        QtCore.QObject.__init__(self, textbox)
         self.textbox: QTextEdit = textbox
+        self.textbox.document().setMaximumBlockCount(max_lines)
+        self._buffer = log.LogBuffer(capacity)
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start(interval_ms)
     
-    def _write(self, message):
-        self.textbox.append(message)
+    def flush(self):
+        if not len(self._buffer):
+            return
+        entries, dropped = self._buffer.drain()
+        lines = ["{0}: {1}".format(level, message) for level, message in entries]
+        if dropped:
+            lines.insert(0, "WARN: {0} older messages were dropped".format(dropped))
+        self.textbox.append("\n".join(lines))
         scrollbar = self.textbox.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
     
+    def _append(self, level, message):
+        # Formatted now, so a bad format raises at the call site rather
+        # than in flush, and the arguments are shown as they were
+        self._buffer.append(level, str(message))
+
     def info(self, message):
-        self._write("INFO: {0}".format(message))
+        self._append("INFO", message)
     
     def warn(self, message):
-        self._write("WARN: {0}".format(message))
+        self._append("WARN", message)
     
     def error(self, message):
-        self._write("ERROR: {0}".format(message))
+        self._append("ERROR", message)
+    
+    def debug(self, message):
+        self._append("DEBUG", message)
 
 class QRelationEditor(QtWidgets.QFrame):
     def __init__(self, relation_id):
@@ -1219,6 +2590,10 @@ class QClassEditor(QtWidgets.QFrame):
         self._color.colorChanged.connect(self._on_color_changed)
         common_fields_layout.addRow("&Color", self._color)
 
+        self._image = QImageWidget(model.class_get_image(class_id))
+        self._image.imageChanged.connect(lambda image: model.class_set_image(class_id, image))
+        common_fields_layout.addRow("&Image", self._image)
+
         common_fields.setLayout(common_fields_layout)
         editor_layout.addWidget(common_fields)
         
@@ -1262,6 +2637,10 @@ class QObjectEditor(QtWidgets.QFrame):
         self._name.textChanged.connect(self._on_name_changed)
         self._layout.addRow("&Name", self._name)
 
+        self._image = QImageWidget(model.object_get_image(object_id), "Class Image")
+        self._image.imageChanged.connect(lambda image: model.object_set_image(object_id, image))
+        self._layout.addRow("&Image", self._image)
+
         # We need this function to capture the value (not the reference)
         # of member_id in the loop below. Otherwise, all of the fields will
         # modify the same member.